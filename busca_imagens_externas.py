@@ -0,0 +1,147 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao
+
+# Busca das imagens externas (src http/https) do HTML capturado: um único httpx.AsyncClient
+# compartilhado, rodando em um loop de eventos próprio numa thread de fundo, com pool de
+# conexões, limite de requisições simultâneas por host, timeouts e tamanho máximo de resposta.
+# As respostas com ETag/Last-Modified ficam em cache no disco e são revalidadas (304) depois:
+#   <IMAGENS_EXTERNAS_CACHE_DIR>/<sha256 da URL>.bin  (conteúdo)
+#   <IMAGENS_EXTERNAS_CACHE_DIR>/<sha256 da URL>.json (url, etag, last_modified)
+# limitado a IMAGENS_EXTERNAS_CACHE_MAX_MB (LRU pelo último acesso).
+IMAGENS_EXTERNAS_CACHE_DIR = os.environ.get("IMAGENS_EXTERNAS_CACHE_DIR", os.path.join("temp_uploads", "cache_imagens_externas"))
+IMAGENS_EXTERNAS_CACHE_MAX_MB = float(os.environ.get("IMAGENS_EXTERNAS_CACHE_MAX_MB", "256"))
+IMAGENS_EXTERNAS_TIMEOUT_S = float(os.environ.get("IMAGENS_EXTERNAS_TIMEOUT_S", "10"))
+# Tempo máximo de uma busca completa (espera pelo host + download), contra hosts que enviam aos poucos
+IMAGENS_EXTERNAS_TIMEOUT_TOTAL_S = float(os.environ.get("IMAGENS_EXTERNAS_TIMEOUT_TOTAL_S", "30"))
+IMAGENS_EXTERNAS_MAX_CONEXOES = int(os.environ.get("IMAGENS_EXTERNAS_MAX_CONEXOES", "32"))
+IMAGENS_EXTERNAS_POR_HOST = int(os.environ.get("IMAGENS_EXTERNAS_POR_HOST", "4"))
+IMAGENS_EXTERNAS_MAX_MB = float(os.environ.get("IMAGENS_EXTERNAS_MAX_MB", "20"))
+
+_loop = None
+_cliente = None
+_semaforos_por_host = {}
+_lock_inicio = threading.Lock()
+
+
+def _iniciar_loop() -> asyncio.AbstractEventLoop:
+    """Cria (uma vez por processo) o loop de fundo e o cliente HTTP compartilhado."""
+    global _loop, _cliente
+    with _lock_inicio:
+        if _loop is not None:
+            return _loop
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="imagens-externas", daemon=True).start()
+
+        async def _criar_cliente():
+            return httpx.AsyncClient(
+                timeout=httpx.Timeout(IMAGENS_EXTERNAS_TIMEOUT_S),
+                limits=httpx.Limits(
+                    max_connections=IMAGENS_EXTERNAS_MAX_CONEXOES,
+                    max_keepalive_connections=IMAGENS_EXTERNAS_MAX_CONEXOES,
+                ),
+                follow_redirects=True,
+            )
+        _cliente = asyncio.run_coroutine_threadsafe(_criar_cliente(), loop).result()
+        _loop = loop
+        return _loop
+
+
+def _caminhos_cache(url: str):
+    chave = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    base = os.path.join(IMAGENS_EXTERNAS_CACHE_DIR, chave)
+    return base + ".bin", base + ".json"
+
+
+def _ler_cache(url: str):
+    caminho_dados, caminho_meta = _caminhos_cache(url)
+    try:
+        with open(caminho_meta, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("url") != url or not os.path.isfile(caminho_dados):
+            return None, None
+        # Último acesso para a política LRU
+        os.utime(caminho_dados)
+        return meta, caminho_dados
+    except Exception:
+        return None, None
+
+
+def _gravar_cache(url: str, dados: bytes, etag: Optional[str], last_modified: Optional[str]) -> None:
+    caminho_dados, caminho_meta = _caminhos_cache(url)
+    try:
+        os.makedirs(IMAGENS_EXTERNAS_CACHE_DIR, exist_ok=True)
+        sufixo = f".tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(caminho_dados + sufixo, 'wb') as f:
+            f.write(dados)
+        os.replace(caminho_dados + sufixo, caminho_dados)
+        with open(caminho_meta + sufixo, 'w', encoding='utf-8') as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+        os.replace(caminho_meta + sufixo, caminho_meta)
+    except Exception as e:
+        print(f"[IMAGENS_EXTERNAS] Falha ao gravar cache de {url}: {e}")
+        return
+    aplicar_politica_de_expiracao()
+
+
+def aplicar_politica_de_expiracao() -> None:
+    """Acima de IMAGENS_EXTERNAS_CACHE_MAX_MB, remove as respostas (.bin e .json) usadas há mais tempo (LRU)."""
+    politica_de_expiracao(
+        IMAGENS_EXTERNAS_CACHE_DIR, IMAGENS_EXTERNAS_CACHE_MAX_MB * 1024 * 1024,
+        chave_da_entrada=lambda nome: os.path.splitext(nome)[0] if nome.endswith((".bin", ".json")) else None,
+    )
+
+
+async def _buscar(url: str) -> Optional[bytes]:
+    host = urlsplit(url).netloc.lower()
+    semaforo = _semaforos_por_host.get(host)
+    if semaforo is None:
+        semaforo = _semaforos_por_host[host] = asyncio.Semaphore(IMAGENS_EXTERNAS_POR_HOST)
+
+    meta, caminho_cache = await asyncio.to_thread(_ler_cache, url)
+    cabecalhos = {}
+    if meta:
+        if meta.get("etag"):
+            cabecalhos["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            cabecalhos["If-Modified-Since"] = meta["last_modified"]
+
+    limite = int(IMAGENS_EXTERNAS_MAX_MB * 1024 * 1024)
+    async with semaforo:
+        async with _cliente.stream("GET", url, headers=cabecalhos) as resposta:
+            if resposta.status_code == 304 and caminho_cache:
+                with open(caminho_cache, 'rb') as f:
+                    return f.read()
+            resposta.raise_for_status()
+            if int(resposta.headers.get("content-length") or 0) > limite:
+                raise ValueError(f"Resposta maior que o limite de {IMAGENS_EXTERNAS_MAX_MB} MB")
+            partes = []
+            recebido = 0
+            async for bloco in resposta.aiter_bytes():
+                recebido += len(bloco)
+                if recebido > limite:
+                    raise ValueError(f"Resposta maior que o limite de {IMAGENS_EXTERNAS_MAX_MB} MB")
+                partes.append(bloco)
+            etag = resposta.headers.get("etag")
+            last_modified = resposta.headers.get("last-modified")
+
+    dados = b"".join(partes)
+    if etag or last_modified:
+        await asyncio.to_thread(_gravar_cache, url, dados, etag, last_modified)
+    return dados
+
+
+def agendar_busca(url: str) -> concurrent.futures.Future:
+    """Agenda a busca da URL no cliente compartilhado; o resultado (bytes) vem pelo Future."""
+    loop = _iniciar_loop()
+    return asyncio.run_coroutine_threadsafe(asyncio.wait_for(_buscar(url), IMAGENS_EXTERNAS_TIMEOUT_TOTAL_S), loop)
+
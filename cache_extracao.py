@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Optional, Union
+
+from storage import upload_local_file, list_prefix, download_blob_to_file, blob_exists, delete_prefix
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao, flag_do_ambiente
+
+# Cache endereçado por conteúdo das Fases 1 e 2: a chave é o SHA-256 dos bytes do PDF.
+# Cada entrada guarda as imagens extraídas (com as cópias WebP), o imagens_info.json e o texto puro do PDF:
+#   <CACHE_EXTRACAO_DIR>/<sha256>/imagens/...
+#   <CACHE_EXTRACAO_DIR>/<sha256>/texto.txt
+#   <CACHE_EXTRACAO_DIR>/<sha256>/meta.json
+# e é espelhada no GCS em <CACHE_EXTRACAO_PREFIX>/<sha256>/...
+CACHE_EXTRACAO_ATIVO = flag_do_ambiente("CACHE_EXTRACAO_ATIVO", True)
+CACHE_EXTRACAO_DIR = os.environ.get("CACHE_EXTRACAO_DIR", os.path.join("temp_uploads", "cache_extracao"))
+CACHE_EXTRACAO_PREFIX = os.environ.get("CACHE_EXTRACAO_PREFIX", "cache/extracao").rstrip('/')
+CACHE_EXTRACAO_GCS = flag_do_ambiente("CACHE_EXTRACAO_GCS", True)
+# Política de expiração: idade máxima (TTL) e tamanho máximo do cache local (LRU por último acesso)
+CACHE_EXTRACAO_TTL_HORAS = float(os.environ.get("CACHE_EXTRACAO_TTL_HORAS", "72"))
+CACHE_EXTRACAO_MAX_MB = float(os.environ.get("CACHE_EXTRACAO_MAX_MB", "2048"))
+
+SUBPASTA_IMAGENS = "imagens"
+ARQUIVO_TEXTO = "texto.txt"
+ARQUIVO_META = "meta.json"
+
+
+def calcular_hash_pdf(caminho_pdf: Union[str, bytes, memoryview]) -> str:
+    """SHA-256 dos bytes do PDF (caminho lido em blocos, ou buffer já em memória)."""
+    if not isinstance(caminho_pdf, str):
+        return hashlib.sha256(caminho_pdf).hexdigest()
+    h = hashlib.sha256()
+    with open(caminho_pdf, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _pasta_entrada(pdf_hash: str) -> str:
+    return os.path.join(CACHE_EXTRACAO_DIR, pdf_hash)
+
+
+def _ler_meta(pasta: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(pasta, ARQUIVO_META), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _gravar_meta(pasta: str, meta: dict) -> None:
+    tmp_path = os.path.join(pasta, ARQUIVO_META + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(pasta, ARQUIVO_META))
+
+
+def _expirada(meta: dict) -> bool:
+    criado_em = meta.get("criado_em") or 0
+    return (time.time() - criado_em) > CACHE_EXTRACAO_TTL_HORAS * 3600
+
+
+def _baixar_do_gcs(pdf_hash: str, versao: str) -> bool:
+    """Traz uma entrada do GCS para o cache local. Retorna True se a entrada válida foi baixada."""
+    prefixo = f"{CACHE_EXTRACAO_PREFIX}/{pdf_hash}"
+    try:
+        if not blob_exists(f"{prefixo}/{ARQUIVO_META}"):
+            return False
+        pasta_tmp = f"{_pasta_entrada(pdf_hash)}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(pasta_tmp, ignore_errors=True)
+        for nome_blob, _ in list_prefix(prefixo):
+            relativo = nome_blob[len(prefixo) + 1:]
+            download_blob_to_file(nome_blob, os.path.join(pasta_tmp, *relativo.split('/')))
+        meta = _ler_meta(pasta_tmp)
+        if not meta or meta.get("versao") != versao or _expirada(meta):
+            shutil.rmtree(pasta_tmp, ignore_errors=True)
+            if meta and _expirada(meta):
+                delete_prefix(prefixo)
+            return False
+        os.makedirs(CACHE_EXTRACAO_DIR, exist_ok=True)
+        try:
+            os.rename(pasta_tmp, _pasta_entrada(pdf_hash))
+        except OSError:
+            # Outra requisição já materializou a mesma entrada
+            shutil.rmtree(pasta_tmp, ignore_errors=True)
+        return True
+    except Exception as e:
+        print(f"[CACHE] Falha ao consultar cache de extração no GCS ({pdf_hash[:12]}): {e}")
+        return False
+
+
+def restaurar_extracao(pdf_hash: str, caminho_pasta_imagens: str, caminho_texto_saida: str, versao: str) -> bool:
+    """
+    Restaura uma extração já feita para o mesmo PDF (mesmo SHA-256 e mesma versão do extrator).
+    Copia imagens, imagens_info.json (com 'caminho' reescrito para a pasta de destino) e texto.
+    Retorna True em caso de acerto no cache.
+    """
+    if not CACHE_EXTRACAO_ATIVO:
+        return False
+
+    pasta = _pasta_entrada(pdf_hash)
+    meta = _ler_meta(pasta)
+    if meta and (meta.get("versao") != versao or _expirada(meta)):
+        shutil.rmtree(pasta, ignore_errors=True)
+        meta = None
+    if not meta and CACHE_EXTRACAO_GCS and _baixar_do_gcs(pdf_hash, versao):
+        meta = _ler_meta(pasta)
+    if not meta:
+        return False
+
+    try:
+        os.makedirs(caminho_pasta_imagens, exist_ok=True)
+        pasta_imagens_cache = os.path.join(pasta, SUBPASTA_IMAGENS)
+        imagens_info = {}
+        for nome in os.listdir(pasta_imagens_cache):
+            origem = os.path.join(pasta_imagens_cache, nome)
+            if nome == 'imagens_info.json':
+                with open(origem, 'r', encoding='utf-8') as f:
+                    imagens_info = json.load(f)
+                continue
+            shutil.copyfile(origem, os.path.join(caminho_pasta_imagens, nome))
+
+        for nome_arquivo, info in imagens_info.items():
+            if isinstance(info, dict):
+                info['caminho'] = os.path.join(caminho_pasta_imagens, nome_arquivo)
+        with open(os.path.join(caminho_pasta_imagens, 'imagens_info.json'), 'w', encoding='utf-8') as f:
+            json.dump(imagens_info, f, ensure_ascii=False, indent=2)
+
+        if caminho_texto_saida:
+            shutil.copyfile(os.path.join(pasta, ARQUIVO_TEXTO), caminho_texto_saida)
+
+        meta["ultimo_acesso"] = time.time()
+        _gravar_meta(pasta, meta)
+        print(f"[CACHE] Extração restaurada do cache ({pdf_hash[:12]}): {len(imagens_info)} imagens")
+        return True
+    except Exception as e:
+        print(f"[CACHE] Entrada de cache inválida ({pdf_hash[:12]}), descartando: {e}")
+        shutil.rmtree(pasta, ignore_errors=True)
+        return False
+
+
+def _enviar_para_gcs(pdf_hash: str, pasta: str) -> None:
+    prefixo = f"{CACHE_EXTRACAO_PREFIX}/{pdf_hash}"
+    try:
+        arquivos = []
+        for raiz, _, nomes in os.walk(pasta):
+            for nome in nomes:
+                arquivos.append(os.path.join(raiz, nome))
+        # meta.json por último: sua presença no GCS marca a entrada como completa
+        arquivos.sort(key=lambda p: os.path.basename(p) == ARQUIVO_META)
+        for caminho in arquivos:
+            relativo = os.path.relpath(caminho, pasta).replace(os.sep, '/')
+            dest_prefix, _, dest_name = f"{prefixo}/{relativo}".rpartition('/')
+            upload_local_file(dest_prefix, caminho, dest_name=dest_name)
+        print(f"[CACHE] Entrada {pdf_hash[:12]} enviada para o GCS em {prefixo}/")
+    except Exception as e:
+        print(f"[CACHE] Falha ao enviar entrada {pdf_hash[:12]} para o GCS: {e}")
+
+
+def salvar_extracao(pdf_hash: str, caminho_pasta_imagens: str, caminho_texto: str, versao: str) -> None:
+    """
+    Registra a extração no cache local (de forma atômica) e dispara o envio ao GCS em segundo plano.
+    Falhas são apenas registradas: o cache nunca interrompe o pipeline.
+    """
+    if not CACHE_EXTRACAO_ATIVO:
+        return
+
+    pasta = _pasta_entrada(pdf_hash)
+    pasta_tmp = f"{pasta}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        shutil.rmtree(pasta_tmp, ignore_errors=True)
+        pasta_imagens_cache = os.path.join(pasta_tmp, SUBPASTA_IMAGENS)
+        os.makedirs(pasta_imagens_cache)
+
+        with open(os.path.join(caminho_pasta_imagens, 'imagens_info.json'), 'r', encoding='utf-8') as f:
+            imagens_info = json.load(f)
+        for nome_arquivo, info in imagens_info.items():
+            shutil.copyfile(os.path.join(caminho_pasta_imagens, nome_arquivo), os.path.join(pasta_imagens_cache, nome_arquivo))
+            # Cópia WebP da galeria (restaurada junto com as imagens)
+            nome_webp = info.get('webp') if isinstance(info, dict) else None
+            if nome_webp and os.path.isfile(os.path.join(caminho_pasta_imagens, nome_webp)):
+                shutil.copyfile(os.path.join(caminho_pasta_imagens, nome_webp), os.path.join(pasta_imagens_cache, nome_webp))
+        shutil.copyfile(os.path.join(caminho_pasta_imagens, 'imagens_info.json'), os.path.join(pasta_imagens_cache, 'imagens_info.json'))
+
+        if caminho_texto and os.path.exists(caminho_texto):
+            shutil.copyfile(caminho_texto, os.path.join(pasta_tmp, ARQUIVO_TEXTO))
+        else:
+            open(os.path.join(pasta_tmp, ARQUIVO_TEXTO), 'w', encoding='utf-8').close()
+
+        agora = time.time()
+        _gravar_meta(pasta_tmp, {
+            "pdf_hash": pdf_hash,
+            "versao": versao,
+            "criado_em": agora,
+            "ultimo_acesso": agora,
+            "imagens": len(imagens_info),
+        })
+
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.rename(pasta_tmp, pasta)
+        print(f"[CACHE] Extração registrada no cache ({pdf_hash[:12]}): {len(imagens_info)} imagens")
+    except Exception as e:
+        print(f"[CACHE] Falha ao registrar extração no cache ({pdf_hash[:12]}): {e}")
+        shutil.rmtree(pasta_tmp, ignore_errors=True)
+        return
+
+    if CACHE_EXTRACAO_GCS:
+        threading.Thread(target=_enviar_para_gcs, args=(pdf_hash, pasta), daemon=True).start()
+    aplicar_politica_de_expiracao()
+
+
+def aplicar_politica_de_expiracao() -> None:
+    """Remove entradas locais vencidas (TTL) ou inválidas e, acima do limite de tamanho, as menos usadas (LRU)."""
+    if not os.path.isdir(CACHE_EXTRACAO_DIR):
+        return
+    # O TTL conta da criação (meta.json); o último acesso é o mtime da pasta, atualizado
+    # a cada restauração pela regravação do meta.json
+    for nome in os.listdir(CACHE_EXTRACAO_DIR):
+        pasta = os.path.join(CACHE_EXTRACAO_DIR, nome)
+        if not os.path.isdir(pasta) or '.tmp-' in nome:
+            continue
+        meta = _ler_meta(pasta)
+        if not meta or _expirada(meta):
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    removidas = politica_de_expiracao(
+        CACHE_EXTRACAO_DIR, CACHE_EXTRACAO_MAX_MB * 1024 * 1024,
+        chave_da_entrada=lambda nome: nome if '.tmp-' not in nome and os.path.isdir(os.path.join(CACHE_EXTRACAO_DIR, nome)) else None,
+    )
+    for chave in removidas:
+        print(f"[CACHE] Entrada removida por limite de tamanho: {chave[:12]}")
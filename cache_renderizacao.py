@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from storage import upload_local_file, download_blob_to_file, blob_exists
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao, flag_do_ambiente
+
+# Cache dos PDFs finais: a chave é o SHA-256 do HTML do resumo normalizado, dos hashes de
+# conteúdo de cada imagem local referenciada e da versão da folha de estilos/montagem. Pedir o PDF
+# de novo sem mudar nada devolve o arquivo guardado, sem montar o HTML nem chamar o WeasyPrint.
+#   <CACHE_RENDER_DIR>/<chave>.pdf  (LRU local pelo último acesso)
+#   <CACHE_RENDER_PREFIX>/<chave>.pdf no GCS (segunda camada, compartilhada entre instâncias)
+CACHE_RENDER_ATIVO = flag_do_ambiente("CACHE_RENDER_ATIVO", True)
+CACHE_RENDER_DIR = os.environ.get("CACHE_RENDER_DIR", os.path.join("temp_uploads", "cache_render"))
+CACHE_RENDER_PREFIX = os.environ.get("CACHE_RENDER_PREFIX", "cache/render").rstrip('/')
+CACHE_RENDER_GCS = flag_do_ambiente("CACHE_RENDER_GCS", True)
+CACHE_RENDER_MAX_MB = float(os.environ.get("CACHE_RENDER_MAX_MB", "512"))
+CACHE_RENDER_HASHES_MAX = int(os.environ.get("CACHE_RENDER_HASHES_MAX", "4096"))
+
+# src das imagens extraídas, como o editor envia (/temp_uploads/imagens_extraidas/x.png?v=1)
+# ou já relativo (imagens_extraidas/x.png)
+_PADRAO_SRC_IMAGEM = re.compile(r'''(src\s*=\s*["'])(?:/temp_uploads/)?imagens_extraidas/([^"'?]+)(?:\?[^"']*)?(["'])''')
+# Qualquer src (capturas, uploads, imagens externas...), para incluir na chave o conteúdo dos locais
+_PADRAO_SRC = re.compile(r'''src\s*=\s*["']([^"']+)["']''', re.IGNORECASE)
+
+# Memoização do hash por (caminho, tamanho, mtime) para não reler as imagens a cada pedido,
+# limitada às CACHE_RENDER_HASHES_MAX entradas usadas mais recentemente
+_hashes_imagens = OrderedDict()
+_lock_hashes = threading.Lock()
+
+
+def _hash_arquivo(caminho: str) -> str:
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return "ausente"
+    chave = (caminho, st.st_size, st.st_mtime_ns)
+    with _lock_hashes:
+        if chave in _hashes_imagens:
+            _hashes_imagens.move_to_end(chave)
+            return _hashes_imagens[chave]
+    h = hashlib.sha256()
+    try:
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloco)
+    except OSError:
+        return "ausente"
+    with _lock_hashes:
+        _hashes_imagens[chave] = h.hexdigest()
+        while len(_hashes_imagens) > CACHE_RENDER_HASHES_MAX:
+            _hashes_imagens.popitem(last=False)
+    return h.hexdigest()
+
+
+def _caminho_local_do_src(src: str, upload_dir: str) -> Optional[str]:
+    """
+    Arquivo local de um src do resumo: /temp_uploads/<caminho> (servido de upload_dir) ou
+    caminho relativo a upload_dir, onde fica o HTML montado. None para URLs externas e data:.
+    """
+    src = src.split('?')[0].split('#')[0]
+    if src.startswith('/temp_uploads/'):
+        relativo = src[len('/temp_uploads/'):]
+    elif re.match(r'^[a-z][a-z0-9+.-]*:', src, re.IGNORECASE) or src.startswith('/'):
+        return None
+    else:
+        relativo = src
+    base = os.path.realpath(upload_dir)
+    caminho = os.path.realpath(os.path.join(base, *relativo.split('/')))
+    return caminho if caminho.startswith(base + os.sep) else None
+
+
+def normalizar_html(resumo_html: str) -> str:
+    """Remove variações que não mudam o PDF: quebras de linha CRLF, espaços nas pontas e querystrings dos src."""
+    html = resumo_html.replace('\r\n', '\n').strip()
+    return _PADRAO_SRC_IMAGEM.sub(r'\1imagens_extraidas/\2\3', html)
+
+
+def chave_renderizacao(resumo_html: str, upload_dir: str, versao_estilos: str) -> str:
+    """
+    Chave do PDF final: HTML normalizado + hash do conteúdo de cada imagem local referenciada
+    (extraídas, capturas, uploads...) + versão dos estilos. URLs externas entram só pelo texto.
+    """
+    html = normalizar_html(resumo_html)
+    h = hashlib.sha256(f"estilos:{versao_estilos}\n".encode('utf-8'))
+    h.update(html.encode('utf-8'))
+    for src in sorted({m.group(1) for m in _PADRAO_SRC.finditer(html)}):
+        if src.startswith('data:'):
+            continue  # o conteúdo já está no HTML
+        caminho = _caminho_local_do_src(src, upload_dir)
+        if caminho:
+            h.update(f"\nimg:{src}:{_hash_arquivo(caminho)}".encode('utf-8'))
+    return h.hexdigest()
+
+
+def _caminho_local(chave: str) -> str:
+    return os.path.join(CACHE_RENDER_DIR, chave + ".pdf")
+
+
+def obter_pdf_em_cache(chave: str) -> Optional[str]:
+    """Caminho local do PDF já renderizado para a chave (trazendo do GCS se preciso), ou None."""
+    if not CACHE_RENDER_ATIVO:
+        return None
+    caminho = _caminho_local(chave)
+    if os.path.isfile(caminho):
+        # Último acesso para a política LRU
+        os.utime(caminho)
+        print(f"[CACHE_RENDER] Acerto local ({chave[:12]})")
+        return caminho
+    if not CACHE_RENDER_GCS:
+        return None
+    try:
+        nome_blob = f"{CACHE_RENDER_PREFIX}/{chave}.pdf"
+        if not blob_exists(nome_blob):
+            return None
+        os.makedirs(CACHE_RENDER_DIR, exist_ok=True)
+        caminho_tmp = f"{caminho}.tmp-{os.getpid()}-{threading.get_ident()}"
+        download_blob_to_file(nome_blob, caminho_tmp)
+        os.replace(caminho_tmp, caminho)
+        print(f"[CACHE_RENDER] Acerto no GCS ({chave[:12]})")
+        return caminho
+    except Exception as e:
+        print(f"[CACHE_RENDER] Falha ao consultar cache de PDFs no GCS ({chave[:12]}): {e}")
+        return None
+
+
+def _enviar_para_gcs(chave: str, caminho: str) -> None:
+    try:
+        upload_local_file(CACHE_RENDER_PREFIX, caminho, dest_name=f"{chave}.pdf")
+    except Exception as e:
+        print(f"[CACHE_RENDER] Falha ao enviar PDF {chave[:12]} para o GCS: {e}")
+
+
+def salvar_pdf_em_cache(chave: str, caminho_pdf: str) -> None:
+    """Guarda o PDF renderizado no cache local e, em segundo plano, no GCS. Falhas são apenas registradas."""
+    if not CACHE_RENDER_ATIVO:
+        return
+    caminho = _caminho_local(chave)
+    try:
+        os.makedirs(CACHE_RENDER_DIR, exist_ok=True)
+        caminho_tmp = f"{caminho}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.copyfile(caminho_pdf, caminho_tmp)
+        os.replace(caminho_tmp, caminho)
+    except Exception as e:
+        print(f"[CACHE_RENDER] Falha ao guardar PDF no cache ({chave[:12]}): {e}")
+        return
+    if CACHE_RENDER_GCS:
+        threading.Thread(target=_enviar_para_gcs, args=(chave, caminho), daemon=True).start()
+    aplicar_politica_de_expiracao()
+
+
+def aplicar_politica_de_expiracao() -> None:
+    """Acima de CACHE_RENDER_MAX_MB, remove os PDFs locais acessados há mais tempo (LRU)."""
+    removidos = politica_de_expiracao(
+        CACHE_RENDER_DIR, CACHE_RENDER_MAX_MB * 1024 * 1024,
+        chave_da_entrada=lambda nome: nome if nome.endswith(".pdf") else None,
+    )
+    for nome in removidos:
+        print(f"[CACHE_RENDER] PDF removido por limite de tamanho: {nome[:12]}")
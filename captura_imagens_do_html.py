@@ -1,18 +1,131 @@
 from bs4 import BeautifulSoup
 import os
-import requests
 import re
 import base64
 import hashlib # Necessário para gerar hashes das imagens
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from busca_imagens_externas import agendar_busca
+from utilitarios import flag_do_ambiente
+from deduplicacao_perceptual import DEDUP_PERCEPTUAL_ATIVO, IndicePerceptual, formatar_dhash
+from conteudo_imagem import analisar_imagem, recortar_imagem
+from formatos_imagem import (
+    LIMITES_DIMENSAO_PADRAO,
+    LimitesDimensao,
+    converter_para_png,
+    dimensoes_de_base64,
+    dimensoes_do_cabecalho,
+    extensao_nativa,
+    gravar_derivado_webp,
+    motivo_descarte_por_dimensoes,
+    nome_derivado_webp,
+)
+
+try:
+    import xxhash  # Opcional: digest não criptográfico mais rápido para a deduplicação
+except ImportError:
+    xxhash = None
 
 # O diretório onde as imagens serão salvas
 OUTPUT_IMAGES_DIR = "imagens_extraidas"
 
+# Limite mínimo de relevância (imagens menores são logotipos, linhas etc.), usado apenas
+# quando as dimensões da imagem não podem ser lidas do cabeçalho (ver formatos_imagem.py)
+MIN_SIZE_BYTES = 7500
+
+# Decodificação base64, hash e gravação em um pool de threads (hashlib e I/O liberam o GIL).
+# Os resultados são consolidados na ordem do documento, então numeração e duplicatas não mudam.
+CAPTURA_HTML_WORKERS = int(os.environ.get("CAPTURA_HTML_WORKERS", "0") or 0) or min(8, os.cpu_count() or 1)
+# Com "1", a deduplicação usa xxh3-128 (ou BLAKE2b-128 sem o pacote xxhash) em vez do SHA-256;
+# o SHA-256 do arquivo gravado continua no campo 'hash' das imagens salvas.
+CAPTURA_HTML_DIGEST_RAPIDO = flag_do_ambiente("CAPTURA_HTML_DIGEST_RAPIDO", False)
+
 
-def capturar_imagens_do_corpo_html(caminho_html: str, caminho_imagens_destino: str):
+def _digest_deduplicacao(img_data: bytes) -> str:
+    if not CAPTURA_HTML_DIGEST_RAPIDO:
+        return hashlib.sha256(img_data).hexdigest()
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(img_data)
+    return hashlib.blake2b(img_data, digest_size=16).hexdigest()
+
+
+def _obter_dados_imagem(src: str, busca_externa=None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO):
+    """
+    Executado no pool: obtém os bytes da imagem (base64 ou, para URLs, o resultado da busca
+    já agendada no cliente HTTP compartilhado), o digest de deduplicação, o motivo do
+    descarte (ou None) e a análise do conteúdo (dHash, recorte, dimensões e LQIP).
+    Imagens irrelevantes pelas dimensões do cabeçalho são descartadas antes da decodificação
+    completa e dos hashes; as uniformes ou quase em branco, pela análise do conteúdo.
+    """
+    img_data = None
+    dimensoes = None
+    if src.startswith('data:image'):
+        # A. Imagem embutida em Base64 (o cabeçalho é lido decodificando só o início)
+        try:
+            header, encoded = src.split(',', 1)
+        except ValueError:
+            return None, None, None, None
+        dimensoes = dimensoes_de_base64(encoded)
+        if dimensoes:
+            motivo = motivo_descarte_por_dimensoes(*dimensoes, limites)
+            if motivo:
+                return None, None, motivo, None
+        try:
+            img_data = base64.b64decode(encoded)
+        except Exception:
+            return None, None, None, None
+    elif busca_externa is not None:
+        # B. Imagem externa (apenas para completude)
+        try:
+            img_data = busca_externa.result()
+        except Exception as e:
+            print(f"   ⚠️ Falha ao buscar imagem externa {src[:80]}: {e}")
+            return None, None, None, None
+    if not img_data:
+        return None, None, None, None
+    if dimensoes is None:
+        dimensoes = dimensoes_do_cabecalho(img_data)
+        motivo = motivo_descarte_por_dimensoes(*dimensoes, limites) if dimensoes else None
+        if motivo:
+            return None, None, motivo, None
+    if dimensoes is None and len(img_data) < MIN_SIZE_BYTES:
+        return None, None, f"Tamanho {len(img_data)}B é muito pequeno para ser um diagrama (min: 7.500 bytes)", None
+    analise = analisar_imagem(img_data)
+    if analise.motivo_descarte:
+        return None, None, analise.motivo_descarte, None
+    return img_data, _digest_deduplicacao(img_data), None, analise
+
+
+def _gravar_imagem(caminho_saida: str, img_data: bytes, sha256: str = None, converter: bool = False, recorte=None):
+    """
+    Executado no pool: grava a imagem (convertida para PNG se não for JPEG/PNG e sem as
+    bordas uniformes, se houver recorte) e a cópia WebP da galeria. Devolve o SHA-256 do
+    arquivo gravado, o do conteúdo original se for diferente (ou None) e o nome da cópia
+    WebP, ou None. sha256 é o hash do original, se já calculado.
+    """
+    original = img_data
+    if converter:
+        img_data = converter_para_png(img_data) or img_data
+    if recorte:
+        img_data = recortar_imagem(img_data, recorte)
+    with open(caminho_saida, 'wb') as f:
+        f.write(img_data)
+    nome_webp = nome_derivado_webp(os.path.basename(caminho_saida))
+    if not gravar_derivado_webp(img_data, os.path.join(os.path.dirname(caminho_saida), nome_webp)):
+        nome_webp = None
+    if img_data is original:
+        return sha256 or hashlib.sha256(img_data).hexdigest(), None, nome_webp
+    return hashlib.sha256(img_data).hexdigest(), sha256 or hashlib.sha256(original).hexdigest(), nome_webp
+
+
+def capturar_imagens_do_corpo_html(caminho_html: str, caminho_imagens_destino: str, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO):
     """
     Filtra o corpo da página HTML e captura todas as imagens, 
     ignorando duplicatas baseadas no conteúdo (hash binário).
+    Decodificação, hash e gravação rodam em paralelo (CAPTURA_HTML_WORKERS), com a
+    consolidação feita na ordem do documento. Imagens pequenas ou finas demais (limites)
+    são descartadas pelo cabeçalho, antes de decodificar.
     Retorna um dicionário com informações das imagens incluindo página de origem.
     """
     print("\n--- FASE B & C: Filtragem do Corpo e Captura de Imagens ---")
@@ -42,76 +155,88 @@ def capturar_imagens_do_corpo_html(caminho_html: str, caminho_imagens_destino: s
 
     # Variável para rastrear o total de imagens encontradas (para a mensagem final)
     total_imagens_encontradas = 0
+    gravacoes = []  # (nome_arquivo, futuro que devolve o SHA-256 e a cópia WebP)
 
-    # 1. Iterar sobre todas as tags de imagem
-    for i, img in enumerate(body.find_all('img')):
-        src = img.get('src')
-        page_number = img.get('data-page-number', 'Desconhecida')  # Extrair número da página
-        if not src:
-            continue
-        
-        total_imagens_encontradas += 1
-        img_data = None 
-
-        # 2. Lógica de Captura (Obtém os dados binários)
-        if src.startswith('data:image'):
-            # A. Imagem embutida em Base64
-            try:
-                header, encoded = src.split(',', 1)
-                img_data = base64.b64decode(encoded)
-            except Exception:
-                continue
-            
-        elif src.startswith(('http', 'https')):
-            # B. Imagem externa (apenas para completude)
-            try:
-                img_data = requests.get(src).content
-            except Exception:
-                continue
+    indice_perceptual = IndicePerceptual()
+
+    def _consolidar(i, page_number, img_data, img_hash, motivo_descarte, analise):
+        """Decide, na ordem do documento, se a imagem é única e agenda a gravação no pool."""
+        nonlocal contador_imagens_unicas
+        # --- FILTRO DE RELEVÂNCIA (DIMENSÕES, TAMANHO MÍNIMO OU CONTEÚDO UNIFORME) ---
+        if motivo_descarte:
+            print(f"   ℹ️ Imagem {i+1} ignorada: {motivo_descarte}.")
+            return
+        if not img_data:
+            return
+        dhash = analise.dhash
 
         # --- FILTRO DE DUPLICATAS POR HASH ---
-        if img_data:
-            # 3. Gerar o Hash do Conteúdo Binário
-            img_hash = hashlib.sha256(img_data).hexdigest()
-            
-            if img_hash in hashes_salvos:
-                # SE O HASH EXISTE, ESTA IMAGEM É UMA DUPLICATA E É IGNORADA.
-                print(f"   ℹ️ Imagem {i+1} ignorada: Duplicata (Hash: {img_hash[:6]}).")
+        if img_hash in hashes_salvos:
+            # SE O HASH EXISTE, ESTA IMAGEM É UMA DUPLICATA E É IGNORADA.
+            print(f"   ℹ️ Imagem {i+1} ignorada: Duplicata (Hash: {img_hash[:6]}).")
+            return
+
+        # --- FILTRO DE QUASE DUPLICATAS (MESMA FIGURA RECODIFICADA) ---
+        if DEDUP_PERCEPTUAL_ATIVO and dhash is not None:
+            similar = indice_perceptual.mais_proximo(dhash)
+            if similar:
+                print(f"   ℹ️ Imagem {i+1} ignorada: Quase duplicata de {similar[0]} (distância {similar[1]}).")
+                return
+
+        # --- SE CHEGOU AQUI, A IMAGEM É ÚNICA ---
+        hashes_salvos.add(img_hash)
+        contador_imagens_unicas += 1
+
+        # Salvar com um nome sequencial baseado apenas nas imagens ÚNICAS (JPEG e PNG
+        # mantêm a codificação original; outros formatos são convertidos para PNG)
+        extensao = extensao_nativa(img_data)
+        nome_arquivo = f"img_{contador_imagens_unicas}{extensao or '.png'}"
+        caminho_saida = os.path.join(caminho_imagens_destino, nome_arquivo)
+        sha256 = None if CAPTURA_HTML_DIGEST_RAPIDO else img_hash
+        if dhash is not None:
+            indice_perceptual.adicionar(dhash, nome_arquivo)
+        gravacoes.append((nome_arquivo, executor.submit(_gravar_imagem, caminho_saida, img_data, sha256, extensao is None, analise.recorte)))
+
+        # Armazenar informações da imagem incluindo página (hash e WebP preenchidos após a gravação)
+        imagens_info[nome_arquivo] = {
+            'caminho': caminho_saida,
+            'pagina': page_number,
+            'hash': None,
+            'hash_origem': None,
+            'phash': formatar_dhash(dhash),
+            'webp': None,
+            'largura': analise.largura,
+            'altura': analise.altura,
+            'lqip': analise.lqip
+        }
+        imagens_salvas.append(caminho_saida)
+        print(f"   ✅ Imagem única salva como: {nome_arquivo} (Página {page_number})")
+
+    # 1. Iterar sobre todas as tags de imagem; a decodificação roda no pool com uma janela
+    # limitada de imagens em voo (memória constante) e é consumida na ordem do documento
+    janela = CAPTURA_HTML_WORKERS * 4
+    pendentes = deque()
+    with ThreadPoolExecutor(max_workers=CAPTURA_HTML_WORKERS, thread_name_prefix="captura-html") as executor:
+        for i, img in enumerate(body.find_all('img')):
+            src = img.get('src')
+            page_number = img.get('data-page-number', 'Desconhecida')  # Extrair número da página
+            if not src:
                 continue
-            
-            # --- NOVO FILTRO DE TAMANHO MÍNIMO (RELEVÂNCIA) ---
-            # Define o limite mínimo (ex: 5 KB). Imagens pequenas (logotipos, linhas) serão descartadas.
-            MIN_SIZE_BYTES = 7500 
-            
-            if len(img_data) < MIN_SIZE_BYTES:
-                 print(f"   ℹ️ Imagem {i+1} ignorada: Tamanho {len(img_data)}B é muito pequeno para ser um diagrama (min: 7.500 bytes).")
-                 # O HASH não é adicionado, permitindo que a próxima ocorrência (se for maior) seja verificada.
-                 continue
-            
-            # --- SE CHEGOU AQUI, A IMAGEM É ÚNICA ---
-            
-            # 4. Adiciona o hash ao conjunto (garantindo que futuras cópias sejam ignoradas)
-            hashes_salvos.add(img_hash)
-            
-            # 5. Incrementa o contador de imagens ÚNICAS
-            contador_imagens_unicas += 1
-
-            # 6. Salvar o arquivo com um nome sequencial baseado apenas nas imagens ÚNICAS
-            nome_arquivo = f"img_{contador_imagens_unicas}.png"
-            caminho_saida = os.path.join(caminho_imagens_destino, nome_arquivo)
-
-            with open(caminho_saida, 'wb') as f:
-                f.write(img_data)
-            
-            # 7. Armazenar informações da imagem incluindo página
-            imagens_info[nome_arquivo] = {
-                'caminho': caminho_saida,
-                'pagina': page_number,
-                'hash': img_hash
-            }
-            
-            imagens_salvas.append(caminho_saida)
-            print(f"   ✅ Imagem única salva como: {nome_arquivo} (Página {page_number})")
+            total_imagens_encontradas += 1
+            # URLs externas começam a ser buscadas já, em paralelo, pelo cliente HTTP compartilhado
+            busca_externa = agendar_busca(src) if src.startswith(('http', 'https')) else None
+            pendentes.append((i, page_number, executor.submit(_obter_dados_imagem, src, busca_externa, limites)))
+            if len(pendentes) >= janela:
+                i_ant, pagina_ant, futuro = pendentes.popleft()
+                _consolidar(i_ant, pagina_ant, *futuro.result())
+
+        while pendentes:
+            i_ant, pagina_ant, futuro = pendentes.popleft()
+            _consolidar(i_ant, pagina_ant, *futuro.result())
+
+        for nome_arquivo, futuro in gravacoes:
+            info = imagens_info[nome_arquivo]
+            info['hash'], info['hash_origem'], info['webp'] = futuro.result()
 
     print(f"✅ Captura concluída. {len(imagens_salvas)} imagens únicas salvas em {caminho_imagens_destino}")
     print(f"   Foram encontradas e descartadas {total_imagens_encontradas - len(imagens_salvas)} imagens repetidas (incluindo a primeira cópia).")
@@ -0,0 +1,497 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union
+import fitz
+
+from deduplicacao_perceptual import DEDUP_PERCEPTUAL_ATIVO, IndicePerceptual, formatar_dhash
+from conteudo_imagem import analisar_imagem, recortar_imagem
+from formatos_imagem import LIMITES_DIMENSAO_PADRAO, LimitesDimensao, gravar_derivado_webp, motivo_descarte_por_dimensoes, nome_derivado_webp
+
+# Configuração do modo paralelo (processos independentes, cada um com seu fitz.open)
+EXTRACAO_WORKERS = int(os.environ.get("EXTRACAO_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+EXTRACAO_PAGINAS_POR_BLOCO = int(os.environ.get("EXTRACAO_PAGINAS_POR_BLOCO", "16") or 16)
+# O imagens_info.json é regravado inteiro: durante a extração, só a cada tantas páginas ou
+# segundos (o que vier primeiro) com imagens novas, e no fim. O progresso por página continua
+# em paginas_prontas.json e nos eventos com as imagens novas.
+IMAGENS_INFO_LOTE_PAGINAS = int(os.environ.get("IMAGENS_INFO_LOTE_PAGINAS", "16"))
+IMAGENS_INFO_LOTE_S = float(os.environ.get("IMAGENS_INFO_LOTE_S", "2"))
+
+
+def abrir_pdf(fonte_pdf: Union[str, bytes, memoryview]) -> fitz.Document:
+    """
+    Abre o PDF a partir de um caminho ou de um buffer em memória (bytes, ou memoryview
+    sobre um mmap do upload), sem cópia intermediária em disco.
+    """
+    if isinstance(fonte_pdf, str):
+        return fitz.open(fonte_pdf)
+    return fitz.open(stream=fonte_pdf, filetype="pdf")
+
+
+def _pixmap_rgb(pix: fitz.Pixmap) -> fitz.Pixmap:
+    # CMYK e outros espaços de cor sem suporte no PNG/navegador
+    if pix.colorspace and pix.colorspace.n > 3:
+        return fitz.Pixmap(fitz.csRGB, pix)
+    return pix
+
+
+def _extrair_bytes_imagem(doc: fitz.Document, xref: int, smask: int):
+    """
+    Obtém os bytes da imagem diretamente do xref do PDF, sem passar por base64, e a
+    extensão com que deve ser gravada. JPEG e PNG são mantidos na codificação original;
+    os demais formatos (JPX, JBIG2...) e os JPEG CMYK são convertidos a partir do pixmap.
+    Imagens com máscara de transparência (smask) são recompostas em PNG para
+    manter o mesmo resultado visual da saída XHTML.
+    """
+    if smask:
+        try:
+            pix = fitz.Pixmap(fitz.Pixmap(doc, xref), fitz.Pixmap(doc, smask))
+            return pix.tobytes("png"), ".png"
+        except Exception:
+            pass  # Se a recomposição falhar, usa a imagem base
+    info = doc.extract_image(xref)
+    if not info:
+        return None, None
+    ext = info.get("ext")
+    if ext == "png":
+        return info.get("image"), ".png"
+    if ext == "jpeg" and info.get("colorspace", 3) <= 3:
+        return info.get("image"), ".jpg"
+    pix = _pixmap_rgb(fitz.Pixmap(doc, xref))
+    if ext == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=90), ".jpg"
+    return pix.tobytes("png"), ".png"
+
+
+def _salvar_imagens_info(caminho_imagens_destino: str, imagens_info: dict) -> str:
+    """Grava o imagens_info.json de forma atômica (a galeria pode lê-lo durante a extração)."""
+    info_file_path = os.path.join(caminho_imagens_destino, 'imagens_info.json')
+    tmp_path = info_file_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(imagens_info, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, info_file_path)
+    return info_file_path
+
+
+class _GravacaoEmLotes:
+    """
+    Agenda as gravações do imagens_info.json (ver IMAGENS_INFO_LOTE_PAGINAS). Ao fim das
+    paginas_iniciais primeiras páginas também grava: o restante pode seguir em segundo plano
+    e a galeria já lista essas páginas.
+    """
+
+    def __init__(self, caminho_imagens_destino: str, imagens_info: dict, paginas_iniciais: int = 0):
+        self.caminho_imagens_destino = caminho_imagens_destino
+        self.imagens_info = imagens_info
+        self.paginas_iniciais = paginas_iniciais
+        self.pendente = False
+        self.paginas = 0
+        self.ultima = time.monotonic()
+
+    def pagina_concluida(self, pagina: int, novas_imagens: list) -> None:
+        self.pendente = self.pendente or bool(novas_imagens)
+        self.paginas += 1
+        if self.pendente and (self.paginas >= IMAGENS_INFO_LOTE_PAGINAS or pagina == self.paginas_iniciais
+                              or time.monotonic() - self.ultima >= IMAGENS_INFO_LOTE_S):
+            self.gravar()
+
+    def gravar(self) -> str:
+        self.pendente = False
+        self.paginas = 0
+        self.ultima = time.monotonic()
+        return _salvar_imagens_info(self.caminho_imagens_destino, self.imagens_info)
+
+
+def _retangulos_por_xref(page: fitz.Page) -> dict:
+    """Retângulos (em pontos PDF) onde cada xref de imagem é exibido na página, em uma única leitura."""
+    retangulos = {}
+    for info in page.get_image_info(xrefs=True):
+        if info.get("xref"):
+            retangulos.setdefault(info["xref"], []).append([round(v, 2) for v in info["bbox"]])
+    return retangulos
+
+
+def _registrar_ocorrencia(info_imagem: dict, pagina: int, rects: list) -> None:
+    """Acrescenta a página (e os retângulos) às ocorrências de uma imagem deduplicada."""
+    ocorrencias = info_imagem.setdefault('ocorrencias', [])
+    if ocorrencias and ocorrencias[-1]['pagina'] == pagina:
+        ocorrencias[-1]['rects'].extend(r for r in rects if r not in ocorrencias[-1]['rects'])
+    else:
+        ocorrencias.append({'pagina': pagina, 'rects': list(rects)})
+
+
+def iterar_paginas_pdf(caminho_pdf: Union[str, bytes, memoryview], caminho_imagens_destino: str, pdf_hash: Optional[str] = None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO, paginas_iniciais: int = 0):
+    """
+    Gerador que processa o PDF página a página: cada página é carregada uma única vez,
+    o texto é devolvido ao consumidor e as imagens (lidas direto dos xrefs) são gravadas
+    imediatamente, com o imagens_info.json atualizado em lotes de páginas (IMAGENS_INFO_LOTE_*)
+    e ao fim das paginas_iniciais primeiras páginas.
+    Xrefs já vistos são ignorados antes de qualquer decodificação e as duplicatas por
+    conteúdo continuam sendo filtradas pelo hash. caminho_pdf pode ser um caminho ou um buffer;
+    o documento vem do pool de documentos abertos (pdf_hash evita recalcular o SHA-256) e
+    só a leitura de cada página roda sob pool_documentos.lock_fitz; a análise e a gravação
+    das imagens ficam fora do lock. Cada imagem registra em 'ocorrencias' todas as páginas onde aparece, com os retângulos
+    de exibição, para o visualizador navegar até a origem sem varrer as páginas.
+    Imagens pequenas ou finas demais (limites) são descartadas pela largura/altura do xref,
+    antes de extrair os bytes.
+
+    Produz, para cada página, um dicionário:
+        {"pagina": int, "total_paginas": int, "texto": str, "novas_imagens": [nome_arquivo, ...]}
+    """
+    if not os.path.exists(caminho_imagens_destino):
+        os.makedirs(caminho_imagens_destino)
+
+    from pool_documentos import emprestar_documento, lock_fitz
+
+    imagens_info = {}
+    xrefs_vistos = set()
+    nome_por_xref = {}
+    nome_por_hash = {}
+    indice_perceptual = IndicePerceptual()
+    contador_imagens_unicas = 0
+    total_imagens_encontradas = 0
+    gravacao = _GravacaoEmLotes(caminho_imagens_destino, imagens_info, paginas_iniciais)
+
+    with emprestar_documento(caminho_pdf, pdf_hash, travar=False) as doc:
+        with lock_fitz:
+            total_paginas = doc.page_count
+        for page_num in range(total_paginas):
+            # Tudo que depende do fitz nesta página: texto, retângulos e bytes dos xrefs novos
+            with lock_fitz:
+                page = doc.load_page(page_num)
+                texto_pagina = page.get_text()
+                retangulos = _retangulos_por_xref(page)
+                referencias = page.get_images(full=True)
+                extraidas = {}
+                for img in referencias:
+                    xref, smask = img[0], img[1]
+                    if xref in xrefs_vistos or xref in extraidas or motivo_descarte_por_dimensoes(img[2], img[3], limites):
+                        continue
+                    try:
+                        extraidas[xref] = _extrair_bytes_imagem(doc, xref, smask)
+                    except Exception as e:
+                        extraidas[xref] = e
+                # Liberar a página antes de seguir para a próxima (memória constante)
+                del page
+            novas_imagens = []
+
+            for img in referencias:
+                xref = img[0]
+                total_imagens_encontradas += 1
+
+                # Mesmo xref referenciado novamente (ex.: logotipo em todas as páginas)
+                if xref in xrefs_vistos:
+                    if xref in nome_por_xref:
+                        _registrar_ocorrencia(imagens_info[nome_por_xref[xref]], page_num + 1, retangulos.get(xref, []))
+                    continue
+                xrefs_vistos.add(xref)
+
+                motivo = motivo_descarte_por_dimensoes(img[2], img[3], limites)
+                if motivo:
+                    print(f"   ℹ️ Imagem xref {xref} ignorada: {motivo}.")
+                    continue
+
+                extraida = extraidas.get(xref)
+                if isinstance(extraida, Exception):
+                    print(f"   ⚠️ Falha ao extrair xref {xref} (Página {page_num + 1}): {extraida}")
+                    continue
+                img_data, extensao = extraida
+                if not img_data:
+                    continue
+
+                img_hash = hashlib.sha256(img_data).hexdigest()
+                if img_hash in nome_por_hash:
+                    print(f"   ℹ️ Imagem xref {xref} ignorada: Duplicata (Hash: {img_hash[:6]}).")
+                    nome_por_xref[xref] = nome_por_hash[img_hash]
+                    _registrar_ocorrencia(imagens_info[nome_por_hash[img_hash]], page_num + 1, retangulos.get(xref, []))
+                    continue
+
+                # Fundos sólidos, separadores e imagens quase em branco
+                analise = analisar_imagem(img_data)
+                if analise.motivo_descarte:
+                    print(f"   ℹ️ Imagem xref {xref} ignorada: {analise.motivo_descarte}.")
+                    continue
+
+                # Mesma figura recodificada (outro tamanho/formato): quase duplicata pelo dHash
+                dhash = analise.dhash
+                similar = indice_perceptual.mais_proximo(dhash) if DEDUP_PERCEPTUAL_ATIVO and dhash is not None else None
+                if similar:
+                    print(f"   ℹ️ Imagem xref {xref} ignorada: Quase duplicata de {similar[0]} (distância {similar[1]}).")
+                    nome_por_xref[xref] = nome_por_hash[img_hash] = similar[0]
+                    _registrar_ocorrencia(imagens_info[similar[0]], page_num + 1, retangulos.get(xref, []))
+                    continue
+
+                contador_imagens_unicas += 1
+
+                nome_arquivo = f"img_{contador_imagens_unicas}{extensao}"
+                if dhash is not None:
+                    indice_perceptual.adicionar(dhash, nome_arquivo)
+                caminho_saida = os.path.join(caminho_imagens_destino, nome_arquivo)
+                # 'hash' descreve o arquivo gravado; o do conteúdo no PDF fica em 'hash_origem'
+                hash_arquivo = img_hash
+                if analise.recorte:
+                    img_data = recortar_imagem(img_data, analise.recorte)
+                    hash_arquivo = hashlib.sha256(img_data).hexdigest()
+                with open(caminho_saida, 'wb') as f:
+                    f.write(img_data)
+                nome_webp = nome_derivado_webp(nome_arquivo)
+                tem_webp = gravar_derivado_webp(img_data, os.path.join(caminho_imagens_destino, nome_webp))
+
+                imagens_info[nome_arquivo] = {
+                    'caminho': caminho_saida,
+                    'pagina': str(page_num + 1),
+                    'hash': hash_arquivo,
+                    'hash_origem': img_hash if hash_arquivo != img_hash else None,
+                    'phash': formatar_dhash(dhash),
+                    'webp': nome_webp if tem_webp else None,
+                    'largura': analise.largura,
+                    'altura': analise.altura,
+                    'lqip': analise.lqip
+                }
+                nome_por_xref[xref] = nome_por_hash[img_hash] = nome_arquivo
+                _registrar_ocorrencia(imagens_info[nome_arquivo], page_num + 1, retangulos.get(xref, []))
+                novas_imagens.append(nome_arquivo)
+                print(f"   ✅ Imagem única salva como: {nome_arquivo} (Página {page_num + 1})")
+
+            gravacao.pagina_concluida(page_num + 1, novas_imagens)
+            yield {
+                "pagina": page_num + 1,
+                "total_paginas": total_paginas,
+                "texto": texto_pagina,
+                "novas_imagens": novas_imagens,
+            }
+
+        info_file_path = gravacao.gravar()
+        print(f"✅ Captura concluída. {contador_imagens_unicas} imagens únicas salvas em {caminho_imagens_destino}")
+        print(f"   Foram encontradas e descartadas {total_imagens_encontradas - contador_imagens_unicas} referências de imagens repetidas ou irrelevantes.")
+        print(f"   📄 Informações das imagens salvas em: {info_file_path}")
+
+
+# Documento aberto uma única vez por processo do pool (ver _inicializar_worker)
+_doc_worker = None
+
+
+def _inicializar_worker(fonte_pdf):
+    global _doc_worker
+    _doc_worker = abrir_pdf(fonte_pdf)
+
+
+def _extrair_bloco_de_paginas(inicio: int, fim: int, pasta_parcial: str, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO):
+    """
+    Executado em um processo do pool (com o documento já aberto por _inicializar_worker):
+    extrai texto e imagens candidatas das páginas [inicio, fim). As imagens são gravadas em
+    pasta_parcial com nomes provisórios; numeração e deduplicação globais ficam a cargo do
+    processo principal.
+    """
+    doc = _doc_worker
+    hash_por_xref = {}  # None para xrefs descartados (falha na extração ou tamanho mínimo)
+    hashes_vistos = set()
+    hashes_descartados = set()  # Uniformes / quase em branco
+    paginas = []
+    for page_num in range(inicio, fim):
+        page = doc.load_page(page_num)
+        retangulos = _retangulos_por_xref(page)
+        candidatas = []
+        referencias = []
+        total_referencias = 0
+        for img in page.get_images(full=True):
+            xref, smask = img[0], img[1]
+            total_referencias += 1
+            if xref in hash_por_xref:
+                referencias.append({"xref": xref, "hash": hash_por_xref[xref], "rects": retangulos.get(xref, [])})
+                continue
+            hash_por_xref[xref] = None
+            if motivo_descarte_por_dimensoes(img[2], img[3], limites):
+                continue
+            try:
+                img_data, extensao = _extrair_bytes_imagem(doc, xref, smask)
+            except Exception as e:
+                print(f"   ⚠️ Falha ao extrair xref {xref} (Página {page_num + 1}): {e}")
+                continue
+            if not img_data:
+                continue
+            img_hash = hashlib.sha256(img_data).hexdigest()
+            if img_hash in hashes_descartados:
+                continue
+            analise = None
+            if img_hash not in hashes_vistos:
+                analise = analisar_imagem(img_data)
+                if analise.motivo_descarte:
+                    hashes_descartados.add(img_hash)
+                    continue
+            hash_por_xref[xref] = img_hash
+            referencias.append({"xref": xref, "hash": img_hash, "rects": retangulos.get(xref, [])})
+            # Duplicata dentro do próprio bloco: a primeira ocorrência (página anterior) prevalece
+            if analise is None:
+                continue
+            hashes_vistos.add(img_hash)
+
+            hash_arquivo = img_hash
+            if analise.recorte:
+                img_data = recortar_imagem(img_data, analise.recorte)
+                hash_arquivo = hashlib.sha256(img_data).hexdigest()
+            arquivo_parcial = os.path.join(pasta_parcial, f"p{page_num + 1}_x{xref}.bin")
+            with open(arquivo_parcial, 'wb') as f:
+                f.write(img_data)
+            arquivo_webp = arquivo_parcial + ".webp"
+            if not gravar_derivado_webp(img_data, arquivo_webp):
+                arquivo_webp = None
+            candidatas.append({"xref": xref, "hash": img_hash, "hash_arquivo": hash_arquivo, "arquivo": arquivo_parcial, "extensao": extensao,
+                               "webp": arquivo_webp, "phash": analise.dhash,
+                               "largura": analise.largura, "altura": analise.altura, "lqip": analise.lqip})
+        paginas.append({
+            "pagina": page_num + 1,
+            "texto": page.get_text(),
+            "candidatas": candidatas,
+            "referencias": referencias,
+            "total_referencias": total_referencias,
+        })
+        del page
+    return paginas
+
+
+def _descartar_candidata(candidata: dict) -> None:
+    os.remove(candidata["arquivo"])
+    if candidata["webp"]:
+        os.remove(candidata["webp"])
+
+
+def iterar_paginas_pdf_paralelo(caminho_pdf: Union[str, bytes, memoryview], caminho_imagens_destino: str, workers: int = None, paginas_por_bloco: int = None, pdf_hash: Optional[str] = None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO, paginas_iniciais: int = 0):
+    """
+    Versão multi-processo de iterar_paginas_pdf: divide o intervalo de páginas em blocos
+    (paginas_por_bloco) distribuídos entre `workers` processos. Os resultados são consolidados
+    na ordem das páginas, de modo que a numeração img_N e a deduplicação (xref e hash) são
+    idênticas às do modo sequencial. Produz os mesmos eventos por página.
+    Buffers em memória são enviados uma vez a cada processo (memoryview não é serializável).
+    """
+    workers = max(1, int(workers or EXTRACAO_WORKERS))
+    paginas_por_bloco = max(1, int(paginas_por_bloco or EXTRACAO_PAGINAS_POR_BLOCO))
+
+    if not os.path.exists(caminho_imagens_destino):
+        os.makedirs(caminho_imagens_destino)
+
+    from pool_documentos import emprestar_documento
+
+    # Os processos do pool têm o próprio fitz; aqui só a contagem de páginas, sob lock_fitz
+    with emprestar_documento(caminho_pdf, pdf_hash) as doc:
+        total_paginas = doc.page_count
+    if isinstance(caminho_pdf, memoryview):
+        caminho_pdf = caminho_pdf.tobytes()
+
+    pasta_parcial = os.path.join(caminho_imagens_destino, f".parcial_{os.getpid()}")
+    os.makedirs(pasta_parcial, exist_ok=True)
+
+    imagens_info = {}
+    xrefs_vistos = set()
+    nome_por_xref = {}
+    nome_por_hash = {}
+    indice_perceptual = IndicePerceptual()
+    contador_imagens_unicas = 0
+    total_imagens_encontradas = 0
+    gravacao = _GravacaoEmLotes(caminho_imagens_destino, imagens_info, paginas_iniciais)
+
+    print(f"--- Extração paralela: {total_paginas} páginas, {workers} processos, blocos de {paginas_por_bloco} páginas ---")
+    # "spawn" evita herdar threads/locks do servidor (uvicorn) via fork
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_inicializar_worker,
+        initargs=(caminho_pdf,),
+    )
+    try:
+        futuros = [
+            executor.submit(_extrair_bloco_de_paginas, inicio, min(inicio + paginas_por_bloco, total_paginas), pasta_parcial, limites)
+            for inicio in range(0, total_paginas, paginas_por_bloco)
+        ]
+        # Consumir na ordem de submissão = ordem das páginas
+        for futuro in futuros:
+            for resultado in futuro.result():
+                pagina = resultado["pagina"]
+                total_imagens_encontradas += resultado["total_referencias"]
+                novas_imagens = []
+                for candidata in resultado["candidatas"]:
+                    xref, img_hash = candidata["xref"], candidata["hash"]
+                    if xref in xrefs_vistos or img_hash in nome_por_hash:
+                        _descartar_candidata(candidata)
+                        if xref not in nome_por_xref and img_hash in nome_por_hash:
+                            nome_por_xref[xref] = nome_por_hash[img_hash]
+                        continue
+                    xrefs_vistos.add(xref)
+                    dhash = candidata["phash"]
+                    similar = indice_perceptual.mais_proximo(dhash) if DEDUP_PERCEPTUAL_ATIVO and dhash is not None else None
+                    if similar:
+                        _descartar_candidata(candidata)
+                        nome_por_xref[xref] = nome_por_hash[img_hash] = similar[0]
+                        continue
+                    contador_imagens_unicas += 1
+
+                    nome_arquivo = f"img_{contador_imagens_unicas}{candidata['extensao']}"
+                    if dhash is not None:
+                        indice_perceptual.adicionar(dhash, nome_arquivo)
+                    caminho_saida = os.path.join(caminho_imagens_destino, nome_arquivo)
+                    os.replace(candidata["arquivo"], caminho_saida)
+                    nome_webp = None
+                    if candidata["webp"]:
+                        nome_webp = nome_derivado_webp(nome_arquivo)
+                        os.replace(candidata["webp"], os.path.join(caminho_imagens_destino, nome_webp))
+                    imagens_info[nome_arquivo] = {
+                        'caminho': caminho_saida,
+                        'pagina': str(pagina),
+                        'hash': candidata["hash_arquivo"],
+                        'hash_origem': img_hash if candidata["hash_arquivo"] != img_hash else None,
+                        'phash': formatar_dhash(dhash),
+                        'webp': nome_webp,
+                        'largura': candidata["largura"],
+                        'altura': candidata["altura"],
+                        'lqip': candidata["lqip"]
+                    }
+                    nome_por_xref[xref] = nome_por_hash[img_hash] = nome_arquivo
+                    novas_imagens.append(nome_arquivo)
+
+                # Ocorrências na ordem das referências da página, como no modo sequencial
+                for referencia in resultado["referencias"]:
+                    nome = nome_por_xref.get(referencia["xref"]) or nome_por_hash.get(referencia["hash"])
+                    if nome:
+                        _registrar_ocorrencia(imagens_info[nome], pagina, referencia["rects"])
+
+                gravacao.pagina_concluida(pagina, novas_imagens)
+                yield {
+                    "pagina": pagina,
+                    "total_paginas": total_paginas,
+                    "texto": resultado["texto"],
+                    "novas_imagens": novas_imagens,
+                }
+
+        info_file_path = gravacao.gravar()
+        print(f"✅ Captura paralela concluída. {contador_imagens_unicas} imagens únicas salvas em {caminho_imagens_destino}")
+        print(f"   Foram encontradas e descartadas {total_imagens_encontradas - contador_imagens_unicas} referências de imagens repetidas ou irrelevantes.")
+        print(f"   📄 Informações das imagens salvas em: {info_file_path}")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(pasta_parcial, ignore_errors=True)
+
+
+def capturar_imagens_do_pdf(caminho_pdf: Union[str, bytes, memoryview], caminho_imagens_destino: str, paralelo: bool = False, pdf_hash: Optional[str] = None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO):
+    """
+    Extrai as imagens percorrendo os xrefs de cada página (page.get_images()),
+    sem gerar o HTML intermediário. Gera o mesmo imagens_info.json (caminho, pagina, hash,
+    dimensões e LQIP) da captura via HTML. Com paralelo=True, usa iterar_paginas_pdf_paralelo.
+    Retorna uma tupla: (sucesso, texto_extraido_do_pdf)
+    """
+    print("--- FASE A/B/C: Extraindo texto e imagens diretamente do PDF (xref) ---")
+
+    iterador = iterar_paginas_pdf_paralelo if paralelo else iterar_paginas_pdf
+    partes_texto = []
+    try:
+        for evento in iterador(caminho_pdf, caminho_imagens_destino, pdf_hash=pdf_hash, limites=limites):
+            partes_texto.append(evento["texto"])
+    except Exception as e:
+        print(f"❌ Erro na extração das imagens do PDF: {e}")
+        return False, None
+
+    texto_pdf_completo = "\n".join(partes_texto)
+    return True, texto_pdf_completo.strip()
@@ -0,0 +1,166 @@
+import io
+import os
+import base64
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, JpegImagePlugin
+
+from deduplicacao_perceptual import dhash_de_imagem
+from utilitarios import flag_do_ambiente
+
+# Análise do conteúdo das imagens antes de gravá-las, sobre uma cópia reduzida em tons de
+# cinza (vetorizada com NumPy): descarta fundos sólidos, separadores e digitalizações quase
+# em branco (desvio padrão, entropia e fração de pixels com conteúdo) e recorta as bordas
+# uniformes. A mesma cópia reduzida fornece o dHash da deduplicação perceptual e o LQIP
+# (miniatura de poucas centenas de bytes, em data URI) que a galeria exibe enquanto carrega.
+CONTEUDO_UNIFORME_ATIVO = flag_do_ambiente("CONTEUDO_UNIFORME_ATIVO", True)
+# Desvio padrão mínimo dos tons de cinza (0 a 255)
+CONTEUDO_DESVIO_MIN = float(os.environ.get("CONTEUDO_DESVIO_MIN", "3"))
+# Entropia mínima (em bits) do histograma de 32 faixas
+CONTEUDO_ENTROPIA_MIN = float(os.environ.get("CONTEUDO_ENTROPIA_MIN", "0.05"))
+# Fração mínima de pixels diferentes do fundo (imagem "quase em branco" abaixo disso)
+CONTEUDO_FRACAO_MIN = float(os.environ.get("CONTEUDO_FRACAO_MIN", "0.003"))
+# Diferença (em tons de cinza) a partir da qual um pixel não é considerado fundo
+CONTEUDO_TOLERANCIA_FUNDO = int(os.environ.get("CONTEUDO_TOLERANCIA_FUNDO", "12"))
+RECORTE_BORDAS_ATIVO = flag_do_ambiente("RECORTE_BORDAS_ATIVO", True)
+# Só recorta se as bordas uniformes ocuparem pelo menos esta fração da área
+RECORTE_BORDAS_FRACAO_MIN = float(os.environ.get("RECORTE_BORDAS_FRACAO_MIN", "0.1"))
+# JPEG recortado precisa ser recodificado (com as tabelas de quantização originais e o corte
+# alinhado aos blocos de 16 px, a perda é mínima, mas existe): só vale com bordas maiores
+RECORTE_BORDAS_JPEG_FRACAO_MIN = float(os.environ.get("RECORTE_BORDAS_JPEG_FRACAO_MIN", "0.4"))
+IMAGENS_LQIP_ATIVO = flag_do_ambiente("IMAGENS_LQIP_ATIVO", True)
+# Maior lado (em pixels) da miniatura LQIP
+IMAGENS_LQIP_LADO = int(os.environ.get("IMAGENS_LQIP_LADO", "16"))
+
+_LADO_ANALISE = 256
+# Maior MCU de um JPEG (subamostragem 4:2:0): cortes alinhados preservam os blocos DCT
+_BLOCO_JPEG = 16
+
+
+class AnaliseImagem(NamedTuple):
+    motivo_descarte: Optional[str]
+    dhash: Optional[int] = None
+    recorte: Optional[Tuple[int, int, int, int]] = None  # (esquerda, topo, direita, base) na imagem original
+    largura: Optional[int] = None  # Dimensões finais (após o recorte)
+    altura: Optional[int] = None
+    lqip: Optional[str] = None  # data:image/webp;base64,...
+
+
+def _reduzida_em_rgb(img: Image.Image) -> Image.Image:
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Transparência sobre fundo branco, como a imagem aparece no documento
+        rgba = img.convert('RGBA')
+        fundo = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(fundo, rgba)
+    reduzida = img.convert('RGB')
+    reduzida.thumbnail((_LADO_ANALISE, _LADO_ANALISE), Image.BILINEAR)
+    return reduzida
+
+
+def _gerar_lqip(reduzida: Image.Image) -> Optional[str]:
+    miniatura = reduzida.copy()
+    miniatura.thumbnail((IMAGENS_LQIP_LADO, IMAGENS_LQIP_LADO), Image.BILINEAR)
+    saida = io.BytesIO()
+    try:
+        miniatura.save(saida, format='WEBP', quality=30)
+    except Exception:
+        return None
+    return "data:image/webp;base64," + base64.b64encode(saida.getvalue()).decode('ascii')
+
+
+def _entropia(pixels: np.ndarray) -> float:
+    contagem = np.bincount((pixels >> 3).ravel(), minlength=32)
+    p = contagem[contagem > 0] / pixels.size
+    return float(-(p * np.log2(p)).sum())
+
+
+def _caixa_sem_bordas(pixels: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Caixa do conteúdo sem as bordas da cor do contorno, em coordenadas da cópia reduzida."""
+    contorno = np.concatenate((pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]))
+    fundo = int(np.median(contorno))
+    conteudo = np.abs(pixels.astype(np.int16) - fundo) > CONTEUDO_TOLERANCIA_FUNDO
+    linhas = np.flatnonzero(conteudo.any(axis=1))
+    colunas = np.flatnonzero(conteudo.any(axis=0))
+    if not len(linhas) or not len(colunas):
+        return None
+    h, w = pixels.shape
+    # Um pixel reduzido de folga, para não cortar antialiasing nas bordas do conteúdo
+    topo, base = max(linhas[0] - 1, 0), min(linhas[-1] + 2, h)
+    esquerda, direita = max(colunas[0] - 1, 0), min(colunas[-1] + 2, w)
+    if (base - topo) * (direita - esquerda) > (1 - RECORTE_BORDAS_FRACAO_MIN) * h * w:
+        return None
+    return int(esquerda), int(topo), int(direita), int(base)
+
+
+def analisar_imagem(img_data: bytes) -> AnaliseImagem:
+    """
+    Decodifica a imagem uma única vez (reduzida) e devolve o motivo para descartá-la por ser
+    uniforme ou quase em branco (ou None), o dHash, a caixa de recorte das bordas uniformes,
+    as dimensões finais e o LQIP.
+    """
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            largura, altura = img.size
+            formato = img.format
+            # JPEG: decodifica já reduzido, sem expandir a imagem inteira
+            img.draft('RGB', (_LADO_ANALISE, _LADO_ANALISE))
+            reduzida = _reduzida_em_rgb(img)
+    except Exception:
+        return AnaliseImagem(None)
+
+    cinza = reduzida.convert('L')
+    dhash = dhash_de_imagem(cinza)
+    pixels = np.asarray(cinza, dtype=np.uint8)
+    if CONTEUDO_UNIFORME_ATIVO:
+        desvio = float(pixels.std())
+        if desvio < CONTEUDO_DESVIO_MIN:
+            return AnaliseImagem(f"Uniforme (desvio {desvio:.1f})", dhash)
+        entropia = _entropia(pixels)
+        if entropia < CONTEUDO_ENTROPIA_MIN:
+            return AnaliseImagem(f"Uniforme (entropia {entropia:.2f} bits)", dhash)
+        fundo = int(np.bincount(pixels.ravel(), minlength=256).argmax())
+        fracao = float((np.abs(pixels.astype(np.int16) - fundo) > CONTEUDO_TOLERANCIA_FUNDO).mean())
+        if fracao < CONTEUDO_FRACAO_MIN:
+            return AnaliseImagem(f"Quase em branco ({fracao:.2%} de conteúdo)", dhash)
+
+    recorte = None
+    caixa = _caixa_sem_bordas(pixels) if RECORTE_BORDAS_ATIVO else None
+    if caixa:
+        # Da cópia reduzida para a imagem original
+        escala_x, escala_y = largura / reduzida.width, altura / reduzida.height
+        recorte = (
+            int(caixa[0] * escala_x), int(caixa[1] * escala_y),
+            min(int(np.ceil(caixa[2] * escala_x)), largura), min(int(np.ceil(caixa[3] * escala_y)), altura),
+        )
+        if formato == 'JPEG':
+            recorte = (recorte[0] - recorte[0] % _BLOCO_JPEG, recorte[1] - recorte[1] % _BLOCO_JPEG, recorte[2], recorte[3])
+            area = (recorte[2] - recorte[0]) * (recorte[3] - recorte[1])
+            if area > (1 - RECORTE_BORDAS_JPEG_FRACAO_MIN) * largura * altura:
+                recorte = None
+    if recorte:
+        reduzida = reduzida.crop(caixa)
+        largura, altura = recorte[2] - recorte[0], recorte[3] - recorte[1]
+    lqip = _gerar_lqip(reduzida) if IMAGENS_LQIP_ATIVO else None
+    return AnaliseImagem(None, dhash, recorte, largura, altura, lqip)
+
+
+def recortar_imagem(img_data: bytes, recorte: Tuple[int, int, int, int]) -> bytes:
+    """
+    Recorta a imagem na caixa dada, regravando no mesmo formato (JPEG ou PNG). O JPEG é
+    regravado com as tabelas de quantização e a subamostragem do original.
+    """
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            formato = 'JPEG' if img.format == 'JPEG' else 'PNG'
+            recortada = img.crop(recorte)
+            saida = io.BytesIO()
+            if formato == 'JPEG':
+                recortada.save(saida, format='JPEG', qtables=img.quantization,
+                               subsampling=JpegImagePlugin.get_sampling(img), optimize=True)
+            else:
+                recortada.save(saida, format='PNG')
+            return saida.getvalue()
+    except Exception as e:
+        print(f"   ⚠️ Falha ao recortar bordas da imagem: {e}")
+        return img_data
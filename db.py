@@ -2,7 +2,8 @@ import os
 import time
 from typing import List, Optional, Dict, Any
 
-from sqlalchemy import Column, Integer, String, Text, BigInteger, DateTime, JSON, Boolean, ForeignKey, select, delete
+from sqlalchemy import Column, Integer, String, Text, BigInteger, DateTime, JSON, Boolean, ForeignKey, Index, UniqueConstraint, select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.sql import func
@@ -69,6 +70,47 @@ class RefreshToken(Base):
     user = relationship("User", back_populates="refresh_tokens")
 
 
+# --- Imagens (extraídas do PDF, capturas de tela e uploads) ---
+class ImageRecord(Base):
+    """
+    Metadados de cada imagem do usuário, no lugar de imagens_info.json e das listagens de
+    diretório/bucket: a galeria é uma consulta pelo índice (user_id, pdf_hash).
+    """
+    __tablename__ = "images"
+    __table_args__ = (
+        UniqueConstraint("user_id", "kind", "storage_key", name="uq_images_user_kind_key"),
+        Index("ix_images_user_pdf", "user_id", "pdf_hash"),
+        Index("ix_images_sha256", "sha256"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(16), nullable=False)  # 'extracted', 'capture' ou 'upload'
+    name = Column(String(256), nullable=False)
+    pdf_name = Column(String(256), nullable=True)
+    pdf_hash = Column(String(64), nullable=True)
+    page = Column(Integer, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    storage_key = Column(String(512), nullable=False)  # caminho do objeto no bucket
+    thumb_key = Column(String(512), nullable=True)  # cópia WebP da galeria, quando existe
+    lqip = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+IMAGE_KINDS = ("extracted", "capture", "upload")
+_IMAGE_FIELDS = ("user_id", "kind", "name", "pdf_name", "pdf_hash", "page", "sha256", "size_bytes",
+                 "width", "height", "storage_key", "thumb_key", "lqip")
+
+
+def _check_image_kind(kind: str) -> None:
+    if kind not in IMAGE_KINDS:
+        raise ValueError(f"Tipo de imagem inválido: {kind!r} (esperado um de {', '.join(IMAGE_KINDS)})")
+
+
 def _build_db_url() -> str:
     host = os.getenv("DB_HOST", "10.54.192.3")
     user = os.getenv("DB_USER", "wislanpablo")
@@ -169,4 +211,59 @@ async def delete_editor_state(session: AsyncSession, slug: str) -> bool:
         return False
     await session.execute(delete(EditorState).where(EditorState.id == e.id))
     await session.commit()
-    return True
\ No newline at end of file
+    return True
+
+
+async def upsert_images(session: AsyncSession, records: List[Dict[str, Any]]) -> int:
+    """Grava vários registros de imagem em um único INSERT ... ON CONFLICT (user_id, kind, storage_key)."""
+    rows = [{k: r.get(k) for k in _IMAGE_FIELDS} for r in records]
+    for row in rows:
+        _check_image_kind(row["kind"])
+    if not rows:
+        return 0
+    # Lotes de até 1000 linhas (limite de parâmetros por comando do Postgres)
+    for i in range(0, len(rows), 1000):
+        stmt = pg_insert(ImageRecord).values(rows[i:i + 1000])
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_images_user_kind_key",
+            set_={k: stmt.excluded[k] for k in _IMAGE_FIELDS if k not in ("user_id", "kind", "storage_key")} | {"updated_at": func.now()},
+        )
+        await session.execute(stmt)
+    await session.commit()
+    return len(rows)
+
+
+async def list_images(
+    session: AsyncSession,
+    user_id: int,
+    kind: Optional[str] = None,
+    pdf_hash: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    if kind is not None:
+        _check_image_kind(kind)
+    query = select(ImageRecord).where(ImageRecord.user_id == user_id)
+    if pdf_hash is not None:
+        query = query.where(ImageRecord.pdf_hash == pdf_hash)
+    if kind is not None:
+        query = query.where(ImageRecord.kind == kind)
+    result = await session.execute(query.order_by(ImageRecord.page.asc().nullslast(), ImageRecord.id))
+    return [{k: getattr(e, k) for k in _IMAGE_FIELDS} for e in result.scalars()]
+
+
+async def delete_images(
+    session: AsyncSession,
+    user_id: int,
+    kind: str,
+    names: Optional[List[str]] = None,
+    pdf_hash: Optional[str] = None,
+) -> int:
+    """Remove os registros do tipo dado (todos, só os nomes informados ou só os de um PDF)."""
+    _check_image_kind(kind)
+    stmt = delete(ImageRecord).where(ImageRecord.user_id == user_id, ImageRecord.kind == kind)
+    if pdf_hash is not None:
+        stmt = stmt.where(ImageRecord.pdf_hash == pdf_hash)
+    if names is not None:
+        stmt = stmt.where(ImageRecord.name.in_(names))
+    result = await session.execute(stmt)
+    await session.commit()
+    return result.rowcount or 0
@@ -80,6 +80,32 @@ async def ensure_schema():
             );
             """
         )
+        # images (mesmo esquema de db.ImageRecord)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+              id SERIAL PRIMARY KEY,
+              user_id INTEGER NOT NULL REFERENCES users(id),
+              kind VARCHAR(16) NOT NULL,
+              name VARCHAR(256) NOT NULL,
+              pdf_name VARCHAR(256),
+              pdf_hash VARCHAR(64),
+              page INTEGER,
+              sha256 VARCHAR(64),
+              size_bytes BIGINT,
+              width INTEGER,
+              height INTEGER,
+              storage_key VARCHAR(512) NOT NULL,
+              thumb_key VARCHAR(512),
+              lqip TEXT,
+              created_at TIMESTAMPTZ DEFAULT NOW(),
+              updated_at TIMESTAMPTZ DEFAULT NOW(),
+              CONSTRAINT uq_images_user_kind_key UNIQUE (user_id, kind, storage_key)
+            );
+            """
+        )
+        await conn.execute("CREATE INDEX IF NOT EXISTS ix_images_user_pdf ON images (user_id, pdf_hash);")
+        await conn.execute("CREATE INDEX IF NOT EXISTS ix_images_sha256 ON images (sha256);")
     finally:
         await conn.close()
 
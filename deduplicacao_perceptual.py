@@ -0,0 +1,80 @@
+import os
+from typing import Any, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utilitarios import flag_do_ambiente
+
+# Deduplicação perceptual: o dHash de 64 bits de cada imagem é comparado por distância de
+# Hamming, para descartar a mesma figura (logotipo, diagrama) recodificada em outro tamanho
+# ou formato. A busca usa uma BK-tree, sem comparar cada imagem com todas as anteriores.
+DEDUP_PERCEPTUAL_ATIVO = flag_do_ambiente("DEDUP_PERCEPTUAL_ATIVO", True)
+# Distância máxima de Hamming (em bits, de 0 a 64) para considerar duas imagens iguais
+DEDUP_PERCEPTUAL_DISTANCIA = int(os.environ.get("DEDUP_PERCEPTUAL_DISTANCIA", "4"))
+
+_LADO_DHASH = 8
+
+
+def dhash_de_imagem(img: Image.Image) -> int:
+    """dHash (diferença horizontal de 9x8 pixels em tons de cinza) como inteiro de 64 bits."""
+    reduzida = img.convert('L').resize((_LADO_DHASH + 1, _LADO_DHASH), Image.LANCZOS)
+    pixels = np.asarray(reduzida, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def formatar_dhash(dhash: Optional[int]) -> Optional[str]:
+    return None if dhash is None else f"{dhash:016x}"
+
+
+def distancia_hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class IndicePerceptual:
+    """
+    BK-tree sobre distância de Hamming: cada nó guarda (hash, valor) e os filhos indexados
+    pela distância ao nó; a desigualdade triangular poda os ramos fora do raio buscado.
+    """
+
+    def __init__(self, distancia_maxima: int = None):
+        self.distancia_maxima = DEDUP_PERCEPTUAL_DISTANCIA if distancia_maxima is None else distancia_maxima
+        self._raiz = None  # [hash, valor, {distancia: nó}]
+        self._tamanho = 0
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def adicionar(self, dhash: int, valor: Any) -> None:
+        self._tamanho += 1
+        if self._raiz is None:
+            self._raiz = [dhash, valor, {}]
+            return
+        no = self._raiz
+        while True:
+            d = distancia_hamming(dhash, no[0])
+            filho = no[2].get(d)
+            if filho is None:
+                no[2][d] = [dhash, valor, {}]
+                return
+            no = filho
+
+    def mais_proximo(self, dhash: int) -> Optional[Tuple[Any, int]]:
+        """(valor, distância) do hash mais próximo dentro de distancia_maxima, ou None."""
+        if self._raiz is None:
+            return None
+        melhor = None
+        raio = self.distancia_maxima
+        pilha = [self._raiz]
+        while pilha:
+            no = pilha.pop()
+            d = distancia_hamming(dhash, no[0])
+            if d <= raio and (melhor is None or d < melhor[1]):
+                melhor = (no[1], d)
+                if d == 0:
+                    break
+            for dist_filho, filho in no[2].items():
+                if d - raio <= dist_filho <= d + raio:
+                    pilha.append(filho)
+        return melhor
@@ -0,0 +1,171 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Optional
+
+from PIL import Image
+
+from formatos_imagem import eh_imagem_extraida
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao
+
+# Folha de miniaturas (sprite) da galeria: todas as imagens extraídas de um PDF reduzidas e
+# empacotadas em uma única imagem, com um atlas JSON das posições. A galeria faz duas
+# requisições (atlas + folha) em vez de uma por imagem. A chave é o hash do conjunto
+# (nome, SHA-256) das imagens, então a folha só é refeita quando as imagens mudam:
+#   <SPRITE_DIR>/<chave>.webp (ou .jpg, se passar do limite de altura do WebP)
+#   <SPRITE_DIR>/<chave>.json
+# O diretório é limitado a SPRITE_CACHE_MAX_MB (LRU pelo último acesso).
+SPRITE_DIR = os.environ.get("SPRITE_DIR", os.path.join("temp_uploads", "cache_sprites"))
+SPRITE_CACHE_MAX_MB = float(os.environ.get("SPRITE_CACHE_MAX_MB", "128"))
+# Maior lado (em pixels) de cada miniatura na folha
+SPRITE_LADO = int(os.environ.get("SPRITE_LADO", "192"))
+SPRITE_LARGURA_MAX = int(os.environ.get("SPRITE_LARGURA_MAX", "2048"))
+SPRITE_QUALIDADE = int(os.environ.get("SPRITE_QUALIDADE", "75"))
+
+VERSAO_SPRITE = 1
+_LIMITE_WEBP = 16383
+
+# Um lock por folha, mantido enquanto a folha existir (removido junto com ela na expiração)
+_locks_por_chave = {}
+_lock_chaves = threading.Lock()
+
+
+def _chave_por_nome_natural(nome: str):
+    base, _ = os.path.splitext(nome)
+    prefixo, _, numero = base.rpartition('_')
+    return (prefixo, int(numero)) if numero.isdigit() else (base, 0)
+
+
+def _imagens_da_pasta(imagens_dir: str) -> list:
+    """(nome, hash) das imagens extraídas presentes na pasta, em ordem natural (img_2 < img_10)."""
+    try:
+        with open(os.path.join(imagens_dir, 'imagens_info.json'), 'r', encoding='utf-8') as f:
+            imagens_info = json.load(f)
+    except Exception:
+        imagens_info = {}
+    nomes = [n for n in os.listdir(imagens_dir) if eh_imagem_extraida(n)]
+    nomes.sort(key=_chave_por_nome_natural)
+    return [(n, (imagens_info.get(n) or {}).get('hash') or str(os.path.getmtime(os.path.join(imagens_dir, n)))) for n in nomes]
+
+
+def _chave_folha(imagens: list) -> str:
+    h = hashlib.sha256(f"v{VERSAO_SPRITE}:{SPRITE_LADO}:{SPRITE_LARGURA_MAX}".encode('utf-8'))
+    for nome, img_hash in imagens:
+        h.update(f"\n{nome}:{img_hash}".encode('utf-8'))
+    return h.hexdigest()[:32]
+
+
+def _miniatura(imagens_dir: str, nome: str) -> Optional[Image.Image]:
+    # A cópia WebP da galeria (quando existe) é menor e mais rápida de decodificar
+    webp = os.path.join(imagens_dir, os.path.splitext(nome)[0] + '.webp')
+    caminho = webp if os.path.isfile(webp) else os.path.join(imagens_dir, nome)
+    try:
+        with Image.open(caminho) as img:
+            img.draft('RGB', (SPRITE_LADO, SPRITE_LADO))
+            if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+                rgba = img.convert('RGBA')
+                miniatura = Image.new('RGB', rgba.size, (255, 255, 255))
+                miniatura.paste(rgba, mask=rgba.split()[-1])
+            else:
+                miniatura = img.convert('RGB')
+        miniatura.thumbnail((SPRITE_LADO, SPRITE_LADO), Image.LANCZOS)
+        return miniatura
+    except Exception as e:
+        print(f"[SPRITE] Falha ao reduzir {nome}: {e}")
+        return None
+
+
+def _montar_folha(imagens_dir: str, imagens: list, chave: str) -> dict:
+    """Empacota as miniaturas em prateleiras (linhas) de até SPRITE_LARGURA_MAX pixels."""
+    posicoes = {}
+    miniaturas = []
+    x = y = altura_linha = largura_total = 0
+    for nome, _ in imagens:
+        miniatura = _miniatura(imagens_dir, nome)
+        if miniatura is None:
+            continue
+        w, h = miniatura.size
+        if x and x + w > SPRITE_LARGURA_MAX:
+            x, y, altura_linha = 0, y + altura_linha, 0
+        posicoes[nome] = {"x": x, "y": y, "w": w, "h": h}
+        miniaturas.append((miniatura, x, y))
+        x += w
+        altura_linha = max(altura_linha, h)
+        largura_total = max(largura_total, x)
+    altura_total = y + altura_linha
+
+    extensao = '.webp' if altura_total <= _LIMITE_WEBP else '.jpg'
+    atlas = {"chave": chave, "arquivo": chave + extensao, "largura": largura_total, "altura": altura_total, "imagens": posicoes}
+    if not posicoes:
+        return atlas
+
+    folha = Image.new('RGB', (largura_total, altura_total), (255, 255, 255))
+    for miniatura, mx, my in miniaturas:
+        folha.paste(miniatura, (mx, my))
+
+    os.makedirs(SPRITE_DIR, exist_ok=True)
+    sufixo = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    caminho_folha = os.path.join(SPRITE_DIR, atlas["arquivo"])
+    folha.save(caminho_folha + sufixo, format='WEBP' if extensao == '.webp' else 'JPEG', quality=SPRITE_QUALIDADE)
+    os.replace(caminho_folha + sufixo, caminho_folha)
+    caminho_atlas = os.path.join(SPRITE_DIR, chave + '.json')
+    with open(caminho_atlas + sufixo, 'w', encoding='utf-8') as f:
+        json.dump(atlas, f, ensure_ascii=False)
+    os.replace(caminho_atlas + sufixo, caminho_atlas)
+    print(f"[SPRITE] Folha {chave[:12]} gerada: {len(posicoes)} miniaturas, {largura_total}x{altura_total}px")
+    return atlas
+
+
+def obter_folha_miniaturas(imagens_dir: str) -> dict:
+    """
+    Atlas da folha de miniaturas das imagens em imagens_dir, gerando a folha se ainda não
+    existir para este conjunto de imagens. Formato:
+        {"chave", "arquivo", "largura", "altura", "imagens": {nome: {"x", "y", "w", "h"}}}
+    """
+    imagens = _imagens_da_pasta(imagens_dir) if os.path.isdir(imagens_dir) else []
+    chave = _chave_folha(imagens)
+    caminho_atlas = os.path.join(SPRITE_DIR, chave + '.json')
+
+    with _lock_chaves:
+        lock = _locks_por_chave.setdefault(chave, threading.Lock())
+    # Requisições simultâneas da mesma galeria esperam a primeira montar a folha
+    with lock:
+        try:
+            with open(caminho_atlas, 'r', encoding='utf-8') as f:
+                atlas = json.load(f)
+            # Último acesso para a política LRU
+            for caminho in (caminho_atlas, os.path.join(SPRITE_DIR, atlas["arquivo"])):
+                os.utime(caminho)
+            return atlas
+        except (OSError, ValueError, KeyError):
+            pass
+        atlas = _montar_folha(imagens_dir, imagens, chave)
+    if atlas["imagens"]:
+        aplicar_politica_de_expiracao(manter=chave)
+    else:
+        # Nada foi gravado para esta chave
+        with _lock_chaves:
+            _locks_por_chave.pop(chave, None)
+    return atlas
+
+
+def aplicar_politica_de_expiracao(manter: Optional[str] = None) -> None:
+    """Acima de SPRITE_CACHE_MAX_MB, remove as folhas (e atlas) usadas há mais tempo (LRU), exceto a chave manter."""
+    removidas = politica_de_expiracao(
+        SPRITE_DIR, SPRITE_CACHE_MAX_MB * 1024 * 1024, manter=manter,
+        chave_da_entrada=lambda nome: os.path.splitext(nome)[0] if nome.endswith(('.json', '.webp', '.jpg')) else None,
+    )
+    for chave in removidas:
+        with _lock_chaves:
+            _locks_por_chave.pop(chave, None)
+        print(f"[SPRITE] Folha {chave[:12]} removida por limite de tamanho")
+
+
+def caminho_folha(arquivo: str) -> Optional[str]:
+    """Caminho local da folha pelo nome do arquivo (chave + extensão), ou None se inválido."""
+    base, extensao = os.path.splitext(arquivo)
+    if extensao not in ('.webp', '.jpg') or not base.isalnum():
+        return None
+    caminho = os.path.join(SPRITE_DIR, arquivo)
+    return caminho if os.path.isfile(caminho) else None
@@ -0,0 +1,136 @@
+import io
+import os
+import base64
+from typing import NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+from utilitarios import flag_do_ambiente
+
+# Formatos das imagens extraídas: JPEG e PNG são gravados como estão no PDF/HTML, com a
+# extensão correta (.jpg/.png); os demais (JPX, JBIG2, TIFF...) não abrem no navegador e são
+# convertidos para PNG. Opcionalmente é gerada uma cópia WebP reduzida para a galeria
+# (img_N.webp ao lado de img_N.jpg/png), gravada só quando fica menor que a original.
+EXTENSOES_IMAGENS_EXTRAIDAS = ('.png', '.jpg', '.jpeg')
+EXTENSAO_WEBP = '.webp'
+IMAGENS_WEBP_ATIVO = flag_do_ambiente("IMAGENS_WEBP_ATIVO", True)
+# Maior lado (em pixels) da cópia WebP exibida na galeria
+IMAGENS_WEBP_LADO_MAX = int(os.environ.get("IMAGENS_WEBP_LADO_MAX", "1024"))
+IMAGENS_WEBP_QUALIDADE = int(os.environ.get("IMAGENS_WEBP_QUALIDADE", "80"))
+
+# Filtro de relevância por dimensões, aplicado antes de decodificar ou calcular hashes: lê só
+# o cabeçalho da imagem (ou largura/altura do xref no PDF). Ícones, marcadores e fios
+# (linhas finas) são descartados; o limite em bytes (MIN_SIZE_BYTES) só vale quando as
+# dimensões não puderem ser lidas.
+IMAGENS_LADO_MIN = int(os.environ.get("IMAGENS_LADO_MIN", "24"))
+IMAGENS_AREA_MIN = int(os.environ.get("IMAGENS_AREA_MIN", str(64 * 64)))
+# Razão máxima entre o lado maior e o menor (acima disso é um fio ou separador)
+IMAGENS_PROPORCAO_MAX = float(os.environ.get("IMAGENS_PROPORCAO_MAX", "15"))
+# Quantos caracteres base64 decodificar para ler o cabeçalho de uma imagem embutida
+_PREFIXO_BASE64_CABECALHO = 64 * 1024
+
+
+class LimitesDimensao(NamedTuple):
+    """Limites do filtro por dimensões; cada extração pode passar os seus."""
+    lado_min: int = IMAGENS_LADO_MIN
+    area_min: int = IMAGENS_AREA_MIN
+    proporcao_max: float = IMAGENS_PROPORCAO_MAX
+
+
+LIMITES_DIMENSAO_PADRAO = LimitesDimensao()
+
+
+def limites_da_extracao(lado_min: Optional[int] = None, area_min: Optional[int] = None, proporcao_max: Optional[float] = None) -> LimitesDimensao:
+    """Limites de uma extração: os valores informados sobre o padrão (ValueError se inválidos)."""
+    limites = LIMITES_DIMENSAO_PADRAO._replace(**{
+        campo: valor for campo, valor in
+        (("lado_min", lado_min), ("area_min", area_min), ("proporcao_max", proporcao_max)) if valor is not None
+    })
+    if limites.lado_min < 0 or limites.area_min < 0:
+        raise ValueError("Lado e área mínimos não podem ser negativos")
+    if limites.proporcao_max < 1:
+        raise ValueError("A proporção máxima deve ser pelo menos 1")
+    return limites
+
+
+def eh_imagem_extraida(nome: str) -> bool:
+    """Imagem da galeria (original), sem contar as cópias WebP e o imagens_info.json."""
+    return nome.lower().endswith(EXTENSOES_IMAGENS_EXTRAIDAS)
+
+
+def extensao_nativa(img_data: bytes) -> Optional[str]:
+    """Extensão pelo conteúdo (assinatura do arquivo), se for um formato mantido como está."""
+    if img_data[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if img_data[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    return None
+
+
+def converter_para_png(img_data: bytes) -> Optional[bytes]:
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            saida = io.BytesIO()
+            img.save(saida, format='PNG')
+            return saida.getvalue()
+    except Exception as e:
+        print(f"   ⚠️ Falha ao converter imagem para PNG: {e}")
+        return None
+
+
+def nome_derivado_webp(nome_arquivo: str) -> str:
+    return os.path.splitext(nome_arquivo)[0] + EXTENSAO_WEBP
+
+
+def gravar_derivado_webp(img_data: bytes, caminho_webp: str) -> bool:
+    """Grava a cópia WebP reduzida da imagem; False se desativado, se falhar ou se não compensar."""
+    if not IMAGENS_WEBP_ATIVO:
+        return False
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            img.draft('RGB', (IMAGENS_WEBP_LADO_MAX, IMAGENS_WEBP_LADO_MAX))
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            img.thumbnail((IMAGENS_WEBP_LADO_MAX, IMAGENS_WEBP_LADO_MAX), Image.LANCZOS)
+            saida = io.BytesIO()
+            img.save(saida, format='WEBP', quality=IMAGENS_WEBP_QUALIDADE, method=4)
+    except Exception as e:
+        print(f"   ⚠️ Falha ao gerar WebP de {os.path.basename(caminho_webp)}: {e}")
+        return False
+    dados = saida.getvalue()
+    if len(dados) >= len(img_data):
+        return False
+    with open(caminho_webp, 'wb') as f:
+        f.write(dados)
+    return True
+
+
+def motivo_descarte_por_dimensoes(largura: int, altura: int, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO) -> Optional[str]:
+    """Motivo para descartar uma imagem de largura x altura, ou None se ela é relevante."""
+    if min(largura, altura) < limites.lado_min:
+        return f"{largura}x{altura}px, lado menor que {limites.lado_min}px"
+    if largura * altura < limites.area_min:
+        return f"{largura}x{altura}px, área menor que {limites.area_min}px²"
+    if max(largura, altura) > limites.proporcao_max * min(largura, altura):
+        return f"{largura}x{altura}px, proporção maior que {limites.proporcao_max:g}:1"
+    return None
+
+
+def dimensoes_do_cabecalho(img_data: bytes) -> Optional[Tuple[int, int]]:
+    """(largura, altura) lidas do cabeçalho, sem decodificar os pixels (Image.open é preguiçoso)."""
+    try:
+        with Image.open(io.BytesIO(img_data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def dimensoes_de_base64(encoded: str) -> Optional[Tuple[int, int]]:
+    """Dimensões de uma imagem em base64 decodificando só o início (o cabeçalho)."""
+    prefixo = encoded[:_PREFIXO_BASE64_CABECALHO]
+    try:
+        dados = base64.b64decode(prefixo[:len(prefixo) - len(prefixo) % 4])
+    except Exception:
+        return None
+    return dimensoes_do_cabecalho(dados)
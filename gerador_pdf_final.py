@@ -1,8 +1,88 @@
 import os
 import re # Necessário para expressões regulares
-from weasyprint import HTML
+import hashlib
+import threading
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 from markdown_it import MarkdownIt
 
+from reamostragem_render import (
+    RENDER_REAMOSTRAGEM_ATIVA, RENDER_IMAGENS_DPI, RENDER_IMAGENS_FOLGA, RENDER_IMAGENS_QUALIDADE_JPEG,
+    reamostrar_imagens_do_html,
+)
+
+# Folha de estilos do PDF final. É analisada uma única vez por processo, junto com a
+# FontConfiguration compartilhada, e passada ao WeasyPrint em cada conversão, em vez de vir
+# em um <style> dentro de cada HTML (que seria analisado de novo a cada PDF).
+CSS_RESUMO = """
+    /* Margem estreita para o PDF */
+    @page { size: A4; margin: 12mm; }
+    body { text-align: justify; font-family: Arial, sans-serif; margin: 12mm; line-height: 1.6; }
+    h1, h2, h3 { 
+        border-bottom: 1px solid #ddd; 
+        padding-bottom: 5px; 
+        margin-top: 30px; 
+    }
+    ul { margin-bottom: 20px; }
+    
+    /* ESTILOS DE TABELA OTIMIZADOS PARA WEASYPRINT */
+    table {
+        border-collapse: collapse; /* Une as bordas */
+        width: 100%; 
+        margin: 20px 0; 
+        font-size: 0.9em;
+        page-break-inside: auto; 
+    }
+    th, td {
+        border: 1px solid #ccc;
+        padding: 10px;
+        text-align: left;
+        page-break-inside: avoid; 
+    }
+    th {
+        background-color: #f2f2f2;
+        font-weight: bold;
+    }
+    
+    /* Estilos para Imagem */
+    .image-container { text-align: center; margin: 20px auto; page-break-inside: avoid; }
+    .image-container img { max-width: 70%; width: 100%; height: auto; }
+"""
+
+# Incrementar sempre que a montagem do HTML mudar, para invalidar o cache de PDFs (cache_renderizacao.py)
+VERSAO_MONTAGEM = 1
+
+
+def versao_estilos() -> str:
+    """Versão da montagem e da folha de estilos, parte da chave do cache de PDFs."""
+    # A reamostragem das imagens (resolução, folga e qualidade JPEG) também muda o PDF gerado
+    reamostragem = (f"dpi{RENDER_IMAGENS_DPI}-f{RENDER_IMAGENS_FOLGA:g}-q{RENDER_IMAGENS_QUALIDADE_JPEG}"
+                    if RENDER_REAMOSTRAGEM_ATIVA else "dpi0")
+    return f"v{VERSAO_MONTAGEM}-{hashlib.sha256(CSS_RESUMO.encode('utf-8')).hexdigest()[:16]}-{reamostragem}"
+
+
+_font_config = None
+_folha_estilos = None
+_lock_estilos = threading.Lock()
+
+
+def preparar_renderizacao():
+    """(FontConfiguration, CSS) do processo, criados na primeira chamada."""
+    global _font_config, _folha_estilos
+    with _lock_estilos:
+        if _folha_estilos is None:
+            _font_config = FontConfiguration()
+            _folha_estilos = CSS(string=CSS_RESUMO, font_config=_font_config)
+        return _font_config, _folha_estilos
+
+
+def aquecer_renderizacao() -> None:
+    """Renderiza um documento mínimo para carregar fontes e caches do WeasyPrint antes do primeiro PDF."""
+    font_config, folha_estilos = preparar_renderizacao()
+    HTML(string="<html><body><h1>ResumoPro</h1><p>Aquecimento <b>do</b> <i>renderizador</i>.</p>"
+                "<table><tr><th>a</th><td>b</td></tr></table></body></html>").write_pdf(
+        stylesheets=[folha_estilos], font_config=font_config)
+
 # --- FUNÇÃO AUXILIAR PARA RECONSTRUIR TABELAS ---
 
 def limpar_e_reconstruir_tabelas(texto):
@@ -208,40 +288,7 @@ def montar_resumo_com_imagens(caminho_resumo_tags, caminho_html_saida, nome_subp
 <head>
     <meta charset="UTF-8">
     <title>Resumo Final com Imagens IA</title>
-    <style>
-        /* Margem estreita para o PDF */
-        @page { size: A4; margin: 12mm; }
-        body { text-align: justify; font-family: Arial, sans-serif; margin: 12mm; line-height: 1.6; }
-        h1, h2, h3 { 
-            border-bottom: 1px solid #ddd; 
-            padding-bottom: 5px; 
-            margin-top: 30px; 
-        }
-        ul { margin-bottom: 20px; }
-        
-        /* ESTILOS DE TABELA OTIMIZADOS PARA WEASYPRINT */
-        table {
-            border-collapse: collapse; /* Une as bordas */
-            width: 100%; 
-            margin: 20px 0; 
-            font-size: 0.9em;
-            page-break-inside: auto; 
-        }
-        th, td {
-            border: 1px solid #ccc;
-            padding: 10px;
-            text-align: left;
-            page-break-inside: avoid; 
-        }
-        th {
-            background-color: #f2f2f2;
-            font-weight: bold;
-        }
-        
-        /* Estilos para Imagem */
-        .image-container { text-align: center; margin: 20px auto; page-break-inside: avoid; }
-        .image-container img { max-width: 70%; width: 100%; height: auto; }
-    </style>
+    <!-- Estilos em CSS_RESUMO, aplicados na conversão para PDF -->
 </head>
 <body>
 """
@@ -263,6 +310,12 @@ def montar_resumo_com_imagens(caminho_resumo_tags, caminho_html_saida, nome_subp
     except Exception as e:
         print(f"Aviso: falha ao normalizar caminhos de imagens no HTML: {e}")
 
+    # Imagens com mais pixels do que o tamanho impresso precisa: usar cópias reduzidas
+    try:
+        resumo_montado_html = reamostrar_imagens_do_html(resumo_montado_html, os.path.dirname(caminho_html_saida))
+    except Exception as e:
+        print(f"Aviso: falha ao reamostrar imagens para o PDF: {e}")
+
     # 4. Finalizar o arquivo HTML
     conteudo_final_html = html_header + resumo_montado_html + html_footer
 
@@ -278,7 +331,8 @@ def converter_html_para_pdf(caminho_html, caminho_pdf_saida):
     print("--- 2. Conversão: Gerando PDF ---")
     try:
         # WeasyPrint resolve os caminhos relativos (src="prints_imagens/...") a partir do diretório onde o HTML está.
-        HTML(caminho_html).write_pdf(caminho_pdf_saida)
+        font_config, folha_estilos = preparar_renderizacao()
+        HTML(caminho_html).write_pdf(caminho_pdf_saida, stylesheets=[folha_estilos], font_config=font_config)
         print(f"\n🎉 Conversão para PDF concluída com sucesso!")
         print(f"   Arquivo PDF final: '{caminho_pdf_saida}'")
         return True
@@ -288,9 +342,15 @@ def converter_html_para_pdf(caminho_html, caminho_pdf_saida):
 
 # --- FUNÇÃO PRINCIPAL DE EXECUÇÃO (DO PIPELINE) ---
 
-def executar_fase_final(caminho_resumo_tags, caminho_pdf_final_output, nome_subpasta_imagens_input):
-    
-    ARQUIVO_HTML_SAIDA = os.path.join(os.path.dirname(caminho_pdf_final_output), "relatorio_final.html")
+def executar_fase_final(caminho_resumo_tags, caminho_pdf_final_output, nome_subpasta_imagens_input, converter=converter_html_para_pdf, caminho_html_saida=None):
+    """
+    Monta o HTML e o converte para PDF. `converter(caminho_html, caminho_pdf)` permite
+    delegar a conversão (ex.: ao pool de renderização). O HTML fica, por padrão, em
+    relatorio_final.html ao lado do PDF; ele precisa estar na pasta que contém a subpasta
+    de imagens. Retorna True se o PDF foi gerado.
+    """
+
+    ARQUIVO_HTML_SAIDA = caminho_html_saida or os.path.join(os.path.dirname(caminho_pdf_final_output), "relatorio_final.html")
     
     print("\n-------------------------------------------------")
     print("INICIANDO FASE FINAL: MONTAGEM E CONVERSÃO PDF")
@@ -303,8 +363,10 @@ def executar_fase_final(caminho_resumo_tags, caminho_pdf_final_output, nome_subp
         nome_subpasta_imagens_input # Passa o nome da subpasta
     )
     
+    sucesso = False
     if caminho_html_gerado:
         # 2. Conversão para PDF
-        converter_html_para_pdf(caminho_html_gerado, caminho_pdf_final_output)
+        sucesso = converter(caminho_html_gerado, caminho_pdf_final_output)
     
-    print("\n--- FIM DO PROCESSO DE GERAÇÃO ---")
\ No newline at end of file
+    print("\n--- FIM DO PROCESSO DE GERAÇÃO ---")
+    return sucesso
\ No newline at end of file
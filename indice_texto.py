@@ -0,0 +1,188 @@
+import os
+import gzip
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Union
+
+from pool_documentos import emprestar_documento, hash_pdf_memoizado, hash_da_fonte, lock_fitz
+from storage import upload_local_file, download_blob_to_file, blob_exists
+from utilitarios import flag_do_ambiente
+
+# Índice de texto por página para a busca dentro do documento, gerado no upload e guardado
+# por hash do PDF (JSON compactado com gzip):
+#   <INDICE_TEXTO_DIR>/<sha256>.json.gz
+# com espelho no GCS em <INDICE_TEXTO_PREFIX>/<sha256>.json.gz. Formato:
+#   {"versao": 1, "paginas": [{"largura": float, "altura": float,
+#                              "palavras": [[x0, y0, x1, y1, "palavra"], ...]}, ...]}
+INDICE_TEXTO_DIR = os.environ.get("INDICE_TEXTO_DIR", os.path.join("temp_uploads", "indice_texto"))
+INDICE_TEXTO_PREFIX = os.environ.get("INDICE_TEXTO_PREFIX", "cache/indice_texto").rstrip('/')
+INDICE_TEXTO_GCS = flag_do_ambiente("INDICE_TEXTO_GCS", True)
+# Quantos índices manter carregados em memória (LRU) para responder às buscas sem reler o disco
+INDICE_TEXTO_EM_MEMORIA = int(os.environ.get("INDICE_TEXTO_EM_MEMORIA", "16"))
+
+VERSAO_INDICE = 1
+
+_indices_carregados: "OrderedDict[str, list]" = OrderedDict()
+_lock_indices = threading.Lock()
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas e sem acentos, para a busca ignorar caixa e acentuação."""
+    decomposto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def _caminho_local(pdf_hash: str) -> str:
+    return os.path.join(INDICE_TEXTO_DIR, f"{pdf_hash}.json.gz")
+
+
+def indexar_texto_do_pdf(caminho_pdf: Union[str, bytes, memoryview], pdf_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Gera (se ainda não existir) o índice de palavras com posições de cada página do PDF.
+    Retorna o hash do PDF, ou None se não foi possível indexar. Falhas não interrompem o pipeline.
+    """
+    try:
+        if not pdf_hash:
+            pdf_hash = hash_da_fonte(caminho_pdf)
+        caminho_local = _caminho_local(pdf_hash)
+        if os.path.isfile(caminho_local):
+            return pdf_hash
+
+        paginas = []
+        # Trava o fitz página a página: tiles e buscas não esperam a indexação inteira
+        with emprestar_documento(caminho_pdf, pdf_hash, travar=False) as doc:
+            with lock_fitz:
+                total_paginas = doc.page_count
+            for numero in range(total_paginas):
+                with lock_fitz:
+                    page = doc.load_page(numero)
+                    palavras_pagina = page.get_text("words")
+                    largura, altura = page.rect.width, page.rect.height
+                    del page
+                palavras = [
+                    [round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), palavra]
+                    for x0, y0, x1, y1, palavra, *_ in palavras_pagina
+                ]
+                paginas.append({
+                    "largura": round(largura, 1),
+                    "altura": round(altura, 1),
+                    "palavras": palavras,
+                })
+
+        os.makedirs(INDICE_TEXTO_DIR, exist_ok=True)
+        tmp_path = f"{caminho_local}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump({"versao": VERSAO_INDICE, "paginas": paginas}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, caminho_local)
+        print(f"[INDICE] Texto indexado ({pdf_hash[:12]}): {len(paginas)} páginas")
+
+        if INDICE_TEXTO_GCS:
+            def _enviar():
+                try:
+                    upload_local_file(INDICE_TEXTO_PREFIX, caminho_local, dest_name=os.path.basename(caminho_local))
+                except Exception as e:
+                    print(f"[INDICE] Falha ao enviar índice {pdf_hash[:12]} para o GCS: {e}")
+            threading.Thread(target=_enviar, daemon=True).start()
+        return pdf_hash
+    except Exception as e:
+        print(f"[INDICE] Falha ao indexar o texto do PDF: {e}")
+        return None
+
+
+def _ler_indice(pdf_hash: str) -> Optional[dict]:
+    caminho_local = _caminho_local(pdf_hash)
+    if not os.path.isfile(caminho_local) and INDICE_TEXTO_GCS:
+        caminho_gcs = f"{INDICE_TEXTO_PREFIX}/{pdf_hash}.json.gz"
+        try:
+            if blob_exists(caminho_gcs):
+                download_blob_to_file(caminho_gcs, caminho_local)
+        except Exception as e:
+            print(f"[INDICE] Falha ao consultar índice no GCS ({pdf_hash[:12]}): {e}")
+    if not os.path.isfile(caminho_local):
+        return None
+    with gzip.open(caminho_local, 'rt', encoding='utf-8') as f:
+        indice = json.load(f)
+    if indice.get("versao") != VERSAO_INDICE:
+        return None
+    return indice
+
+
+def _carregar_indice(pdf_hash: str) -> Optional[list]:
+    """Índice pronto para busca (palavras já normalizadas), mantido em memória por LRU."""
+    with _lock_indices:
+        if pdf_hash in _indices_carregados:
+            _indices_carregados.move_to_end(pdf_hash)
+            return _indices_carregados[pdf_hash]
+
+    indice = _ler_indice(pdf_hash)
+    if indice is None:
+        return None
+    paginas = []
+    for pagina in indice["paginas"]:
+        palavras = pagina["palavras"]
+        paginas.append({
+            "largura": pagina["largura"],
+            "altura": pagina["altura"],
+            "palavras": palavras,
+            "normalizadas": [normalizar_texto(p[4]) for p in palavras],
+        })
+
+    with _lock_indices:
+        _indices_carregados[pdf_hash] = paginas
+        while len(_indices_carregados) > INDICE_TEXTO_EM_MEMORIA:
+            _indices_carregados.popitem(last=False)
+    return paginas
+
+
+def buscar_no_pdf(caminho_pdf: str, consulta: str, limite: int = 100) -> dict:
+    """
+    Busca a consulta (uma palavra ou uma sequência de palavras) no índice do PDF, ignorando
+    caixa e acentos. Retorna as páginas com ocorrências e os retângulos (em pontos PDF) para
+    destacar cada uma. O índice é gerado na hora apenas se ainda não existir.
+    """
+    termos = normalizar_texto(consulta).split()
+    if not termos:
+        raise ValueError("Consulta vazia")
+
+    pdf_hash = hash_pdf_memoizado(caminho_pdf)
+    paginas = _carregar_indice(pdf_hash)
+    if paginas is None:
+        if not indexar_texto_do_pdf(caminho_pdf, pdf_hash):
+            raise RuntimeError("Não foi possível indexar o texto do PDF")
+        paginas = _carregar_indice(pdf_hash)
+
+    resultados = []
+    total = 0
+    n = len(termos)
+    for numero, pagina in enumerate(paginas, start=1):
+        normalizadas = pagina["normalizadas"]
+        ocorrencias = []
+        for i in range(len(normalizadas) - n + 1):
+            if all(termos[k] in normalizadas[i + k] for k in range(n)):
+                palavras = pagina["palavras"][i:i + n]
+                ocorrencias.append({
+                    "rects": [p[:4] for p in palavras],
+                    "trecho": " ".join(p[4] for p in pagina["palavras"][max(0, i - 6):i + n + 6]),
+                })
+                total += 1
+                if total >= limite:
+                    break
+        if ocorrencias:
+            resultados.append({
+                "pagina": numero,
+                "largura": pagina["largura"],
+                "altura": pagina["altura"],
+                "ocorrencias": ocorrencias,
+            })
+        if total >= limite:
+            break
+
+    return {
+        "pdf_hash": pdf_hash,
+        "consulta": consulta,
+        "total": total,
+        "truncado": total >= limite,
+        "resultados": resultados,
+    }
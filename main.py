@@ -18,10 +18,12 @@ from storage import (
 from typing import List, Optional
 import time
 from fastapi import Body
-from main_pipeline import start_full_processing, extrair_titulo_do_resumo, setup_logging
+from main_pipeline import start_full_processing, hash_pdf_para_cache, extrair_titulo_do_resumo, setup_logging, ler_paginas_prontas, extracao_em_andamento, cancelar_extracao_em_andamento
 from websocket_manager import ConnectionManager
+from formatos_imagem import eh_imagem_extraida, nome_derivado_webp, dimensoes_do_cabecalho, EXTENSAO_WEBP
+from utilitarios import flag_do_ambiente
 from sqlalchemy.ext.asyncio import AsyncSession
-from db import SessionLocal, init_db, User, RefreshToken
+from db import SessionLocal, init_db, User, RefreshToken, upsert_images, list_images, delete_images
 from db_iam import (
     iam_fetch_user_by_email,
     iam_create_user,
@@ -37,6 +39,9 @@ import datetime
 import secrets
 import httpx
 import asyncio
+import io
+import mmap
+import hashlib
 
 # Carregar variáveis do arquivo .env (se existir)
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
@@ -439,6 +444,88 @@ def _format_structured_data_as_table(table_lines: list) -> list:
 
 manager = ConnectionManager()
 
+def _upload_em_memoria(f) -> bool:
+    """
+    Se o SpooledTemporaryFile do upload ainda está em memória (não transbordou para disco).
+    O tempfile não expõe isso publicamente: usa `rolled`, se existir, e senão o atributo
+    privado `_rolled` (o mesmo que o Starlette consulta em UploadFile._in_memory). Objetos
+    sem nenhum dos dois são considerados em memória se não tiverem descritor (fileno()).
+    """
+    rolled = getattr(f, "rolled", getattr(f, "_rolled", None))
+    if rolled is not None:
+        return not rolled
+    try:
+        f.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return True
+    return False
+
+def _buffer_do_upload(upload: UploadFile):
+    """
+    Obtém o conteúdo do PDF enviado sem regravá-lo em disco antes do processamento:
+    se o SpooledTemporaryFile já transbordou para disco, mapeia-o em memória (mmap) e
+    devolve um memoryview; arquivos pequenos (ainda em memória) são lidos como bytes.
+    O mmap é fechado por _liberar_buffer_do_upload.
+    """
+    f = upload.file
+    try:
+        f.seek(0)
+    except Exception:
+        pass
+    if not _upload_em_memoria(f):
+        try:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+    return f.read()
+
+def _fechar_mmap_do_upload(buffer: memoryview, pdf_hash: Optional[str]) -> None:
+    from pool_documentos import descartar_documento
+    # O documento do pool aberto sobre o mmap precisa ser fechado antes dele
+    if pdf_hash and not descartar_documento(pdf_hash):
+        print("[WARN] PDF do upload ainda em uso no pool de documentos; mmap liberado pelo coletor")
+        return
+    mapa = buffer.obj
+    try:
+        buffer.release()
+        mapa.close()
+    except BufferError as e:
+        print(f"[WARN] mmap do upload ainda referenciado; liberado pelo coletor: {e}")
+
+async def _liberar_buffer_do_upload(buffer, copia_em_disco: Optional[asyncio.Task] = None, pdf_hash: Optional[str] = None) -> None:
+    """
+    Fecha o mmap criado por _buffer_do_upload depois da cópia em disco e da extração
+    (inclusive das páginas restantes em segundo plano). Buffers em bytes não precisam de nada.
+    pdf_hash é o SHA-256 já calculado do PDF (chave do documento no pool); sem ele, o
+    documento do pool só é fechado pela expiração por ociosidade e o mmap fica com o coletor.
+    """
+    if not isinstance(buffer, memoryview) or not isinstance(buffer.obj, mmap.mmap):
+        return
+    pendentes = [t for t in (copia_em_disco, extracao_em_andamento(os.path.join(UPLOAD_DIR, "imagens_extraidas"))) if t]
+    if pendentes:
+        await asyncio.wait(pendentes)
+    await asyncio.to_thread(_fechar_mmap_do_upload, buffer, pdf_hash)
+
+def _gravar_buffer_em_disco(buffer, destino: str) -> None:
+    with open(destino, "wb") as out:
+        out.write(buffer)
+    print(f"[TRACE] PDF gravado em disco (em paralelo ao processamento): {destino}")
+
+# Referências às tasks de segundo plano em andamento (evita que sejam coletadas antes do fim)
+_tarefas_em_segundo_plano = set()
+
+def _agendar_copia_em_disco(buffer, destino: str) -> asyncio.Task:
+    """Grava o buffer do PDF em disco numa thread, em paralelo ao pipeline."""
+    tarefa = asyncio.create_task(asyncio.to_thread(_gravar_buffer_em_disco, buffer, destino))
+    _tarefas_em_segundo_plano.add(tarefa)
+
+    def _finalizar(t: asyncio.Task):
+        _tarefas_em_segundo_plano.discard(t)
+        if not t.cancelled() and t.exception():
+            print(f"[ERRO] Falha ao gravar o PDF em disco ({destino}): {t.exception()}")
+    tarefa.add_done_callback(_finalizar)
+    return tarefa
+
 async def cleanup_temp_files(manifest_path: str):
     print(f"[CLEANUP] Iniciando limpeza para manifesto: {manifest_path}")
     if not os.path.exists(manifest_path):
@@ -688,7 +775,13 @@ async def editor_state_save(request_data: dict = Body(...)):
                 src_path = os.path.join(UPLOAD_DIR, "imagens_extraidas", base)
                 dst_path = os.path.join(images_dir, base)
                 if os.path.exists(src_path):
-                    shutil.copy2(src_path, dst_path)
+                    # Hard link: a cópia do projeto compartilha os bytes da galeria no disco
+                    if os.path.lexists(dst_path):
+                        os.remove(dst_path)
+                    try:
+                        os.link(src_path, dst_path)
+                    except OSError:
+                        shutil.copy2(src_path, dst_path)
                     copied.append(base)
             except Exception as ce:
                 print(f"Aviso: falha ao copiar imagem de galeria '{base_name}' para projeto '{slug}': {ce}")
@@ -798,11 +891,22 @@ async def editor_state_delete(slug: str):
 async def receive_files_and_text(
     background_tasks: BackgroundTasks,
     originalPdf: UploadFile = File(...),
-    iaSummaryText: str = Form(...)
+    iaSummaryText: str = Form(...),
+    minImageSide: Optional[int] = Form(None),
+    minImageArea: Optional[int] = Form(None),
+    maxImageAspect: Optional[float] = Form(None)
 ):
     """
     Recebe os arquivos, normaliza o resumo e inicia o pipeline em segundo plano.
+    minImageSide, minImageArea e maxImageAspect ajustam, só nesta extração, o filtro de
+    imagens pequenas ou finas demais (padrões em IMAGENS_LADO_MIN, IMAGENS_AREA_MIN e
+    IMAGENS_PROPORCAO_MAX).
     """
+    from formatos_imagem import limites_da_extracao
+    try:
+        limites = limites_da_extracao(minImageSide, minImageArea, maxImageAspect)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # 1. NORMALIZAÇÃO E ARMAZENAMENTO DO RESUMO (ETAPA 2)
     try:
@@ -824,28 +928,23 @@ async def receive_files_and_text(
     safe_pdf_filename = originalPdf.filename.replace('\\', '_').replace('/', '_')
     pdf_filename = os.path.join(UPLOAD_DIR, safe_pdf_filename)
     
+    # O pipeline lê o PDF direto do buffer (fitz.open(stream=...)); a cópia em disco é feita em paralelo.
     try:
-        with open(pdf_filename, "wb") as buffer:
-            shutil.copyfileobj(originalPdf.file, buffer)
-        print(f"[TRACE] PDF original salvo em: {pdf_filename}")
+        pdf_buffer = _buffer_do_upload(originalPdf)
+        copia_em_disco = _agendar_copia_em_disco(pdf_buffer, pdf_filename)
     except Exception as e:
-        print(f"[ERRO FATAL] Salvamento do PDF: {e}")
+        print(f"[ERRO FATAL] Leitura do PDF enviado: {e}")
         raise HTTPException(status_code=500, detail="Erro ao salvar o arquivo PDF.")
     
-    # --- NOVO BLOCO DE IMPORTAÇÃO LOCAL ---
-    # Importa a função APENAS quando é necessário executá-la
-    from main_pipeline import start_full_processing, extrair_titulo_do_resumo 
-    # --------------------------------------
-
     # --- 3. INJEÇÃO DA TAREFA NO BACKGROUND (INÍCIO DO PIPELINE) ---
     
     background_tasks.add_task(
-        start_full_processing, 
-        pdf_filename,            # caminho_pdf_input
+        _processar_upload_em_segundo_plano,
+        pdf_buffer,              # caminho_pdf_input (buffer em memória)
         summary_filename,        # caminho_resumo_input
-        UPLOAD_DIR,              # upload_dir
-        ARQUIVO_PDF_FINAL,       # arquivo_pdf_output_name
-        manager                  # Adicionar o manager aqui para comunicação WebSocket
+        pdf_filename,            # caminho_pdf_salvo (cópia em disco gravada em paralelo)
+        copia_em_disco,
+        limites                  # filtro por dimensões desta extração
     )
     
     # 4. RETORNO IMEDIATO
@@ -853,6 +952,21 @@ async def receive_files_and_text(
             "message": "Processamento iniciado em segundo plano."}
 
 
+async def _processar_upload_em_segundo_plano(pdf_buffer, summary_filename: str, pdf_filename: str, copia_em_disco: asyncio.Task, limites) -> None:
+    """Pipeline completo do /api/processamento-full e, ao fim, a liberação do buffer do upload."""
+    # --- NOVO BLOCO DE IMPORTAÇÃO LOCAL ---
+    # Importa a função APENAS quando é necessário executá-la
+    from main_pipeline import start_full_processing, hash_pdf_para_cache
+    # --------------------------------------
+    # Calculado uma vez: chave do cache de extração e do documento no pool (fechado antes do mmap)
+    pdf_hash = await asyncio.to_thread(hash_pdf_para_cache, pdf_buffer)
+    try:
+        await start_full_processing(pdf_buffer, summary_filename, UPLOAD_DIR, ARQUIVO_PDF_FINAL, manager,
+                                    pdf_filename, limites, pdf_hash=pdf_hash)
+    finally:
+        await _liberar_buffer_do_upload(pdf_buffer, copia_em_disco, pdf_hash)
+
+
 # --- ROTA PARA DOWNLOAD DO ARQUIVO FINAL ---
 @app.get("/download-final-pdf/{filename}") # Rota dinâmica para o nome do arquivo
 async def download_final_pdf(filename: str, background_tasks: BackgroundTasks):
@@ -901,7 +1015,7 @@ async def get_preview_data():
         imagens = []
         if os.path.isdir(imagens_dir):
             try:
-                imagens = [f for f in os.listdir(imagens_dir) if f.lower().endswith('.png')]
+                imagens = [f for f in os.listdir(imagens_dir) if eh_imagem_extraida(f)]
             except Exception as e:
                 print(f"Erro ao listar imagens no fallback: {e}")
                 imagens = []
@@ -950,14 +1064,10 @@ async def get_editor_data(request: Request):
                 print(f"Erro ao carregar imagens_info quando estrutura_edicao.json existe: {e}")
                 estrutura["imagens_info"] = estrutura.get("imagens_info", {})
 
-            # Incluir lista de capturas de tela do diretório caso não esteja presente
+            # Incluir lista de capturas de tela caso não esteja presente
             try:
-                cap_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
                 if "captured_images" not in estrutura or not isinstance(estrutura.get("captured_images"), list):
-                    if os.path.isdir(cap_dir):
-                        estrutura["captured_images"] = [f for f in os.listdir(cap_dir) if f.lower().endswith('.png')]
-                    else:
-                        estrutura["captured_images"] = []
+                    estrutura["captured_images"] = await _nomes_das_capturas(user)
             except Exception as e:
                 print(f"Erro ao listar capturas no get_editor_data: {e}")
         else:
@@ -971,7 +1081,7 @@ async def get_editor_data(request: Request):
             imagens_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
             if os.path.isdir(imagens_dir):
                 try:
-                    estrutura["images"] = [f for f in os.listdir(imagens_dir) if f.lower().endswith('.png')]
+                    estrutura["images"] = [f for f in os.listdir(imagens_dir) if eh_imagem_extraida(f)]
                     
                     # Carregar informações das imagens se disponível
                     info_file_path = os.path.join(imagens_dir, 'imagens_info.json')
@@ -990,9 +1100,7 @@ async def get_editor_data(request: Request):
                     print(f"Erro ao listar imagens no fallback: {e}")
             # Incluir capturas no fallback
             try:
-                cap_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
-                if os.path.isdir(cap_dir):
-                    estrutura["captured_images"] = [f for f in os.listdir(cap_dir) if f.lower().endswith('.png')]
+                estrutura["captured_images"] = await _nomes_das_capturas(user)
             except Exception:
                 pass
             # Preferir PDFs e imagens do GCS para persistência
@@ -1007,7 +1115,7 @@ async def get_editor_data(request: Request):
                 base_name = os.path.splitext(estrutura["pdf_name"])[0]
                 base_prefix = f"uploads/{user_id}/imagens_extraidas/{base_name}"
                 try:
-                    imgs_gcs = [os.path.basename(n) for n, _ in list_prefix(base_prefix) if n.lower().endswith('.png')]
+                    imgs_gcs = [os.path.basename(n) for n, _ in list_prefix(base_prefix) if eh_imagem_extraida(n)]
                 except Exception:
                     imgs_gcs = []
                 if imgs_gcs:
@@ -1042,10 +1150,65 @@ async def pdf_images_list(request: Request):
     try:
         imagens_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
         items = []
+        # Extração ainda em andamento (páginas restantes em segundo plano): listar só as imagens
+        # já registradas no imagens_info.json de páginas dentro da marca d'água
+        marca = ler_paginas_prontas(imagens_dir) or {}
+        em_andamento = marca.get("concluido") is False
+        # Extração concluída e registrada na tabela images: uma consulta pelo índice
+        # (user_id, pdf_hash), sem listar o diretório nem o bucket
+        pdf_hash = _pdf_hash_atual()
+        registros = await _listar_imagens_do_banco(user, "extracted", pdf_hash) if pdf_hash and not em_andamento and pdf_hash not in _registros_pendentes else []
+        if registros:
+            for r in registros:
+                local = os.path.join(imagens_dir, r["name"])
+                item = {"id": r["name"], "url": f"/temp_uploads/imagens_extraidas/{r['name']}" if os.path.isfile(local) else f"/gcs/{r['storage_key']}"}
+                if r["thumb_key"]:
+                    thumb = os.path.basename(r["thumb_key"])
+                    item["thumb_url"] = f"/temp_uploads/imagens_extraidas/{thumb}" if os.path.isfile(os.path.join(imagens_dir, thumb)) else f"/gcs/{r['thumb_key']}"
+                if r["width"] and r["height"]:
+                    item["width"], item["height"] = r["width"], r["height"]
+                if r["lqip"]:
+                    item["lqip"] = r["lqip"]
+                items.append(item)
+            return {"items": items, "count": len(items),
+                    "pages_ready": marca.get("paginas_prontas"), "total_pages": marca.get("total_paginas"),
+                    "complete": True}
+
+        imagens_info = {}
+        try:
+            with open(os.path.join(imagens_dir, 'imagens_info.json'), 'r', encoding='utf-8') as f:
+                imagens_info = json.load(f)
+        except Exception:
+            pass
+        imagens_prontas = None
+        if em_andamento:
+            imagens_prontas = set()
+            try:
+                for nome, info in imagens_info.items():
+                    if int(info.get('pagina', 0)) <= (marca.get("paginas_prontas") or 0):
+                        imagens_prontas.add(nome)
+            except Exception:
+                pass
+
+        def _com_dimensoes(item: dict) -> dict:
+            # Dimensões e LQIP para a galeria montar o layout antes de baixar as imagens
+            info = imagens_info.get(item["id"]) or {}
+            if info.get("largura") and info.get("altura"):
+                item["width"] = info["largura"]
+                item["height"] = info["altura"]
+            if info.get("lqip"):
+                item["lqip"] = info["lqip"]
+            return item
+
         if os.path.isdir(imagens_dir):
-            for fn in os.listdir(imagens_dir):
-                if fn.lower().endswith(".png"):
-                    items.append({"id": fn, "url": f"/temp_uploads/imagens_extraidas/{fn}"})
+            arquivos = os.listdir(imagens_dir)
+            for fn in arquivos:
+                if eh_imagem_extraida(fn) and (imagens_prontas is None or fn in imagens_prontas):
+                    item = {"id": fn, "url": f"/temp_uploads/imagens_extraidas/{fn}"}
+                    # Cópia WebP reduzida para exibição na galeria, quando gerada
+                    if nome_derivado_webp(fn) in arquivos:
+                        item["thumb_url"] = f"/temp_uploads/imagens_extraidas/{nome_derivado_webp(fn)}"
+                    items.append(_com_dimensoes(item))
         # Complementar com GCS quando disponível (por base de imagens do projeto)
         try:
             estrutura_path = os.path.join(UPLOAD_DIR, "estrutura_edicao.json")
@@ -1058,36 +1221,113 @@ async def pdf_images_list(request: Request):
             if base_url and base_url.startswith("/gcs/"):
                 # /gcs/uploads/{user}/imagens_extraidas/{base}/
                 base_prefix = base_url[len("/gcs/"):].rstrip('/')
-                for name, _ in list_prefix(base_prefix):
-                    base = os.path.basename(name)
-                    if base.lower().endswith('.png'):
+                nomes_gcs = [os.path.basename(name) for name, _ in list_prefix(base_prefix)]
+                for base in nomes_gcs:
+                    if eh_imagem_extraida(base):
                         if not any(x.get("id") == base for x in items):
-                            items.append({"id": base, "url": f"/gcs/{base_prefix}/{base}"})
+                            item = {"id": base, "url": f"/gcs/{base_prefix}/{base}"}
+                            if nome_derivado_webp(base) in nomes_gcs:
+                                item["thumb_url"] = f"/gcs/{base_prefix}/{nome_derivado_webp(base)}"
+                            items.append(_com_dimensoes(item))
         except Exception:
             pass
-        return {"items": items, "count": len(items)}
+        return {"items": items, "count": len(items),
+                "pages_ready": marca.get("paginas_prontas"), "total_pages": marca.get("total_paginas"),
+                "complete": not em_andamento}
     except HTTPException:
         raise
     except Exception as e:
         print(f"Erro ao listar imagens do PDF: {e}")
         raise HTTPException(status_code=500, detail="Falha ao listar imagens do PDF")
 
+@app.get("/api/pdf-images/locations")
+async def pdf_images_locations(request: Request, image: Optional[str] = None):
+    """
+    Índice imagem -> páginas/retângulos de origem (campo 'ocorrencias' do imagens_info.json),
+    para o "ir para a origem" do visualizador. Extrações antigas (sem retângulos) devolvem
+    apenas a página registrada.
+    """
+    user = require_user(request)
+    info_path = os.path.join(UPLOAD_DIR, "imagens_extraidas", "imagens_info.json")
+    try:
+        imagens_info = {}
+        if os.path.exists(info_path):
+            with open(info_path, 'r', encoding='utf-8') as f:
+                imagens_info = json.load(f)
+        items = {}
+        for nome, info in imagens_info.items():
+            if image and nome != image:
+                continue
+            if not isinstance(info, dict):
+                continue
+            ocorrencias = info.get("ocorrencias")
+            if not ocorrencias and str(info.get("pagina", "")).isdigit():
+                ocorrencias = [{"pagina": int(info["pagina"]), "rects": []}]
+            items[nome] = ocorrencias or []
+        if image and image not in items:
+            raise HTTPException(status_code=404, detail="Imagem não encontrada")
+        return {"items": items, "count": len(items)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Erro ao ler localização das imagens do PDF: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao ler localização das imagens")
+
+@app.get("/api/pdf-images/sprite")
+async def pdf_images_sprite(request: Request):
+    """
+    Atlas da folha de miniaturas (sprite) das imagens extraídas: posição de cada imagem na
+    folha única servida por /api/pdf-images/sprite/{arquivo}. A folha é gerada na primeira
+    chamada e reaproveitada enquanto o conjunto de imagens (nomes e hashes) não mudar.
+    """
+    user = require_user(request)
+    try:
+        from folha_miniaturas import obter_folha_miniaturas
+        atlas = await asyncio.to_thread(obter_folha_miniaturas, os.path.join(UPLOAD_DIR, "imagens_extraidas"))
+        return {
+            "key": atlas["chave"],
+            "sprite_url": f"/api/pdf-images/sprite/{atlas['arquivo']}",
+            "width": atlas["largura"],
+            "height": atlas["altura"],
+            "items": atlas["imagens"],
+            "count": len(atlas["imagens"]),
+        }
+    except Exception as e:
+        print(f"Erro ao gerar folha de miniaturas: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao gerar folha de miniaturas")
+
+@app.get("/api/pdf-images/sprite/{arquivo}")
+async def pdf_images_sprite_file(request: Request, arquivo: str):
+    user = require_user(request)
+    from folha_miniaturas import caminho_folha
+    caminho = caminho_folha(arquivo)
+    if not caminho:
+        raise HTTPException(status_code=404, detail="Folha de miniaturas não encontrada")
+    # O nome é a chave do conteúdo: pode ficar em cache no navegador indefinidamente
+    return FileResponse(caminho, headers={"Cache-Control": "private, max-age=31536000, immutable"})
+
 @app.get("/api/captures/list")
 async def captures_list(request: Request):
     user = require_user(request)
     try:
+        # Capturas registradas na tabela images: uma consulta, sem listar o diretório nem o bucket
+        registros = await _listar_imagens_do_banco(user, "capture")
+        if registros:
+            items = [_item_de_registro({"id": r["name"], "url": _url_de_registro(r)}, r) for r in registros]
+            return {"items": items, "count": len(items)}
+
         cap_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
         items = []
         if os.path.isdir(cap_dir):
             for fn in os.listdir(cap_dir):
-                if fn.lower().endswith('.png'):
+                if eh_imagem_extraida(fn):
                     items.append({"id": fn, "url": f"/temp_uploads/capturas_de_tela/{fn}"})
         # Complementar com GCS
         try:
             base_prefix = f"uploads/{user['user_id']}/capturas_de_tela"
             for name, _ in list_prefix(base_prefix):
                 base = os.path.basename(name)
-                if base.lower().endswith('.png'):
+                if eh_imagem_extraida(base):
                     if not any(x.get("id") == base for x in items):
                         items.append({"id": base, "url": f"/gcs/{base_prefix}/{base}"})
         except Exception:
@@ -1101,7 +1341,7 @@ async def captures_list(request: Request):
 
 # --- ROTAS: Exclusão de capturas ---
 @app.post("/api/captures/delete")
-async def delete_capture(request_data: dict = Body(default={})):  # { filename: str }
+async def delete_capture(request: Request, request_data: dict = Body(default={})):  # { filename: str }
     try:
         filename = (request_data or {}).get("filename")
         if not filename or not isinstance(filename, str):
@@ -1133,6 +1373,7 @@ async def delete_capture(request_data: dict = Body(default={})):  # { filename:
                     json.dump(estrutura, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"Erro ao atualizar estrutura_edicao.json na exclusão: {e}")
+        await _excluir_imagens_do_banco(_usuario_opcional(request), "capture", [safe])
         return {"status": "ok"}
     except HTTPException:
         raise
@@ -1141,7 +1382,7 @@ async def delete_capture(request_data: dict = Body(default={})):  # { filename:
         raise HTTPException(status_code=500, detail="Falha ao excluir captura")
 
 @app.post("/api/captures/delete-all")
-async def delete_all_captures():
+async def delete_all_captures(request: Request):
     try:
         # Excluir no GCS
         try:
@@ -1152,7 +1393,7 @@ async def delete_all_captures():
         cap_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
         if os.path.isdir(cap_dir):
             for f in os.listdir(cap_dir):
-                if f.lower().endswith('.png'):
+                if eh_imagem_extraida(f):
                     try:
                         os.remove(os.path.join(cap_dir, f))
                     except Exception:
@@ -1168,6 +1409,7 @@ async def delete_all_captures():
                     json.dump(estrutura, f, ensure_ascii=False, indent=2)
         except Exception as e:
             print(f"Erro ao atualizar estrutura_edicao.json na exclusão de todas: {e}")
+        await _excluir_imagens_do_banco(_usuario_opcional(request), "capture")
         return {"status": "ok"}
     except Exception as e:
         print(f"Erro ao excluir todas as capturas: {e}")
@@ -1179,16 +1421,118 @@ async def config_viewer():
     client_id = os.getenv("ADOBE_CLIENT_ID", "b06000c70bd143a0adc54a2f6d394b2a")
     return {"adobe_client_id": client_id}
 
+# --- ROTAS: Rasterização de páginas (miniaturas e tiles de zoom em WebP) ---
+def _resolver_pdf_local(pdf_name: str, request: Request) -> str:
+    """Localiza o PDF em temp_uploads; se não existir, baixa a cópia do usuário no GCS."""
+    safe = os.path.basename(pdf_name or "")
+    if not safe.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="pdf_name inválido")
+    local_path = os.path.join(UPLOAD_DIR, safe)
+    if os.path.isfile(local_path):
+        return local_path
+    user = require_user(request)
+    try:
+        from storage import download_blob_to_file
+        download_blob_to_file(f"uploads/{user['user_id']}/pdfs/{safe}", local_path)
+        return local_path
+    except HTTPException:
+        raise HTTPException(status_code=404, detail="PDF não encontrado")
+
+_RASTER_HEADERS = {"Cache-Control": "private, max-age=86400"}
+
+@app.get("/api/pdf-raster/{pdf_name}/info")
+async def pdf_raster_info(pdf_name: str, request: Request):
+    """Metadados para o visualizador: páginas, dimensões e grade de tiles por DPI."""
+    from raster_paginas import informacoes_do_pdf
+    pdf_path = _resolver_pdf_local(pdf_name, request)
+    try:
+        return await asyncio.to_thread(informacoes_do_pdf, pdf_path)
+    except Exception as e:
+        print(f"Erro ao ler informações do PDF para rasterização: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao ler o PDF")
+
+@app.get("/api/pdf-raster/{pdf_name}/page/{pagina}/thumb")
+async def pdf_raster_thumb(pdf_name: str, pagina: int, request: Request):
+    from raster_paginas import obter_miniatura
+    pdf_path = _resolver_pdf_local(pdf_name, request)
+    try:
+        dados = await asyncio.to_thread(obter_miniatura, pdf_path, pagina)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erro ao gerar miniatura da página {pagina}: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao gerar miniatura")
+    return Response(content=dados, media_type="image/webp", headers=_RASTER_HEADERS)
+
+@app.get("/api/pdf-raster/{pdf_name}/page/{pagina}/tile/{dpi}/{x}/{y}")
+async def pdf_raster_tile(pdf_name: str, pagina: int, dpi: int, x: int, y: int, request: Request):
+    from raster_paginas import obter_tile
+    pdf_path = _resolver_pdf_local(pdf_name, request)
+    try:
+        dados = await asyncio.to_thread(obter_tile, pdf_path, pagina, dpi, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erro ao gerar tile da página {pagina} ({dpi} DPI, {x},{y}): {e}")
+        raise HTTPException(status_code=500, detail="Falha ao gerar tile")
+    return Response(content=dados, media_type="image/webp", headers=_RASTER_HEADERS)
+
+@app.get("/api/pdf-search/{pdf_name}")
+async def pdf_search(pdf_name: str, q: str, request: Request, limit: int = 100):
+    """Busca no texto do PDF pelo índice por página; retorna páginas e retângulos para destaque."""
+    from indice_texto import buscar_no_pdf
+    pdf_path = _resolver_pdf_local(pdf_name, request)
+    try:
+        return await asyncio.to_thread(buscar_no_pdf, pdf_path, q, max(1, min(limit, 1000)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erro na busca no PDF {pdf_name}: {e}")
+        raise HTTPException(status_code=500, detail="Falha na busca no PDF")
+
 @app.post("/api/generate-final-pdf")
 async def generate_final_pdf(request_data: dict):
-    """Gera o PDF final com base na estrutura editada pelo usuário."""
+    """
+    Gera o PDF final com base na estrutura editada pelo usuário. Com "mode": "job" a geração
+    roda em segundo plano: a resposta traz o id do trabalho, o progresso vai pelo WebSocket
+    (/ws/progress) e o PDF é baixado em /api/generate-final-pdf/jobs/{job_id}/result.
+    """
     try:
         from gerador_pdf_final import executar_fase_final
+        from pool_renderizacao import renderizar_pdf
         
         # Extrair dados da requisição
         resumo_html = request_data.get('resumo_text', '')
         imagens_posicionadas = request_data.get('imagens_posicionadas', [])
         upload_dir = request_data.get('upload_dir', UPLOAD_DIR)
+
+        # Mesmo resumo, mesmas imagens e mesmos estilos: devolver o PDF já renderizado
+        from gerador_pdf_final import versao_estilos
+        from cache_renderizacao import chave_renderizacao, obter_pdf_em_cache, salvar_pdf_em_cache
+        chave_cache = await asyncio.to_thread(chave_renderizacao, resumo_html, upload_dir, versao_estilos())
+        pdf_em_cache = await asyncio.to_thread(obter_pdf_em_cache, chave_cache)
+
+        if request_data.get('mode') == 'job':
+            from trabalhos_renderizacao import criar_trabalho, executar_trabalho, remover_expirados
+            await asyncio.to_thread(remover_expirados)
+            trabalho = await asyncio.to_thread(criar_trabalho, resumo_html, pdf_em_cache, chave_cache)
+            if trabalho["estado"] != "concluido":
+                tarefa = asyncio.create_task(executar_trabalho(trabalho["id"], upload_dir, manager))
+                _tarefas_em_segundo_plano.add(tarefa)
+                tarefa.add_done_callback(_tarefas_em_segundo_plano.discard)
+            return {"job_id": trabalho["id"], "state": trabalho["estado"],
+                    "status_url": f"/api/generate-final-pdf/jobs/{trabalho['id']}",
+                    "result_url": f"/api/generate-final-pdf/jobs/{trabalho['id']}/result"}
+
+        if pdf_em_cache:
+            return FileResponse(
+                path=pdf_em_cache,
+                media_type='application/pdf',
+                headers={
+                    'Content-Disposition': 'inline; filename="Resumo_Final_Com_Prints.pdf"',
+                    'Cache-Control': 'no-store'
+                }
+            )
         
         # Criar arquivo temporário com o resumo editado
         resumo_editado_path = os.path.join(upload_dir, "resumo_editado_final.txt")
@@ -1198,15 +1542,22 @@ async def generate_final_pdf(request_data: dict):
         # Caminho do PDF final
         pdf_final_path = os.path.join(upload_dir, "Resumo_Final_Com_Prints.pdf")
         
-        # Executar geração do PDF
-        executar_fase_final(
-            resumo_editado_path,
-            pdf_final_path,
-            "imagens_extraidas"
-        )
+        # Executar geração do PDF fora do loop de eventos; a conversão roda em um worker do pool
+        try:
+            sucesso = await asyncio.to_thread(
+                executar_fase_final,
+                resumo_editado_path,
+                pdf_final_path,
+                "imagens_extraidas",
+                renderizar_pdf
+            )
+        except TimeoutError as e:
+            print(f"Erro ao gerar PDF final: {e}")
+            raise HTTPException(status_code=504, detail="Tempo esgotado ao gerar o PDF final")
         
         # Retornar o PDF como resposta
-        if os.path.exists(pdf_final_path):
+        if sucesso and os.path.exists(pdf_final_path):
+            await asyncio.to_thread(salvar_pdf_em_cache, chave_cache, pdf_final_path)
             # Preferir Content-Disposition inline para exibição no navegador
             return FileResponse(
                 path=pdf_final_path,
@@ -1219,17 +1570,193 @@ async def generate_final_pdf(request_data: dict):
         else:
             raise HTTPException(status_code=500, detail="Erro ao gerar PDF final")
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao gerar PDF final: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.get("/api/generate-final-pdf/jobs/{job_id}")
+async def generate_final_pdf_job(job_id: str):
+    from trabalhos_renderizacao import obter_trabalho
+    trabalho = obter_trabalho(job_id)
+    if not trabalho:
+        raise HTTPException(status_code=404, detail="Trabalho não encontrado ou expirado")
+    resposta = {"job_id": trabalho["id"], "state": trabalho["estado"], "progress": trabalho["progresso"],
+                "status": trabalho["mensagem"], "error": trabalho["erro"]}
+    if trabalho["estado"] == "concluido":
+        resposta["result_url"] = f"/api/generate-final-pdf/jobs/{trabalho['id']}/result"
+    return resposta
+
+@app.get("/api/generate-final-pdf/jobs/{job_id}/result")
+async def generate_final_pdf_job_result(job_id: str):
+    from trabalhos_renderizacao import obter_trabalho, caminho_pdf_trabalho
+    trabalho = obter_trabalho(job_id)
+    if not trabalho:
+        raise HTTPException(status_code=404, detail="Trabalho não encontrado ou expirado")
+    if trabalho["estado"] == "erro":
+        raise HTTPException(status_code=500, detail=trabalho["erro"] or "Erro ao gerar PDF final")
+    if trabalho["estado"] != "concluido":
+        raise HTTPException(status_code=409, detail="PDF ainda em geração")
+    # Artefato guardado até expirar: downloads repetidos não renderizam de novo
+    return FileResponse(
+        path=caminho_pdf_trabalho(job_id),
+        media_type='application/pdf',
+        headers={
+            'Content-Disposition': 'inline; filename="Resumo_Final_Com_Prints.pdf"',
+            'Cache-Control': 'private, max-age=3600'
+        }
+    )
+
+def _enviar_imagens_extraidas_para_gcs(images_dir: str, user_prefix: str, base_name: str, ja_enviadas: Optional[set] = None) -> set:
+    """Envia as imagens extraídas (exceto as já enviadas) e o imagens_info.json para o GCS do usuário."""
+    enviadas = set(ja_enviadas or ())
+    try:
+        if os.path.isdir(images_dir):
+            for fn in os.listdir(images_dir):
+                if (eh_imagem_extraida(fn) or fn.lower().endswith(EXTENSAO_WEBP)) and fn not in enviadas:
+                    local_img = os.path.join(images_dir, fn)
+                    try:
+                        upload_local_file(f"{user_prefix}/imagens_extraidas/{base_name}", local_img, dest_name=fn)
+                        enviadas.add(fn)
+                    except Exception as ie:
+                        print(f"[WARN] Falha ao enviar imagem {fn} para GCS: {ie}")
+            info_path = os.path.join(images_dir, 'imagens_info.json')
+            if os.path.isfile(info_path):
+                try:
+                    upload_local_file(f"{user_prefix}/imagens_extraidas/{base_name}", info_path, dest_name='imagens_info.json')
+                except Exception as je:
+                    print(f"[WARN] Falha ao enviar imagens_info.json para GCS: {je}")
+    except Exception as e:
+        print(f"[WARN] Upload de imagens para GCS falhou: {e}")
+    return enviadas
+
+# --- Registro das imagens na tabela images (db.py) ---
+# A galeria consulta o banco em vez de listar diretórios e o bucket; falhas no banco apenas
+# registram aviso e as listagens voltam às varreduras.
+IMAGENS_DB_ATIVO = flag_do_ambiente("IMAGENS_DB_ATIVO", True)
+# PDFs cujas páginas restantes ainda não foram registradas (a listagem usa as varreduras)
+_registros_pendentes = set()
+
+def _usuario_opcional(request: Request) -> Optional[dict]:
+    try:
+        return require_user(request)
+    except HTTPException:
+        return None
+
+def _pdf_hash_atual() -> Optional[str]:
+    try:
+        with open(os.path.join(UPLOAD_DIR, "estrutura_edicao.json"), 'r', encoding='utf-8') as f:
+            return json.load(f).get("pdf_hash")
+    except Exception:
+        return None
+
+def _registros_imagens_extraidas(images_dir: str, user_id: int, user_prefix: str, base_name: str, pdf_name: str, pdf_hash: Optional[str], nomes) -> list:
+    """Registros das imagens extraídas já enviadas ao bucket, a partir do imagens_info.json."""
+    try:
+        with open(os.path.join(images_dir, 'imagens_info.json'), 'r', encoding='utf-8') as f:
+            imagens_info = json.load(f)
+    except Exception:
+        imagens_info = {}
+    prefixo = f"{user_prefix}/imagens_extraidas/{base_name}"
+    registros = []
+    for fn in nomes:
+        if not eh_imagem_extraida(fn):
+            continue
+        info = imagens_info.get(fn) or {}
+        try:
+            tamanho = os.path.getsize(os.path.join(images_dir, fn))
+        except OSError:
+            tamanho = None
+        pagina = info.get("pagina")
+        registros.append({
+            "user_id": user_id, "kind": "extracted", "name": fn,
+            "pdf_name": pdf_name, "pdf_hash": pdf_hash,
+            "page": int(pagina) if str(pagina).isdigit() else None,
+            "sha256": info.get("hash"), "size_bytes": tamanho,
+            "width": info.get("largura"), "height": info.get("altura"),
+            "storage_key": f"{prefixo}/{fn}",
+            "thumb_key": f"{prefixo}/{info['webp']}" if info.get("webp") and info["webp"] in nomes else None,
+            "lqip": info.get("lqip"),
+        })
+    return registros
+
+def _registro_de_dados(dados: bytes, user_id: int, kind: str, storage_key: str, pdf_hash: Optional[str] = None) -> dict:
+    """Registro de uma captura ou upload (hash e dimensões lidas do cabeçalho)."""
+    dimensoes = dimensoes_do_cabecalho(dados) or (None, None)
+    return {
+        "user_id": user_id, "kind": kind, "name": os.path.basename(storage_key),
+        "pdf_hash": pdf_hash, "sha256": hashlib.sha256(dados).hexdigest(), "size_bytes": len(dados),
+        "width": dimensoes[0], "height": dimensoes[1], "storage_key": storage_key,
+    }
+
+def _registro_de_arquivo(caminho: str, user_id: int, kind: str, storage_key: str, pdf_hash: Optional[str] = None) -> dict:
+    with open(caminho, 'rb') as f:
+        return _registro_de_dados(f.read(), user_id, kind, storage_key, pdf_hash)
+
+def _registro_de_upload(file: UploadFile, user_id: int, kind: str, storage_key: str, pdf_hash: Optional[str] = None) -> dict:
+    file.file.seek(0)
+    return _registro_de_dados(file.file.read(), user_id, kind, storage_key, pdf_hash)
+
+async def _registrar_imagens_no_banco(registros: list) -> None:
+    if not IMAGENS_DB_ATIVO or not registros:
+        return
+    try:
+        async with SessionLocal() as session:
+            total = await upsert_images(session, registros)
+        print(f"[IMAGENS_DB] {total} imagens registradas")
+    except Exception as e:
+        print(f"[WARN] Falha ao registrar imagens no banco: {e}")
+
+async def _excluir_imagens_do_banco(user: Optional[dict], kind: str, nomes: Optional[list] = None, pdf_hash: Optional[str] = None) -> None:
+    if not IMAGENS_DB_ATIVO or not user:
+        return
+    try:
+        async with SessionLocal() as session:
+            await delete_images(session, user["user_id"], kind, nomes, pdf_hash)
+    except Exception as e:
+        print(f"[WARN] Falha ao excluir imagens do banco: {e}")
+
+async def _listar_imagens_do_banco(user: dict, kind: str, pdf_hash: Optional[str] = None) -> list:
+    if not IMAGENS_DB_ATIVO:
+        return []
+    try:
+        async with SessionLocal() as session:
+            return await list_images(session, user["user_id"], kind, pdf_hash)
+    except Exception as e:
+        print(f"[WARN] Falha ao listar imagens do banco: {e}")
+        return []
+
+def _url_de_registro(registro: dict) -> str:
+    """URL local (temp_uploads/...) se o arquivo estiver no disco; senão, a do objeto no GCS."""
+    if os.path.isfile(os.path.join(*registro["storage_key"].split('/'))):
+        return f"/{registro['storage_key']}"
+    return f"/gcs/{registro['storage_key']}"
+
+def _item_de_registro(item: dict, registro: dict) -> dict:
+    if registro["width"] and registro["height"]:
+        item["width"], item["height"] = registro["width"], registro["height"]
+    return item
+
+async def _nomes_das_capturas(user: dict) -> list:
+    """Capturas da tabela images; sem registros (ou sem banco), as do diretório local."""
+    registros = await _listar_imagens_do_banco(user, "capture")
+    if registros:
+        return [r["name"] for r in registros]
+    cap_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
+    if not os.path.isdir(cap_dir):
+        return []
+    return [f for f in os.listdir(cap_dir) if eh_imagem_extraida(f)]
+
 @app.post("/api/upload-pdf")
 async def upload_pdf(request: Request, originalPdf: UploadFile = File(...)):
-    # Limpar o diretório de imagens extraídas para garantir que não haja imagens antigas.
+    # Limpar o diretório de imagens extraídas para garantir que não haja imagens antigas
+    # (antes, parar a extração em segundo plano do PDF anterior, que grava na mesma pasta).
     imagens_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
+    await cancelar_extracao_em_andamento(imagens_dir)
     if os.path.exists(imagens_dir):
         for f in os.listdir(imagens_dir):
-            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')) or f == 'imagens_info.json':
+            if eh_imagem_extraida(f) or f.lower().endswith(('.gif', EXTENSAO_WEBP)) or f == 'imagens_info.json':
                 try:
                     os.remove(os.path.join(imagens_dir, f))
                 except Exception as e:
@@ -1251,15 +1778,13 @@ async def upload_pdf(request: Request, originalPdf: UploadFile = File(...)):
                 break
             idx += 1
 
+    pdf_buffer = copia_em_disco = pdf_hash = None
     try:
-        try:
-            originalPdf.file.seek(0)
-        except Exception:
-            pass
-
-        with open(pdf_path, "wb") as buffer:
-            shutil.copyfileobj(originalPdf.file, buffer)
-        print(f"[TRACE] PDF recebido e salvo em: {pdf_path}")
+        # Processar direto do buffer do upload; a cópia em disco é gravada em paralelo
+        pdf_buffer = _buffer_do_upload(originalPdf)
+        copia_em_disco = _agendar_copia_em_disco(pdf_buffer, pdf_path)
+        # Calculado uma vez: cache de extração, tabela images e liberação do mmap
+        pdf_hash = await asyncio.to_thread(hash_pdf_para_cache, pdf_buffer)
 
         # Criar um arquivo de resumo temporário vazio (sem texto inicial)
         resumo_temp_path = os.path.join(UPLOAD_DIR, f"temp_resumo_{base_name}.txt")
@@ -1268,12 +1793,17 @@ async def upload_pdf(request: Request, originalPdf: UploadFile = File(...)):
 
         # Acionar a extração de imagens
         await start_full_processing(
-            caminho_pdf_input=pdf_path,
+            caminho_pdf_input=pdf_buffer,
             caminho_resumo_input=resumo_temp_path,
             upload_dir=UPLOAD_DIR,
             arquivo_pdf_output_name=f"output_{base_name}.pdf",
-            manager=manager
+            manager=manager,
+            caminho_pdf_salvo=pdf_path,
+            pdf_hash=pdf_hash
         )
+        # Garantir que o PDF já está em disco antes de responder (e de enviá-lo ao GCS)
+        await copia_em_disco
+        print(f"[TRACE] PDF recebido e salvo em: {pdf_path}")
         # Persistir no GCS por usuário autenticado
         user = require_user(request)
         user_prefix = f"uploads/{user['user_id']}"
@@ -1283,24 +1813,28 @@ async def upload_pdf(request: Request, originalPdf: UploadFile = File(...)):
         except Exception as e:
             print(f"[WARN] Falha ao enviar PDF para GCS: {e}")
         # Enviar imagens extraídas e info, se existirem
-        try:
-            images_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
-            if os.path.isdir(images_dir):
-                for fn in os.listdir(images_dir):
-                    if fn.lower().endswith('.png'):
-                        local_img = os.path.join(images_dir, fn)
-                        try:
-                            upload_local_file(f"{user_prefix}/imagens_extraidas/{base_name}", local_img, dest_name=fn)
-                        except Exception as ie:
-                            print(f"[WARN] Falha ao enviar imagem {fn} para GCS: {ie}")
-                info_path = os.path.join(images_dir, 'imagens_info.json')
-                if os.path.isfile(info_path):
-                    try:
-                        upload_local_file(f"{user_prefix}/imagens_extraidas/{base_name}", info_path, dest_name='imagens_info.json')
-                    except Exception as je:
-                        print(f"[WARN] Falha ao enviar imagens_info.json para GCS: {je}")
-        except Exception as e:
-            print(f"[WARN] Upload de imagens para GCS falhou: {e}")
+        images_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
+        enviadas = await asyncio.to_thread(_enviar_imagens_extraidas_para_gcs, images_dir, user_prefix, base_name)
+        # Registrar as imagens enviadas na tabela images, em um único INSERT
+        if pdf_hash:
+            # Reenvio do mesmo PDF: os registros da extração anterior são substituídos
+            await _excluir_imagens_do_banco(user, "extracted", pdf_hash=pdf_hash)
+        await _registrar_imagens_no_banco(_registros_imagens_extraidas(images_dir, user['user_id'], user_prefix, base_name, candidate_name, pdf_hash, enviadas))
+        # Páginas restantes ainda em processamento: enviar as demais imagens quando terminarem
+        restante = extracao_em_andamento(images_dir)
+        if restante:
+            _registros_pendentes.add(pdf_hash)
+            async def _enviar_restantes():
+                try:
+                    await restante
+                    todas = await asyncio.to_thread(_enviar_imagens_extraidas_para_gcs, images_dir, user_prefix, base_name, enviadas)
+                    novas = todas - enviadas
+                    await _registrar_imagens_no_banco(_registros_imagens_extraidas(images_dir, user['user_id'], user_prefix, base_name, candidate_name, pdf_hash, novas))
+                finally:
+                    _registros_pendentes.discard(pdf_hash)
+            tarefa = asyncio.create_task(_enviar_restantes())
+            _tarefas_em_segundo_plano.add(tarefa)
+            tarefa.add_done_callback(_tarefas_em_segundo_plano.discard)
 
         return {"status": "success", "filename": candidate_name,
                 "path": f"/temp_uploads/{candidate_name}",
@@ -1309,10 +1843,37 @@ async def upload_pdf(request: Request, originalPdf: UploadFile = File(...)):
     except Exception as e:
         print(f"[ERRO] upload-pdf: {e}")
         raise HTTPException(status_code=500, detail="Erro ao salvar o arquivo PDF.")
+    finally:
+        if pdf_buffer is not None:
+            tarefa = asyncio.create_task(_liberar_buffer_do_upload(pdf_buffer, copia_em_disco, pdf_hash))
+            _tarefas_em_segundo_plano.add(tarefa)
+            tarefa.add_done_callback(_tarefas_em_segundo_plano.discard)
+
+def _registrar_captura_na_estrutura(base_name: str) -> None:
+    # Atualizar estrutura_edicao.json (compatibilidade até migrar para SQL)
+    estrutura_path = os.path.join(UPLOAD_DIR, "estrutura_edicao.json")
+    estrutura = {}
+    if os.path.exists(estrutura_path):
+        try:
+            with open(estrutura_path, 'r', encoding='utf-8') as f:
+                estrutura = json.load(f)
+        except Exception:
+            estrutura = {}
+    captured_images = estrutura.get("captured_images", [])
+    if base_name not in captured_images:
+        captured_images.append(base_name)
+        estrutura["captured_images"] = captured_images
+    if "upload_dir" not in estrutura:
+        estrutura["upload_dir"] = UPLOAD_DIR
+    try:
+        with open(estrutura_path, 'w', encoding='utf-8') as f:
+            json.dump(estrutura, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Erro ao salvar estrutura_edicao.json: {e}")
 
 # --- ROTA: Upload de imagem capturada (capturas de tela) ---
 @app.post("/api/upload-captured-image")
-async def upload_captured_image(file: UploadFile = File(...), filename: Optional[str] = Form(None)):
+async def upload_captured_image(request: Request, file: UploadFile = File(...), filename: Optional[str] = Form(None)):
     try:
         base_name = filename or f"img_capture_{int(time.time()*1000)}.png"
         if not base_name.lower().endswith('.png'):
@@ -1333,26 +1894,10 @@ async def upload_captured_image(file: UploadFile = File(...), filename: Optional
             with open(save_path, 'wb') as f:
                 shutil.copyfileobj(file.file, f)
 
-        # Atualizar estrutura_edicao.json (compatibilidade até migrar para SQL)
-        estrutura_path = os.path.join(UPLOAD_DIR, "estrutura_edicao.json")
-        estrutura = {}
-        if os.path.exists(estrutura_path):
-            try:
-                with open(estrutura_path, 'r', encoding='utf-8') as f:
-                    estrutura = json.load(f)
-            except Exception:
-                estrutura = {}
-        captured_images = estrutura.get("captured_images", [])
-        if base_name not in captured_images:
-            captured_images.append(base_name)
-            estrutura["captured_images"] = captured_images
-        if "upload_dir" not in estrutura:
-            estrutura["upload_dir"] = UPLOAD_DIR
-        try:
-            with open(estrutura_path, 'w', encoding='utf-8') as f:
-                json.dump(estrutura, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Erro ao salvar estrutura_edicao.json: {e}")
+        _registrar_captura_na_estrutura(base_name)
+        user = _usuario_opcional(request)
+        if user:
+            await _registrar_imagens_no_banco([_registro_de_upload(file, user['user_id'], "capture", f"temp_uploads/capturas_de_tela/{base_name}", _pdf_hash_atual())])
         return {"filename": base_name, "url": f"/temp_uploads/capturas_de_tela/{base_name}"}
     except HTTPException:
         raise
@@ -1360,9 +1905,65 @@ async def upload_captured_image(file: UploadFile = File(...), filename: Optional
         print(f"Erro no upload de captura: {e}")
         raise HTTPException(status_code=500, detail="Falha ao salvar imagem capturada")
 
+# --- ROTA: Captura de região renderizada no servidor ---
+@app.post("/api/captures/render-region")
+async def render_region_capture(request: Request, request_data: dict = Body(...)):
+    """
+    Gera uma captura a partir das coordenadas da região no PDF (pdf_name, page, rect em
+    pontos PDF [x0, y0, x1, y1], dpi), em vez de receber o PNG da tela do navegador.
+    """
+    from raster_paginas import renderizar_recorte
+    pdf_name = request_data.get('pdf_name') or ''
+    rect = request_data.get('rect')
+    try:
+        pagina = int(request_data.get('page'))
+        dpi = int(request_data.get('dpi') or 200)
+        if not isinstance(rect, (list, tuple)) or len(rect) != 4:
+            raise ValueError
+        rect = tuple(float(v) for v in rect)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Parâmetros inválidos: informe page, rect [x0, y0, x1, y1] e dpi")
+    if not pdf_name:
+        raise HTTPException(status_code=400, detail="Nome do PDF não fornecido")
+
+    pdf_path = _resolver_pdf_local(pdf_name, request)
+    try:
+        dados = await asyncio.to_thread(renderizar_recorte, pdf_path, pagina, rect, dpi)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Erro ao renderizar região da página {pagina}: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao renderizar a região")
+
+    try:
+        base_name = (request_data.get('filename') or f"img_capture_{int(time.time()*1000)}.png").replace('\\', '_').replace('/', '_')
+        if not base_name.lower().endswith('.png'):
+            base_name = base_name + ".png"
+        dest_dir = os.path.join(UPLOAD_DIR, "capturas_de_tela")
+        os.makedirs(dest_dir, exist_ok=True)
+        save_path = os.path.join(dest_dir, base_name)
+        with open(save_path, 'wb') as f:
+            f.write(dados)
+        try:
+            await asyncio.to_thread(upload_local_file, "temp_uploads/capturas_de_tela", save_path, base_name)
+        except HTTPException as e:
+            print(f"[WARN] Cloud Storage indisponível; captura mantida apenas em disco local: {e}")
+
+        _registrar_captura_na_estrutura(base_name)
+        user = _usuario_opcional(request)
+        if user:
+            registro = await asyncio.to_thread(_registro_de_arquivo, save_path, user['user_id'], "capture", f"temp_uploads/capturas_de_tela/{base_name}", _pdf_hash_atual())
+            registro["page"] = pagina
+            registro["pdf_name"] = pdf_name
+            await _registrar_imagens_no_banco([registro])
+        return {"filename": base_name, "url": f"/temp_uploads/capturas_de_tela/{base_name}", "bytes": len(dados)}
+    except Exception as e:
+        print(f"Erro ao salvar captura renderizada: {e}")
+        raise HTTPException(status_code=500, detail="Falha ao salvar imagem capturada")
+
 # --- ROTAS: Uploads de imagens enviadas pelo usuário ---
 @app.post("/api/uploads/upload")
-async def uploads_upload(file: UploadFile = File(...)):
+async def uploads_upload(request: Request, file: UploadFile = File(...)):
     try:
         # Normalizar nome e aplicar duplicação por conflito
         safe_name = (file.filename or f"upload_{int(time.time()*1000)}").replace('\\', '_').replace('/', '_')
@@ -1400,6 +2001,9 @@ async def uploads_upload(file: UploadFile = File(...)):
             with open(save_path, 'wb') as f:
                 shutil.copyfileobj(file.file, f)
 
+        user = _usuario_opcional(request)
+        if user:
+            await _registrar_imagens_no_banco([_registro_de_upload(file, user['user_id'], "upload", f"temp_uploads/Imagens_de_Uploads/{candidate}")])
         return {"filename": candidate, "url": f"/temp_uploads/Imagens_de_Uploads/{candidate}"}
     except HTTPException:
         raise
@@ -1408,7 +2012,7 @@ async def uploads_upload(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Falha ao salvar imagem enviada")
 
 @app.post("/api/uploads/delete")
-async def uploads_delete(request_data: dict = Body(default={})):  # { filename: str }
+async def uploads_delete(request: Request, request_data: dict = Body(default={})):  # { filename: str }
     try:
         filename = (request_data or {}).get("filename")
         if not filename or not isinstance(filename, str):
@@ -1427,6 +2031,7 @@ async def uploads_delete(request_data: dict = Body(default={})):  # { filename:
                 os.remove(target)
             except Exception:
                 pass
+        await _excluir_imagens_do_banco(_usuario_opcional(request), "upload", [safe])
         return {"status": "ok"}
     except HTTPException:
         raise
@@ -1435,7 +2040,7 @@ async def uploads_delete(request_data: dict = Body(default={})):  # { filename:
         raise HTTPException(status_code=500, detail="Falha ao excluir upload")
 
 @app.post("/api/uploads/delete-all")
-async def uploads_delete_all():
+async def uploads_delete_all(request: Request):
     try:
         # Excluir no GCS
         try:
@@ -1453,6 +2058,7 @@ async def uploads_delete_all():
                         os.remove(os.path.join(dest_dir, f))
                     except Exception:
                         pass
+        await _excluir_imagens_do_banco(_usuario_opcional(request), "upload")
         return {"status": "ok"}
     except Exception as e:
         print(f"Erro ao excluir todos os uploads: {e}")
@@ -1460,7 +2066,7 @@ async def uploads_delete_all():
 
 # --- ROTA: Reprocessar imagens iniciais do PDF (Somente Fase de Captura) ---
 @app.post("/api/recover-initial-images")
-async def recover_initial_images(request_data: dict = Body(default={})):  # aceita JSON com { pdf_name?: str, force?: bool }
+async def recover_initial_images(request: Request, request_data: dict = Body(default={})):  # aceita JSON com { pdf_name?: str, force?: bool }
     try:
         # Determinar PDF de origem
         pdf_name = (request_data or {}).get("pdf_name")
@@ -1480,6 +2086,7 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
         # Preparar diretórios/arquivos
         imagens_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
         os.makedirs(imagens_dir, exist_ok=True)
+        await cancelar_extracao_em_andamento(imagens_dir)
         
         # Limpeza condicional: só limpar quando forçarmos ou ao mudar de PDF
         force = bool((request_data or {}).get("force"))
@@ -1502,7 +2109,7 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
 
             if force or pdf_changed:
                 for f in os.listdir(imagens_dir):
-                    if f.lower().endswith('.png') or f == 'imagens_info.json':
+                    if eh_imagem_extraida(f) or f.lower().endswith(('.gif', EXTENSAO_WEBP)) or f == 'imagens_info.json':
                         try:
                             os.remove(os.path.join(imagens_dir, f))
                         except Exception:
@@ -1510,18 +2117,17 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
         except Exception as e:
             print(f"Falha ao avaliar/limpar imagens anteriores: {e}")
 
-        # Converter PDF -> HTML temporário
-        from pdf_for_html import converter_pdf_para_html_simples
+        # Extrair imagens do PDF (via xrefs ou HTML temporário, conforme MODO_EXTRACAO_IMAGENS)
+        # (PDFs já processados são restaurados do cache de extração pelo SHA-256)
+        from main_pipeline import extrair_imagens_do_pdf, hash_pdf_para_cache, ARQUIVO_TEXTO_EXTRAIDO
         temp_html_path = os.path.join(UPLOAD_DIR, "temp_doc.html")
-        resultado = converter_pdf_para_html_simples(pdf_path, temp_html_path)
-        if not resultado or not resultado[0]:
+        texto_path = os.path.join(UPLOAD_DIR, ARQUIVO_TEXTO_EXTRAIDO)
+        fase_com_erro, _ = await asyncio.to_thread(extrair_imagens_do_pdf, pdf_path, imagens_dir, temp_html_path, texto_path)
+        if fase_com_erro == 1:
             raise HTTPException(status_code=500, detail="Falha na conversão do PDF para HTML")
-
-        # Capturar imagens do HTML
-        from captura_imagens_do_html import capturar_imagens_do_corpo_html
-        ok = capturar_imagens_do_corpo_html(temp_html_path, imagens_dir)
-        if not ok:
+        if fase_com_erro == 2:
             raise HTTPException(status_code=500, detail="Falha na captura das imagens do HTML")
+        pdf_hash = await asyncio.to_thread(hash_pdf_para_cache, pdf_path)
 
         # Atualizar estrutura_edicao.json (opcional, para consistência)
         estrutura_path = os.path.join(UPLOAD_DIR, "estrutura_edicao.json")
@@ -1533,11 +2139,12 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
         except Exception:
             estrutura = {}
         try:
-            imagens = [f for f in os.listdir(imagens_dir) if f.lower().endswith('.png')]
+            imagens = [f for f in os.listdir(imagens_dir) if eh_imagem_extraida(f)]
             estrutura["images"] = imagens
             estrutura["upload_dir"] = UPLOAD_DIR
             estrutura["pdf_name"] = os.path.basename(pdf_path)
             estrutura["pdf_path"] = pdf_path
+            estrutura["pdf_hash"] = pdf_hash
             info_file_path = os.path.join(imagens_dir, 'imagens_info.json')
             if os.path.exists(info_file_path):
                 with open(info_file_path, 'r', encoding='utf-8') as f:
@@ -1547,11 +2154,21 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
         except Exception as e:
             print(f"Aviso: não foi possível atualizar estrutura_edicao.json: {e}")
 
+        # Substituir os registros da tabela images pelos da nova extração (numeração pode ter mudado)
+        user = _usuario_opcional(request)
+        if user:
+            user_prefix = f"uploads/{user['user_id']}"
+            base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            enviadas = await asyncio.to_thread(_enviar_imagens_extraidas_para_gcs, imagens_dir, user_prefix, base_name)
+            if pdf_hash:
+                await _excluir_imagens_do_banco(user, "extracted", pdf_hash=pdf_hash)
+            await _registrar_imagens_no_banco(_registros_imagens_extraidas(imagens_dir, user['user_id'], user_prefix, base_name, os.path.basename(pdf_path), pdf_hash, enviadas))
+
         # Responder com resumo
         return {
             "status": "ok",
             "pdf_name": os.path.basename(pdf_path),
-            "images_count": len([f for f in os.listdir(imagens_dir) if f.lower().endswith('.png')])
+            "images_count": len([f for f in os.listdir(imagens_dir) if eh_imagem_extraida(f)])
         }
     except HTTPException:
         raise
@@ -1561,9 +2178,11 @@ async def recover_initial_images(request_data: dict = Body(default={})):  # acei
 
 # --- ROTA: Deletar TODAS as imagens físicas da pasta imagens_extraidas ---
 @app.post("/api/delete-all-images")
-async def api_delete_all_images():
+async def api_delete_all_images(request: Request):
     try:
+        pdf_hash = _pdf_hash_atual()
         imagens_dir = os.path.join(UPLOAD_DIR, "imagens_extraidas")
+        await cancelar_extracao_em_andamento(imagens_dir)
         if os.path.isdir(imagens_dir):
             for f in os.listdir(imagens_dir):
                 try:
@@ -1587,6 +2206,8 @@ async def api_delete_all_images():
         except Exception as e:
             print(f"Aviso: falha ao atualizar estrutura_edicao.json na deleção: {e}")
 
+        if pdf_hash:
+            await _excluir_imagens_do_banco(_usuario_opcional(request), "extracted", pdf_hash=pdf_hash)
         return {"status": "ok", "deleted_all": True}
     except Exception as e:
         print(f"Erro ao deletar todas as imagens: {e}")
@@ -1596,6 +2217,12 @@ async def api_delete_all_images():
 async def uploads_list(request: Request):
     user = require_user(request)
     try:
+        # Uploads registrados na tabela images: uma consulta, sem listar o diretório nem o bucket
+        registros = await _listar_imagens_do_banco(user, "upload")
+        if registros:
+            images = [_item_de_registro({"filename": r["name"], "url": _url_de_registro(r)}, r) for r in registros]
+            return {"images": images, "count": len(images)}
+
         images = []
         # Primeiro listar localmente para evitar timeouts
         try:
@@ -1682,6 +2309,20 @@ async def on_startup():
         print("Schema ensured via Cloud SQL Connector")
     except Exception as e:
         print(f"ensure_schema failed: {e}")
+    # Subir os workers de renderização do PDF final em segundo plano (aquecidos antes do primeiro pedido)
+    from pool_renderizacao import iniciar_pool
+    tarefa = asyncio.create_task(asyncio.to_thread(iniciar_pool))
+    _tarefas_em_segundo_plano.add(tarefa)
+    tarefa.add_done_callback(_tarefas_em_segundo_plano.discard)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Fechar os documentos PDF mantidos abertos pelo pool
+    from pool_documentos import fechar_todos
+    fechar_todos()
+    from pool_renderizacao import encerrar_pool
+    encerrar_pool()
 
 
 @app.get("/health/db")
@@ -1,6 +1,8 @@
 import os
 import fitz
 import json
+import asyncio
+from typing import Awaitable, Callable, Optional, Union
 from dotenv import load_dotenv
 from fastapi import WebSocket
 import logging
@@ -27,7 +29,16 @@ API_KEY = os.environ.get("GEMINI_API_KEY")
 # --- IMPORTS FUNCIONAIS (MÓDULOS DE FASE) ---
 from pdf_for_html import converter_pdf_para_html_simples 
 from captura_imagens_do_html import capturar_imagens_do_corpo_html
+from captura_imagens_do_pdf import capturar_imagens_do_pdf, iterar_paginas_pdf, iterar_paginas_pdf_paralelo
 from gerador_pdf_final import executar_fase_final 
+from cache_extracao import calcular_hash_pdf, restaurar_extracao, salvar_extracao
+from indice_texto import indexar_texto_do_pdf
+from formatos_imagem import LIMITES_DIMENSAO_PADRAO, LimitesDimensao, eh_imagem_extraida, IMAGENS_WEBP_ATIVO, IMAGENS_WEBP_LADO_MAX, IMAGENS_WEBP_QUALIDADE
+from conteudo_imagem import (
+    CONTEUDO_UNIFORME_ATIVO, CONTEUDO_DESVIO_MIN, CONTEUDO_ENTROPIA_MIN, CONTEUDO_FRACAO_MIN, CONTEUDO_TOLERANCIA_FUNDO,
+    RECORTE_BORDAS_ATIVO, RECORTE_BORDAS_FRACAO_MIN, RECORTE_BORDAS_JPEG_FRACAO_MIN, IMAGENS_LQIP_ATIVO, IMAGENS_LQIP_LADO,
+)
+from deduplicacao_perceptual import DEDUP_PERCEPTUAL_ATIVO, DEDUP_PERCEPTUAL_DISTANCIA
 
 
 # --- CONFIGURAÇÕES GLOBAIS DE NOMES DE ARQUIVO INTERNOS ---
@@ -36,6 +47,224 @@ ARQUIVO_MAPA_DESCRICOES = "mapa_descricoes.json"
 ARQUIVO_RESUMO_FINAL_TAGGED = "resumo_com_tags_final.txt"
 ARQUIVO_PDF_FINAL_NAME = "Resumo_Final_Com_Prints.pdf"
 PASTA_IMAGENS_NOME = "imagens_extraidas" # Nome da subpasta de saída de imagens
+ARQUIVO_TEXTO_EXTRAIDO = "texto_extraido_pdf.txt" # Texto puro do PDF, gravado página a página
+
+# Modo de extração das imagens (Fases 1 e 2):
+#   "xref" -> lê as imagens direto dos xrefs do PDF (sem HTML/base64 intermediário)
+#   "paralelo" -> igual ao "xref", com as páginas divididas entre processos
+#                 (EXTRACAO_WORKERS / EXTRACAO_PAGINAS_POR_BLOCO em captura_imagens_do_pdf.py)
+#   "html" -> fluxo legado: PDF -> XHTML (temp_doc.html) -> captura via BeautifulSoup
+MODO_EXTRACAO_IMAGENS = os.environ.get("MODO_EXTRACAO_IMAGENS", "xref").strip().lower()
+
+# Conversão preguiçosa para PDFs grandes (modos "xref" e "paralelo"): com N > 0, o editor é liberado
+# após as N primeiras páginas e as demais são processadas em segundo plano. A marca d'água de
+# páginas prontas fica em <pasta de imagens>/paginas_prontas.json (respeitada por /api/pdf-images/list).
+EXTRACAO_PAGINAS_INICIAIS = int(os.environ.get("EXTRACAO_PAGINAS_INICIAIS", "0") or 0)
+ARQUIVO_PAGINAS_PRONTAS = "paginas_prontas.json"
+# Tasks das extrações que continuam em segundo plano, por pasta de imagens
+_extracoes_em_segundo_plano = {}
+
+# Versão do formato de saída das Fases 1 e 2. Incrementar sempre que imagens_info.json ou os
+# arquivos gerados mudarem, para invalidar o cache de extração (cache_extracao.py).
+VERSAO_EXTRACAO = 8
+
+
+def versao_extracao(limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO) -> str:
+    # "xref" e "paralelo" geram exatamente a mesma saída
+    modo = "html" if MODO_EXTRACAO_IMAGENS == "html" else "xref"
+    # Os limites do filtro por dimensões (os da extração) mudam quais imagens são mantidas
+    # A deduplicação perceptual (e sua distância) muda quais quase-duplicatas são descartadas
+    dedup = f"dhash{DEDUP_PERCEPTUAL_DISTANCIA}" if DEDUP_PERCEPTUAL_ATIVO else "sem-dhash"
+    # Descarte de imagens uniformes e recorte de bordas mudam as imagens gravadas
+    if CONTEUDO_UNIFORME_ATIVO:
+        uniforme = f"uniforme{CONTEUDO_DESVIO_MIN:g}-{CONTEUDO_ENTROPIA_MIN:g}-{CONTEUDO_FRACAO_MIN:g}-{CONTEUDO_TOLERANCIA_FUNDO}"
+    else:
+        uniforme = "sem-uniforme"
+    if RECORTE_BORDAS_ATIVO:
+        recorte = f"recorte{RECORTE_BORDAS_FRACAO_MIN:g}-{RECORTE_BORDAS_JPEG_FRACAO_MIN:g}-{CONTEUDO_TOLERANCIA_FUNDO}"
+    else:
+        recorte = "sem-recorte"
+    # Cópias WebP e LQIP são gravadas junto com as imagens (arquivos e imagens_info.json)
+    webp = f"webp{IMAGENS_WEBP_LADO_MAX}-{IMAGENS_WEBP_QUALIDADE}" if IMAGENS_WEBP_ATIVO else "sem-webp"
+    lqip = f"lqip{IMAGENS_LQIP_LADO}" if IMAGENS_LQIP_ATIVO else "sem-lqip"
+    return (f"{modo}-v{VERSAO_EXTRACAO}-{limites.lado_min}-{limites.area_min}-{limites.proporcao_max:g}"
+            f"-{dedup}-{uniforme}-{recorte}-{webp}-{lqip}")
+
+
+def hash_pdf_para_cache(caminho_pdf: Union[str, bytes, memoryview]):
+    """SHA-256 do PDF para o cache de extração; None se não for possível calcular."""
+    try:
+        return calcular_hash_pdf(caminho_pdf)
+    except Exception as e:
+        print(f"[CACHE] Não foi possível calcular o hash do PDF: {e}")
+        return None
+
+
+# --- FUNÇÃO AUXILIAR: FASES 1 E 2 (EXTRAÇÃO DE TEXTO E IMAGENS) ---
+def extrair_imagens_do_pdf(caminho_pdf: Union[str, bytes, memoryview], caminho_pasta_imagens: str, caminho_html_temp: str, caminho_texto_saida: str, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO):
+    """
+    Executa as Fases 1 e 2 conforme MODO_EXTRACAO_IMAGENS, consultando antes o cache de
+    extração pelo SHA-256 do PDF. O texto puro do PDF é gravado em caminho_texto_saida.
+    limites é o filtro por dimensões desta extração (também faz parte da chave do cache).
+    Retorna uma tupla: (fase_com_erro, texto_extraido_do_pdf); fase_com_erro é None em caso de sucesso.
+    """
+    pdf_hash = hash_pdf_para_cache(caminho_pdf)
+    if pdf_hash and restaurar_extracao(pdf_hash, caminho_pasta_imagens, caminho_texto_saida, versao_extracao(limites)):
+        registrar_paginas_prontas(caminho_pasta_imagens, None, None, True)
+        with open(caminho_texto_saida, 'r', encoding='utf-8') as f:
+            return None, f.read()
+
+    if MODO_EXTRACAO_IMAGENS == "html":
+        resultado_conversao = converter_pdf_para_html_simples(caminho_pdf, caminho_html_temp, pdf_hash=pdf_hash)
+        if not resultado_conversao or not resultado_conversao[0]:
+            return 1, None
+        if not capturar_imagens_do_corpo_html(caminho_html_temp, caminho_pasta_imagens, limites):
+            return 2, None
+        texto_pdf = resultado_conversao[1]
+    else:
+        sucesso, texto_pdf = capturar_imagens_do_pdf(caminho_pdf, caminho_pasta_imagens, paralelo=(MODO_EXTRACAO_IMAGENS == "paralelo"), pdf_hash=pdf_hash, limites=limites)
+        if not sucesso:
+            return 1, None
+
+    with open(caminho_texto_saida, 'w', encoding='utf-8') as f:
+        f.write(texto_pdf or "")
+    registrar_paginas_prontas(caminho_pasta_imagens, None, None, True)
+    if pdf_hash:
+        salvar_extracao(pdf_hash, caminho_pasta_imagens, caminho_texto_saida, versao_extracao(limites))
+    return None, texto_pdf
+
+
+def registrar_paginas_prontas(caminho_pasta_imagens: str, paginas_prontas: Optional[int], total_paginas: Optional[int], concluido: bool) -> None:
+    """Grava (de forma atômica) a marca d'água de páginas já processadas da extração em curso."""
+    os.makedirs(caminho_pasta_imagens, exist_ok=True)
+    caminho = os.path.join(caminho_pasta_imagens, ARQUIVO_PAGINAS_PRONTAS)
+    with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"paginas_prontas": paginas_prontas, "total_paginas": total_paginas, "concluido": concluido}, f)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def ler_paginas_prontas(caminho_pasta_imagens: str) -> Optional[dict]:
+    """Marca d'água da extração; None quando não há registro (extração antiga, tratada como concluída)."""
+    try:
+        with open(os.path.join(caminho_pasta_imagens, ARQUIVO_PAGINAS_PRONTAS), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def extracao_em_andamento(caminho_pasta_imagens: str) -> Optional[asyncio.Task]:
+    """Task que ainda processa as páginas restantes em segundo plano (modo com páginas iniciais)."""
+    tarefa = _extracoes_em_segundo_plano.get(os.path.abspath(caminho_pasta_imagens))
+    return tarefa if tarefa and not tarefa.done() else None
+
+
+async def cancelar_extracao_em_andamento(caminho_pasta_imagens: str) -> None:
+    """
+    Cancela e aguarda a extração em segundo plano que ainda grava em caminho_pasta_imagens.
+    Chamar antes de limpar ou regravar a pasta (novo upload, recuperação, exclusão).
+    """
+    tarefa = _extracoes_em_segundo_plano.pop(os.path.abspath(caminho_pasta_imagens), None)
+    if not tarefa or tarefa.done():
+        return
+    tarefa.cancel()
+    # asyncio.wait não propaga o CancelledError da task (só o de quem chamou)
+    await asyncio.wait([tarefa])
+    print(f"[FASE 1-2/4] Extração em segundo plano cancelada: {caminho_pasta_imagens}")
+
+
+async def extrair_imagens_do_pdf_em_fluxo(caminho_pdf: Union[str, bytes, memoryview], caminho_pasta_imagens: str, caminho_texto_saida: str, manager: ConnectionManager, pdf_hash: Optional[str] = None, paginas_iniciais: int = 0, ao_concluir: Optional[Callable[[], Awaitable[None]]] = None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO) -> bool:
+    """
+    Fases 1 e 2 em fluxo (modos "xref" e "paralelo"): consome os eventos por página em uma
+    thread auxiliar, grava o texto incrementalmente em caminho_texto_saida e envia um evento
+    de progresso por página (com as imagens novas) sem bloquear o loop de eventos.
+    A marca d'água de páginas prontas (paginas_prontas.json) é atualizada a cada página.
+    Com paginas_iniciais > 0, retorna assim que essas páginas estiverem prontas e continua as
+    demais em segundo plano; ao_concluir é aguardado quando todas as páginas terminarem.
+    """
+    if MODO_EXTRACAO_IMAGENS == "paralelo":
+        paginas = iterar_paginas_pdf_paralelo(caminho_pdf, caminho_pasta_imagens, pdf_hash=pdf_hash, limites=limites, paginas_iniciais=paginas_iniciais)
+    else:
+        paginas = iterar_paginas_pdf(caminho_pdf, caminho_pasta_imagens, pdf_hash=pdf_hash, limites=limites, paginas_iniciais=paginas_iniciais)
+    registrar_paginas_prontas(caminho_pasta_imagens, 0, None, False)
+    f_texto = open(caminho_texto_saida, 'w', encoding='utf-8')
+
+    async def _consumir(limite: int, em_segundo_plano: bool) -> bool:
+        """Processa páginas até o limite (0 = todas). Retorna True quando o PDF terminou."""
+        while True:
+            proxima = asyncio.ensure_future(asyncio.to_thread(next, paginas, None))
+            try:
+                evento = await asyncio.shield(proxima)
+            except asyncio.CancelledError:
+                # A página em andamento termina na thread; só então o gerador pode ser fechado
+                await asyncio.wait([proxima])
+                raise
+            if evento is None:
+                return True
+            f_texto.write(evento["texto"] + "\n")
+            f_texto.flush()
+
+            pagina, total = evento["pagina"], evento["total_paginas"]
+            registrar_paginas_prontas(caminho_pasta_imagens, pagina, total, pagina >= total)
+            if em_segundo_plano:
+                mensagem = {
+                    "progress": 100,
+                    "status": f"Páginas restantes: {pagina}/{total} processadas em segundo plano.",
+                }
+            else:
+                mensagem = {
+                    "progress": 5 + int(45 * pagina / max(total, 1)),
+                    "status": f"Fases 1-2/4: Página {pagina}/{total} processada.",
+                }
+            mensagem.update({
+                "page": pagina,
+                "total_pages": total,
+                "pages_ready": pagina,
+                "new_images": evento["novas_imagens"],
+            })
+            await manager.send_message(json.dumps(mensagem, ensure_ascii=False))
+            if limite and pagina >= limite and pagina < total:
+                return False
+
+    def _encerrar():
+        paginas.close()
+        f_texto.close()
+
+    try:
+        concluido = await _consumir(paginas_iniciais, em_segundo_plano=False)
+    except Exception as e:
+        print(f"❌ Erro na extração em fluxo do PDF: {e}")
+        _encerrar()
+        return False
+    if concluido:
+        _encerrar()
+        if ao_concluir:
+            await ao_concluir()
+        return True
+
+    async def _restante():
+        try:
+            await _consumir(0, em_segundo_plano=True)
+        except Exception as e:
+            print(f"❌ Erro na extração em segundo plano do PDF: {e}")
+            await manager.send_message("{\"progress\": -1, \"status\": \"Erro ao processar as páginas restantes do PDF.\"}")
+            return
+        finally:
+            _encerrar()
+        print(f"[FASE 1-2/4] Páginas restantes concluídas em segundo plano: {caminho_pasta_imagens}")
+        if ao_concluir:
+            await ao_concluir()
+
+    print(f"[FASE 1-2/4] {paginas_iniciais} páginas iniciais prontas; restante em segundo plano.")
+    chave = os.path.abspath(caminho_pasta_imagens)
+    tarefa = asyncio.create_task(_restante())
+    _extracoes_em_segundo_plano[chave] = tarefa
+
+    def _remover_registro(t: asyncio.Task) -> None:
+        if _extracoes_em_segundo_plano.get(chave) is t:
+            del _extracoes_em_segundo_plano[chave]
+
+    tarefa.add_done_callback(_remover_registro)
+    return True
 
 
 # --- FUNÇÃO AUXILIAR: EXTRAÇÃO DE TÍTULO ---
@@ -56,13 +285,20 @@ def extrair_titulo_do_resumo(caminho_resumo: str) -> str:
 
 # --- FUNÇÃO DE ORQUESTRAÇÃO PRINCIPAL (Para o FastAPI) ---
 
-async def start_full_processing(caminho_pdf_input: str, caminho_resumo_input: str, upload_dir: str, arquivo_pdf_output_name: str, manager: ConnectionManager):
+async def start_full_processing(caminho_pdf_input: Union[str, bytes, memoryview], caminho_resumo_input: str, upload_dir: str, arquivo_pdf_output_name: str, manager: ConnectionManager, caminho_pdf_salvo: Optional[str] = None, limites: LimitesDimensao = LIMITES_DIMENSAO_PADRAO, pdf_hash: Optional[str] = None):
+    # caminho_pdf_input pode ser o caminho do PDF ou um buffer já em memória (bytes/memoryview do upload),
+    # aberto com fitz.open(stream=...). Nesse caso, caminho_pdf_salvo indica onde a cópia em disco
+    # está sendo gravada em paralelo (usado apenas no manifesto de limpeza).
+    # limites é o filtro por dimensões das imagens desta extração (formatos_imagem.limites_da_extracao).
+    # pdf_hash evita recalcular o SHA-256 quando o chamador já o tem.
         
     # Lista para armazenar caminhos de arquivos/diretórios temporários para limpeza
     temp_files_to_clean = []
     
     # --- DEFINIÇÃO DOS CAMINHOS TEMPORÁRIOS COMPLETOS ---
-    temp_files_to_clean.append(os.path.relpath(caminho_pdf_input, upload_dir))
+    caminho_pdf_manifesto = caminho_pdf_input if isinstance(caminho_pdf_input, str) else caminho_pdf_salvo
+    if caminho_pdf_manifesto:
+        temp_files_to_clean.append(os.path.relpath(caminho_pdf_manifesto, upload_dir))
     temp_files_to_clean.append(os.path.relpath(caminho_resumo_input, upload_dir))
 
     caminho_mapa_desc = os.path.join(upload_dir, ARQUIVO_MAPA_DESCRICOES)
@@ -81,6 +317,8 @@ async def start_full_processing(caminho_pdf_input: str, caminho_resumo_input: st
     # ------------------------------------------------------------------------
     CAMINHO_HTML_TEMP = os.path.join(upload_dir, "temp_doc.html")
     temp_files_to_clean.append(os.path.relpath(CAMINHO_HTML_TEMP, upload_dir))
+    caminho_texto_extraido = os.path.join(upload_dir, ARQUIVO_TEXTO_EXTRAIDO)
+    temp_files_to_clean.append(os.path.relpath(caminho_texto_extraido, upload_dir))
 
     # Obter o contexto do título
     contexto_titulo = extrair_titulo_do_resumo(caminho_resumo_input)
@@ -92,24 +330,43 @@ async def start_full_processing(caminho_pdf_input: str, caminho_resumo_input: st
     await manager.send_message("{\"progress\": 0, \"status\": \"Iniciando processamento...\"}") # Início
 
 
-    # --- FASE 1: CONVERTER PDF -> HTML ---
-    print("\n[FASE 1/4] Convertendo PDF para HTML simples...")
-    await manager.send_message("{\"progress\": 5, \"status\": \"Fase 1/4: Convertendo PDF para HTML...\"}")
-    resultado_conversao = converter_pdf_para_html_simples(caminho_pdf_input, CAMINHO_HTML_TEMP)
-    if not resultado_conversao or not resultado_conversao[0]:
+    # --- FASES 1 E 2: EXTRAIR TEXTO E CAPTURAR IMAGENS ---
+    print("\n[FASE 1/4] Extraindo conteúdo do PDF...")
+    await manager.send_message("{\"progress\": 5, \"status\": \"Fase 1/4: Extraindo texto e imagens do PDF...\"}")
+    if not pdf_hash:
+        pdf_hash = await asyncio.to_thread(hash_pdf_para_cache, caminho_pdf_input)
+    # Uma extração anterior ainda em segundo plano gravaria na mesma pasta
+    await cancelar_extracao_em_andamento(caminho_pasta_imagens)
+
+    async def _finalizar_extracao():
+        # Registrar no cache e indexar o texto (busca no documento) quando todas as páginas estiverem prontas
+        if pdf_hash:
+            await asyncio.to_thread(salvar_extracao, pdf_hash, caminho_pasta_imagens, caminho_texto_extraido, versao_extracao(limites))
+        await asyncio.to_thread(indexar_texto_do_pdf, caminho_pdf_input, pdf_hash)
+
+    if pdf_hash and await asyncio.to_thread(restaurar_extracao, pdf_hash, caminho_pasta_imagens, caminho_texto_extraido, versao_extracao(limites)):
+        await manager.send_message("{\"progress\": 45, \"status\": \"Fases 1-2/4: PDF já processado, imagens recuperadas do cache.\"}")
+        registrar_paginas_prontas(caminho_pasta_imagens, None, None, True)
+        await asyncio.to_thread(indexar_texto_do_pdf, caminho_pdf_input, pdf_hash)
+        fase_com_erro = None
+    elif MODO_EXTRACAO_IMAGENS == "html":
+        fase_com_erro, _ = await asyncio.to_thread(extrair_imagens_do_pdf, caminho_pdf_input, caminho_pasta_imagens, CAMINHO_HTML_TEMP, caminho_texto_extraido, limites)
+        if fase_com_erro is None:
+            await asyncio.to_thread(indexar_texto_do_pdf, caminho_pdf_input, pdf_hash)
+    else:
+        # Com EXTRACAO_PAGINAS_INICIAIS > 0, segue para a Fase 3 após as primeiras páginas
+        sucesso = await extrair_imagens_do_pdf_em_fluxo(
+            caminho_pdf_input, caminho_pasta_imagens, caminho_texto_extraido, manager, pdf_hash,
+            paginas_iniciais=EXTRACAO_PAGINAS_INICIAIS, ao_concluir=_finalizar_extracao, limites=limites,
+        )
+        fase_com_erro = None if sucesso else 1
+    if fase_com_erro == 1:
         await manager.send_message("{\"progress\": -1, \"status\": \"Erro na Fase 1: Falha na conversão para HTML.\"}")
         return False
-    
-    await manager.send_message("{\"progress\": 25, \"status\": \"Fase 1/4 Concluída.\"}")
-    
-    
-    # --- FASE 2: FILTRAR E CAPTURAR IMAGENS ---
-    print("\n[FASE 2/4] Capturando imagens do corpo HTML...")
-    await manager.send_message("{\"progress\": 25, \"status\": \"Fase 2/4: Capturando imagens do HTML...\"}")
-    if not capturar_imagens_do_corpo_html(CAMINHO_HTML_TEMP, caminho_pasta_imagens):
+    if fase_com_erro == 2:
         await manager.send_message("{\"progress\": -1, \"status\": \"Erro na Fase 2: Falha na captura de imagens do HTML.\"}")
         return False
-    await manager.send_message("{\"progress\": 50, \"status\": \"Fase 2/4 Concluída.\"}")
+    await manager.send_message("{\"progress\": 50, \"status\": \"Fases 1-2/4 Concluídas.\"}")
 
 
     # --- FASE 3: INTERFACE DE EDIÇÃO SEMÂNTICA ---
@@ -120,12 +377,14 @@ async def start_full_processing(caminho_pdf_input: str, caminho_resumo_input: st
     estrutura_edicao = {
         "images": [],
         "resumo_text": "",
-        "upload_dir": upload_dir
+        "upload_dir": upload_dir,
+        # Identifica o PDF nos registros da tabela images (db.py)
+        "pdf_hash": pdf_hash
     }
     
     # Carregar lista de imagens
     try:
-        imagens = [f for f in os.listdir(caminho_pasta_imagens) if f.endswith('.png')]
+        imagens = [f for f in os.listdir(caminho_pasta_imagens) if eh_imagem_extraida(f)]
         estrutura_edicao["images"] = imagens
     except Exception as e:
         print(f"❌ Erro ao listar imagens: {e}")
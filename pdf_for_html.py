@@ -1,45 +1,33 @@
 import fitz
 import os
+import re
+from typing import Optional, Union
 
-def converter_pdf_para_html_simples(caminho_pdf: str, caminho_html_saida: str):
+from pool_documentos import emprestar_documento, lock_fitz
+
+# Marca as imagens de cada página com o número da página de origem
+_PADRAO_TAG_IMG = re.compile(r'(<img[^>]*)(>)')
+
+def converter_pdf_para_html_simples(caminho_pdf: Union[str, bytes, memoryview], caminho_html_saida: str, pdf_hash: Optional[str] = None):
     """
-    Converte o PDF para um formato HTML, garantindo que o PyMuPDF gere a saída 
+    Converte o PDF para um formato HTML, garantindo que o PyMuPDF gere a saída
     corretamente, mesmo com versões antigas.
+    Cada página é carregada uma única vez (texto + XHTML) e escrita direto no arquivo
+    de saída, sem acumular o documento inteiro em memória. Aceita caminho ou buffer do PDF;
+    o documento vem do pool de documentos abertos (pdf_hash evita recalcular o SHA-256)
+    e o fitz é travado página a página (ver pool_documentos.lock_fitz).
     Retorna uma tupla: (caminho_html_saida, texto_extraido_do_pdf)
     """
     print("--- FASE A: Convertendo PDF para HTML ---")
-    
+
     try:
-        doc = fitz.open(caminho_pdf)
-        
-        # 1. Extrair texto puro do PDF para análise semântica
-        texto_pdf_completo = ""
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            texto_pdf_completo += page.get_text() + "\n"
-        
-        # 2. Obter o conteúdo do documento em formato de texto estruturado (XHTML/HTML)
-        # Utilizando o método 'save' com 'output="html"' para compatibilidade
-        # doc.save(caminho_html_saida, output="html") # Linha original com erro
-        
-        # Nova abordagem: Extrair o texto como XHTML e salvar manualmente
-        html_content = ""
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            page_xhtml = page.get_text("xhtml")
-            
-            # Adicionar atributo data-page-number às imagens desta página
-            import re
-            page_xhtml = re.sub(
-                r'(<img[^>]*)(>)',
-                rf'\1 data-page-number="{page_num + 1}"\2',
-                page_xhtml
-            )
-            
-            html_content += page_xhtml
+        partes_texto = []
 
-        # Envolver o conteúdo XHTML com tags HTML e BODY para formar um documento HTML completo
-        full_html_document = f"""
+        with emprestar_documento(caminho_pdf, pdf_hash, travar=False) as doc:
+            # Extrair o texto puro (para análise semântica) e o XHTML de cada página em uma só passada.
+            # Nota: doc.save(caminho_html_saida, output="html") não é suportado; o XHTML é salvo manualmente.
+            with open(caminho_html_saida, 'w', encoding='utf-8') as f:
+                f.write("""
 <!DOCTYPE html>
 <html>
 <head>
@@ -47,24 +35,32 @@ def converter_pdf_para_html_simples(caminho_pdf: str, caminho_html_saida: str):
     <title>PDF Content</title>
 </head>
 <body>
-{html_content}
-</body>
-</html>
-"""
+""")
+                with lock_fitz:
+                    total_paginas = doc.page_count
+                for page_num in range(total_paginas):
+                    with lock_fitz:
+                        page = doc.load_page(page_num)
+                        partes_texto.append(page.get_text() + "\n")
+                        xhtml = page.get_text("xhtml")
+                        del page
 
-        with open(caminho_html_saida, 'w', encoding='utf-8') as f:
-             f.write(full_html_document)
+                    # Adicionar atributo data-page-number às imagens desta página
+                    page_xhtml = _PADRAO_TAG_IMG.sub(
+                        rf'\1 data-page-number="{page_num + 1}"\2',
+                        xhtml
+                    )
+                    f.write(page_xhtml)
 
-        # html_content = "Conversão para HTML concluída via doc.save()" # Linha original
-
-        # Já foi salvo pelo doc.save()
-        # with open(caminho_html_saida, 'w', encoding='utf-8') as f:
-        #      f.write(html_content)
+                f.write("""
+</body>
+</html>
+""")
 
         print(f"✅ Conversão concluída. HTML salvo em: {caminho_html_saida}")
-        return caminho_html_saida, texto_pdf_completo.strip()
-        
+        return caminho_html_saida, "".join(partes_texto).strip()
+
     except Exception as e:
         print(f"❌ Erro na conversão para HTML: {e}")
         # Se for um problema de argumento, registra o erro e retorna None
-        return None, None
\ No newline at end of file
+        return None, None
@@ -0,0 +1,216 @@
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from collections import OrderedDict
+from typing import Optional, Union
+
+import fitz
+
+from cache_extracao import calcular_hash_pdf
+from captura_imagens_do_pdf import abrir_pdf
+from utilitarios import flag_do_ambiente
+
+# Pool de documentos fitz abertos, compartilhado por todo o processo e indexado pelo SHA-256
+# do PDF: operações repetidas no mesmo arquivo (tiles, miniaturas, extração, busca) reaproveitam
+# o documento já aberto, sem reprocessar a tabela xref e os object streams a cada chamada.
+# Cada documento é emprestado a um chamador por vez; se estiver em uso, quem pede recebe um
+# documento avulso (aberto e fechado na hora) em vez de ficar esperando.
+# O PyMuPDF não suporta uso simultâneo por várias threads, nem em documentos diferentes: toda
+# chamada ao fitz no processo (abrir, ler, renderizar, fechar) acontece sob lock_fitz. Quem
+# percorre o documento inteiro pede o empréstimo com travar=False e trava página a página,
+# para miniaturas, tiles e buscas não esperarem a extração completa.
+POOL_DOCUMENTOS_ATIVO = flag_do_ambiente("POOL_DOCUMENTOS_ATIVO", True)
+POOL_DOCUMENTOS_MAX = int(os.environ.get("POOL_DOCUMENTOS_MAX", "8"))
+# Teto de memória estimado pelo tamanho dos PDFs abertos (LRU acima do limite)
+POOL_DOCUMENTOS_MAX_MB = float(os.environ.get("POOL_DOCUMENTOS_MAX_MB", "512"))
+# Documentos ociosos por mais tempo que isso são fechados
+POOL_DOCUMENTOS_OCIOSO_S = float(os.environ.get("POOL_DOCUMENTOS_OCIOSO_S", "300"))
+# Quantos hashes de PDF (por caminho, tamanho e mtime) manter memorizados (LRU)
+POOL_DOCUMENTOS_HASHES_MAX = int(os.environ.get("POOL_DOCUMENTOS_HASHES_MAX", "1024"))
+
+FontePdf = Union[str, bytes, memoryview]
+
+
+class _EntradaPool:
+    __slots__ = ("doc", "tamanho", "ultimo_uso", "em_uso")
+
+    def __init__(self, doc: fitz.Document, tamanho: int):
+        self.doc = doc
+        self.tamanho = tamanho
+        self.ultimo_uso = time.monotonic()
+        self.em_uso = False
+
+
+_entradas: "OrderedDict[str, _EntradaPool]" = OrderedDict()
+_lock_pool = threading.Lock()
+_limpeza_iniciada = False
+# Serializa todo uso do fitz no processo (reentrante: um empréstimo aninhado na mesma thread)
+lock_fitz = threading.RLock()
+
+# Memoização do hash por (caminho, tamanho, mtime) para não reler o PDF a cada operação
+_hashes_pdf: "OrderedDict[tuple, str]" = OrderedDict()
+_lock_hashes = threading.Lock()
+
+
+def hash_pdf_memoizado(caminho_pdf: str) -> str:
+    st = os.stat(caminho_pdf)
+    chave = (os.path.abspath(caminho_pdf), st.st_size, st.st_mtime_ns)
+    with _lock_hashes:
+        if chave in _hashes_pdf:
+            _hashes_pdf.move_to_end(chave)
+            return _hashes_pdf[chave]
+    pdf_hash = calcular_hash_pdf(caminho_pdf)
+    with _lock_hashes:
+        _hashes_pdf[chave] = pdf_hash
+        while len(_hashes_pdf) > POOL_DOCUMENTOS_HASHES_MAX:
+            _hashes_pdf.popitem(last=False)
+    return pdf_hash
+
+
+def hash_da_fonte(fonte_pdf: FontePdf) -> str:
+    """SHA-256 do PDF (memorizado para caminhos), como chave do pool."""
+    return hash_pdf_memoizado(fonte_pdf) if isinstance(fonte_pdf, str) else calcular_hash_pdf(fonte_pdf)
+
+
+def _tamanho_fonte(fonte_pdf: FontePdf) -> int:
+    if isinstance(fonte_pdf, str):
+        return os.path.getsize(fonte_pdf)
+    return len(fonte_pdf)
+
+
+def _abrir(fonte_pdf: FontePdf) -> fitz.Document:
+    with lock_fitz:
+        return abrir_pdf(fonte_pdf)
+
+
+def _fechar(doc: fitz.Document) -> None:
+    try:
+        with lock_fitz:
+            doc.close()
+    except Exception as e:
+        print(f"[POOL] Falha ao fechar documento: {e}")
+
+
+def _remover_excedentes() -> list:
+    """Retira do pool (sob _lock_pool) os ociosos vencidos e, acima dos limites, os menos usados."""
+    agora = time.monotonic()
+    removidos = []
+    for chave, entrada in list(_entradas.items()):
+        if not entrada.em_uso and agora - entrada.ultimo_uso > POOL_DOCUMENTOS_OCIOSO_S:
+            removidos.append(_entradas.pop(chave).doc)
+
+    limite = POOL_DOCUMENTOS_MAX_MB * 1024 * 1024
+    total = sum(e.tamanho for e in _entradas.values())
+    for chave, entrada in list(_entradas.items()):  # do menos para o mais recentemente usado
+        if len(_entradas) <= POOL_DOCUMENTOS_MAX and total <= limite:
+            break
+        if entrada.em_uso:
+            continue
+        total -= entrada.tamanho
+        removidos.append(_entradas.pop(chave).doc)
+    return removidos
+
+
+def _iniciar_limpeza_periodica() -> None:
+    global _limpeza_iniciada
+    if _limpeza_iniciada:
+        return
+    _limpeza_iniciada = True
+
+    def _loop():
+        while True:
+            time.sleep(max(POOL_DOCUMENTOS_OCIOSO_S / 2, 1))
+            with _lock_pool:
+                removidos = _remover_excedentes()
+            for doc in removidos:
+                _fechar(doc)
+
+    threading.Thread(target=_loop, name="pool-documentos-limpeza", daemon=True).start()
+
+
+@contextmanager
+def emprestar_documento(fonte_pdf: FontePdf, pdf_hash: Optional[str] = None, travar: bool = True):
+    """
+    Empresta um fitz.Document do pool para uso exclusivo dentro do bloco `with`.
+    fonte_pdf pode ser um caminho ou um buffer; pdf_hash evita recalcular o SHA-256
+    quando o chamador já o conhece. O documento não deve ser fechado pelo chamador.
+    Com travar=True o bloco inteiro roda sob lock_fitz; com travar=False o chamador deve
+    envolver cada uso do documento em `with lock_fitz:`.
+    """
+    if not POOL_DOCUMENTOS_ATIVO:
+        doc = _abrir(fonte_pdf)
+        try:
+            with lock_fitz if travar else nullcontext():
+                yield doc
+        finally:
+            _fechar(doc)
+        return
+
+    if not pdf_hash:
+        pdf_hash = hash_da_fonte(fonte_pdf)
+
+    entrada = None
+    avulso = False
+    with _lock_pool:
+        _iniciar_limpeza_periodica()
+        existente = _entradas.get(pdf_hash)
+        if existente is not None and not existente.em_uso:
+            entrada = existente
+            entrada.em_uso = True
+            _entradas.move_to_end(pdf_hash)
+        elif existente is not None:
+            avulso = True  # Já emprestado a outra thread
+
+    if entrada is None:
+        doc = _abrir(fonte_pdf)
+        if not avulso:
+            with _lock_pool:
+                if pdf_hash in _entradas:
+                    avulso = True  # Outra thread abriu o mesmo PDF ao mesmo tempo
+                else:
+                    entrada = _EntradaPool(doc, _tamanho_fonte(fonte_pdf))
+                    entrada.em_uso = True
+                    _entradas[pdf_hash] = entrada
+        if avulso:
+            try:
+                with lock_fitz if travar else nullcontext():
+                    yield doc
+            finally:
+                _fechar(doc)
+            return
+
+    try:
+        with lock_fitz if travar else nullcontext():
+            yield entrada.doc
+    finally:
+        with _lock_pool:
+            entrada.em_uso = False
+            entrada.ultimo_uso = time.monotonic()
+            removidos = _remover_excedentes()
+        for doc in removidos:
+            _fechar(doc)
+
+
+def descartar_documento(pdf_hash: str) -> bool:
+    """
+    Fecha o documento do pool para pdf_hash, se estiver ocioso (ex.: antes de liberar o buffer
+    em memória de onde ele foi aberto). Retorna False se ainda estiver emprestado.
+    """
+    with _lock_pool:
+        entrada = _entradas.get(pdf_hash)
+        if entrada is None:
+            return True
+        if entrada.em_uso:
+            return False
+        del _entradas[pdf_hash]
+    _fechar(entrada.doc)
+    return True
+
+
+def fechar_todos() -> None:
+    """Fecha todos os documentos ociosos do pool (ex.: no desligamento da aplicação)."""
+    with _lock_pool:
+        removidos = [_entradas.pop(chave).doc for chave, e in list(_entradas.items()) if not e.em_uso]
+    for doc in removidos:
+        _fechar(doc)
@@ -0,0 +1,193 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from typing import Optional
+
+from utilitarios import flag_do_ambiente
+
+# Pool de processos de renderização do PDF final: cada worker é um processo de longa duração
+# que já importou o WeasyPrint, criou a FontConfiguration, analisou a folha de estilos
+# (gerador_pdf_final.CSS_RESUMO) e renderizou um documento de aquecimento. As conversões são
+# despachadas para um worker livre com tempo limite; um worker que estoura o tempo é
+# encerrado, e um que passa do limite de memória é reciclado depois da conversão.
+RENDER_POOL_ATIVO = flag_do_ambiente("RENDER_POOL_ATIVO", True)
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "2"))
+RENDER_TIMEOUT_S = float(os.environ.get("RENDER_TIMEOUT_S", "120"))
+# Memória residente (MB) acima da qual o worker é substituído por um novo
+RENDER_WORKER_MAX_MB = float(os.environ.get("RENDER_WORKER_MAX_MB", "768"))
+# Tempo máximo para um worker novo ficar pronto (importar o WeasyPrint e aquecer)
+RENDER_INICIO_TIMEOUT_S = float(os.environ.get("RENDER_INICIO_TIMEOUT_S", "60"))
+
+_workers_livres: "queue.Queue[_WorkerRender]" = queue.Queue()
+_workers = []
+_lock_pool = threading.Lock()
+_pool_iniciado = False
+
+
+def _memoria_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except Exception:
+        import resource
+        # Sem /proc: pico de memória do processo (KB no Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _laco_do_worker(conexao) -> None:
+    """Processo worker: prepara o WeasyPrint uma vez e atende conversões até receber None."""
+    from gerador_pdf_final import aquecer_renderizacao, converter_html_para_pdf
+    try:
+        aquecer_renderizacao()
+    except Exception as e:
+        print(f"[RENDER] Falha no aquecimento do worker {os.getpid()}: {e}")
+    conexao.send({"pronto": True, "memoria_mb": _memoria_rss_mb()})
+    while True:
+        try:
+            tarefa = conexao.recv()
+        except (EOFError, OSError):
+            break
+        if tarefa is None:
+            break
+        caminho_html, caminho_pdf = tarefa
+        inicio = time.perf_counter()
+        try:
+            sucesso, erro = converter_html_para_pdf(caminho_html, caminho_pdf), None
+        except Exception as e:
+            sucesso, erro = False, str(e)
+        conexao.send({"sucesso": sucesso, "erro": erro, "duracao_s": time.perf_counter() - inicio,
+                      "memoria_mb": _memoria_rss_mb()})
+
+
+class _WorkerRender:
+    def __init__(self):
+        contexto = multiprocessing.get_context("spawn")
+        self.conexao, conexao_filho = contexto.Pipe()
+        # "spawn" evita herdar threads/locks do servidor (uvicorn) via fork
+        self.processo = contexto.Process(target=_laco_do_worker, args=(conexao_filho,), name="render-pdf", daemon=True)
+        self.processo.start()
+        conexao_filho.close()
+
+    def aguardar_pronto(self) -> bool:
+        try:
+            if self.conexao.poll(RENDER_INICIO_TIMEOUT_S):
+                return bool(self.conexao.recv().get("pronto"))
+        except (EOFError, OSError):
+            pass
+        return False
+
+    def converter(self, caminho_html: str, caminho_pdf: str, timeout_s: float) -> Optional[dict]:
+        """Resultado da conversão, ou None se o worker estourou o tempo ou morreu."""
+        try:
+            self.conexao.send((caminho_html, caminho_pdf))
+            if self.conexao.poll(timeout_s):
+                return self.conexao.recv()
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def encerrar(self, forcar: bool = False) -> None:
+        if not forcar:
+            try:
+                self.conexao.send(None)
+                self.processo.join(5)
+            except (EOFError, OSError):
+                pass
+        if self.processo.is_alive():
+            self.processo.kill()
+            self.processo.join(5)
+        self.conexao.close()
+
+
+def _novo_worker(worker: Optional[_WorkerRender] = None) -> Optional[_WorkerRender]:
+    inicio = time.perf_counter()
+    worker = worker or _WorkerRender()
+    if not worker.aguardar_pronto():
+        print("[RENDER] Worker de renderização não ficou pronto; encerrando")
+        worker.encerrar(forcar=True)
+        return None
+    print(f"[RENDER] Worker {worker.processo.pid} pronto em {time.perf_counter() - inicio:.1f}s")
+    return worker
+
+
+def _substituir_worker(antigo: _WorkerRender, forcar: bool) -> None:
+    antigo.encerrar(forcar=forcar)
+    novo = _novo_worker()
+    with _lock_pool:
+        _workers.remove(antigo)
+        if novo:
+            _workers.append(novo)
+    if novo:
+        _workers_livres.put(novo)
+
+
+def iniciar_pool() -> int:
+    """Sobe os workers (uma vez por processo). Retorna quantos ficaram prontos."""
+    global _pool_iniciado
+    with _lock_pool:
+        if _pool_iniciado or not RENDER_POOL_ATIVO or RENDER_WORKERS <= 0:
+            return len(_workers)
+        _pool_iniciado = True
+    # Os processos sobem em paralelo; o aquecimento de cada um é aguardado em seguida
+    for worker in [_WorkerRender() for _ in range(RENDER_WORKERS)]:
+        worker = _novo_worker(worker)
+        if worker:
+            with _lock_pool:
+                _workers.append(worker)
+            _workers_livres.put(worker)
+    return len(_workers)
+
+
+def encerrar_pool() -> None:
+    global _pool_iniciado
+    with _lock_pool:
+        workers = list(_workers)
+        _workers.clear()
+        _pool_iniciado = False
+    while not _workers_livres.empty():
+        try:
+            _workers_livres.get_nowait()
+        except queue.Empty:
+            break
+    for worker in workers:
+        worker.encerrar()
+
+
+def renderizar_pdf(caminho_html: str, caminho_pdf: str, timeout_s: Optional[float] = None) -> bool:
+    """
+    Converte o HTML em PDF em um worker do pool (bloqueia até terminar; chamar via
+    asyncio.to_thread). Sem pool disponível, converte no próprio processo.
+    Lança TimeoutError se a conversão passar de timeout_s (RENDER_TIMEOUT_S).
+    """
+    timeout_s = RENDER_TIMEOUT_S if timeout_s is None else timeout_s
+    iniciar_pool()
+    with _lock_pool:
+        sem_workers = not _workers
+    if sem_workers:
+        from gerador_pdf_final import converter_html_para_pdf
+        return converter_html_para_pdf(caminho_html, caminho_pdf)
+
+    try:
+        worker = _workers_livres.get(timeout=timeout_s)
+    except queue.Empty:
+        raise TimeoutError(f"Nenhum worker de renderização livre em {timeout_s:.0f}s")
+
+    resultado = worker.converter(caminho_html, caminho_pdf, timeout_s)
+    if resultado is None:
+        print(f"[RENDER] Worker {worker.processo.pid} sem resposta em {timeout_s:.0f}s; substituindo")
+        threading.Thread(target=_substituir_worker, args=(worker, True), daemon=True).start()
+        raise TimeoutError(f"Renderização do PDF passou de {timeout_s:.0f}s")
+
+    print(f"[RENDER] PDF renderizado pelo worker {worker.processo.pid} em {resultado['duracao_s']:.2f}s "
+          f"({resultado['memoria_mb']:.0f} MB)")
+    if resultado["erro"]:
+        print(f"[RENDER] Erro na renderização: {resultado['erro']}")
+    if resultado["memoria_mb"] > RENDER_WORKER_MAX_MB:
+        print(f"[RENDER] Worker {worker.processo.pid} acima de {RENDER_WORKER_MAX_MB:.0f} MB; reciclando")
+        threading.Thread(target=_substituir_worker, args=(worker, False), daemon=True).start()
+    else:
+        _workers_livres.put(worker)
+    return bool(resultado["sucesso"])
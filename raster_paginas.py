@@ -0,0 +1,212 @@
+import os
+import io
+import math
+import threading
+from typing import Tuple
+
+import fitz
+from PIL import Image
+
+from pool_documentos import emprestar_documento, hash_pdf_memoizado
+from storage import upload_local_file, download_blob_to_file, blob_exists
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao, flag_do_ambiente
+
+# Serviço de rasterização de páginas: miniaturas e tiles de zoom em WebP, cacheados por
+# hash do PDF, página e nível de zoom (DPI):
+#   <RASTER_CACHE_DIR>/<sha256>/p<pagina>/thumb_<largura>.webp
+#   <RASTER_CACHE_DIR>/<sha256>/p<pagina>/z<dpi>_<tamanho_tile>/<x>_<y>.webp
+# com espelho no GCS em <RASTER_CACHE_PREFIX>/<sha256>/... O cache local é limitado a
+# RASTER_CACHE_MAX_MB (LRU pelo último acesso): no Cloud Run o disco é memória da instância.
+RASTER_CACHE_DIR = os.environ.get("RASTER_CACHE_DIR", os.path.join("temp_uploads", "cache_raster"))
+RASTER_CACHE_MAX_MB = float(os.environ.get("RASTER_CACHE_MAX_MB", "256"))
+RASTER_CACHE_PREFIX = os.environ.get("RASTER_CACHE_PREFIX", "cache/raster").rstrip('/')
+RASTER_CACHE_GCS = flag_do_ambiente("RASTER_CACHE_GCS", True)
+RASTER_LARGURA_MINIATURA = int(os.environ.get("RASTER_LARGURA_MINIATURA", "200"))
+RASTER_TAMANHO_TILE = int(os.environ.get("RASTER_TAMANHO_TILE", "256"))
+RASTER_DPIS = tuple(int(d) for d in os.environ.get("RASTER_DPIS", "72,144,288").split(',') if d.strip())
+RASTER_QUALIDADE_WEBP = int(os.environ.get("RASTER_QUALIDADE_WEBP", "75"))
+# Recortes de região (capturas renderizadas no servidor): limites de DPI e de área em pixels
+RASTER_DPI_RECORTE_MAX = int(os.environ.get("RASTER_DPI_RECORTE_MAX", "600"))
+RASTER_PIXELS_RECORTE_MAX = int(os.environ.get("RASTER_PIXELS_RECORTE_MAX", "40000000"))
+
+_lock_gravacoes = threading.Lock()
+# Bytes gravados desde a última verificação de tamanho: a varredura do cache só roda a cada
+# ~5% do limite, e não a cada miniatura ou tile
+_bytes_desde_expiracao = 0
+
+def _copiar_pixmap(pix: fitz.Pixmap) -> Image.Image:
+    """Cópia do pixmap em uma imagem Pillow (feita sob lock_fitz; a codificação fica fora)."""
+    return Image.frombytes("RGBA" if pix.alpha else "RGB", (pix.width, pix.height), pix.samples)
+
+
+def _imagem_para_webp(img: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format="WEBP", quality=RASTER_QUALIDADE_WEBP, method=4)
+    return buffer.getvalue()
+
+
+def _validar_pagina(doc: fitz.Document, pagina: int) -> fitz.Page:
+    if pagina < 1 or pagina > doc.page_count:
+        raise ValueError(f"Página {pagina} fora do intervalo (1..{doc.page_count})")
+    return doc.load_page(pagina - 1)
+
+
+def grade_de_tiles(largura_pt: float, altura_pt: float, dpi: int) -> Tuple[int, int]:
+    """Quantidade de tiles (colunas, linhas) de uma página em um nível de DPI."""
+    escala = dpi / 72.0
+    return (
+        max(1, math.ceil(largura_pt * escala / RASTER_TAMANHO_TILE)),
+        max(1, math.ceil(altura_pt * escala / RASTER_TAMANHO_TILE)),
+    )
+
+
+def informacoes_do_pdf(caminho_pdf: str) -> dict:
+    """Metadados para o visualizador montar o layout: páginas, tamanhos e grade de tiles por DPI."""
+    pdf_hash = hash_pdf_memoizado(caminho_pdf)
+    paginas = []
+    with emprestar_documento(caminho_pdf, pdf_hash) as doc:
+        for numero in range(doc.page_count):
+            rect = doc.load_page(numero).rect
+            paginas.append({
+                "pagina": numero + 1,
+                "largura": round(rect.width, 2),
+                "altura": round(rect.height, 2),
+                "tiles": {str(dpi): list(grade_de_tiles(rect.width, rect.height, dpi)) for dpi in RASTER_DPIS},
+            })
+    return {
+        "pdf_hash": pdf_hash,
+        "total_paginas": len(paginas),
+        "tamanho_tile": RASTER_TAMANHO_TILE,
+        "dpis": list(RASTER_DPIS),
+        "largura_miniatura": RASTER_LARGURA_MINIATURA,
+        "paginas": paginas,
+    }
+
+
+def _renderizar_miniatura(caminho_pdf: str, pdf_hash: str, pagina: int) -> bytes:
+    with emprestar_documento(caminho_pdf, pdf_hash) as doc:
+        page = _validar_pagina(doc, pagina)
+        escala = RASTER_LARGURA_MINIATURA / max(page.rect.width, 1)
+        img = _copiar_pixmap(page.get_pixmap(matrix=fitz.Matrix(escala, escala), alpha=False))
+        del page
+    return _imagem_para_webp(img)
+
+
+def _renderizar_tile(caminho_pdf: str, pdf_hash: str, pagina: int, dpi: int, x: int, y: int) -> bytes:
+    with emprestar_documento(caminho_pdf, pdf_hash) as doc:
+        page = _validar_pagina(doc, pagina)
+        colunas, linhas = grade_de_tiles(page.rect.width, page.rect.height, dpi)
+        if x < 0 or y < 0 or x >= colunas or y >= linhas:
+            raise ValueError(f"Tile ({x}, {y}) fora da grade {colunas}x{linhas} para {dpi} DPI")
+        escala = dpi / 72.0
+        lado_pt = RASTER_TAMANHO_TILE / escala
+        clip = fitz.Rect(
+            page.rect.x0 + x * lado_pt,
+            page.rect.y0 + y * lado_pt,
+            page.rect.x0 + (x + 1) * lado_pt,
+            page.rect.y0 + (y + 1) * lado_pt,
+        ) & page.rect
+        img = _copiar_pixmap(page.get_pixmap(matrix=fitz.Matrix(escala, escala), clip=clip, alpha=False))
+        del page
+    return _imagem_para_webp(img)
+
+
+def _obter_do_cache_ou_renderizar(pdf_hash: str, relativo: str, renderizar) -> bytes:
+    """Busca no cache local, depois no GCS; em último caso renderiza e grava nos dois níveis."""
+    caminho_local = os.path.join(RASTER_CACHE_DIR, pdf_hash, *relativo.split('/'))
+    if os.path.isfile(caminho_local):
+        try:
+            # Último acesso para a política LRU
+            os.utime(caminho_local)
+            with open(caminho_local, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass  # removido pela expiração entre a verificação e a leitura
+
+    caminho_gcs = f"{RASTER_CACHE_PREFIX}/{pdf_hash}/{relativo}"
+    if RASTER_CACHE_GCS:
+        try:
+            if blob_exists(caminho_gcs):
+                download_blob_to_file(caminho_gcs, caminho_local)
+                with open(caminho_local, 'rb') as f:
+                    dados = f.read()
+                _registrar_gravacao(len(dados))
+                return dados
+        except Exception as e:
+            print(f"[RASTER] Falha ao consultar cache no GCS ({caminho_gcs}): {e}")
+
+    dados = renderizar()
+    os.makedirs(os.path.dirname(caminho_local), exist_ok=True)
+    tmp_path = f"{caminho_local}.tmp-{threading.get_ident()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(dados)
+    os.replace(tmp_path, caminho_local)
+
+    if RASTER_CACHE_GCS:
+        def _enviar():
+            dest_prefix, _, dest_name = caminho_gcs.rpartition('/')
+            try:
+                upload_local_file(dest_prefix, caminho_local, dest_name=dest_name)
+            except Exception as e:
+                print(f"[RASTER] Falha ao enviar {caminho_gcs} para o GCS: {e}")
+        threading.Thread(target=_enviar, daemon=True).start()
+    _registrar_gravacao(len(dados))
+    return dados
+
+
+def _registrar_gravacao(tamanho: int) -> None:
+    global _bytes_desde_expiracao
+    with _lock_gravacoes:
+        _bytes_desde_expiracao += tamanho
+        if _bytes_desde_expiracao < RASTER_CACHE_MAX_MB * 1024 * 1024 / 20:
+            return
+        _bytes_desde_expiracao = 0
+    aplicar_politica_de_expiracao()
+
+
+def aplicar_politica_de_expiracao() -> None:
+    """Acima de RASTER_CACHE_MAX_MB, remove as miniaturas e tiles acessados há mais tempo (LRU)."""
+    removidos = politica_de_expiracao(RASTER_CACHE_DIR, RASTER_CACHE_MAX_MB * 1024 * 1024, recursivo=True)
+    if removidos:
+        print(f"[RASTER] {len(removidos)} arquivos removidos do cache por limite de tamanho")
+
+
+def obter_miniatura(caminho_pdf: str, pagina: int) -> bytes:
+    pdf_hash = hash_pdf_memoizado(caminho_pdf)
+    return _obter_do_cache_ou_renderizar(
+        pdf_hash,
+        f"p{pagina}/thumb_{RASTER_LARGURA_MINIATURA}.webp",
+        lambda: _renderizar_miniatura(caminho_pdf, pdf_hash, pagina),
+    )
+
+
+def obter_tile(caminho_pdf: str, pagina: int, dpi: int, x: int, y: int) -> bytes:
+    if dpi not in RASTER_DPIS:
+        raise ValueError(f"DPI {dpi} não suportado; use um de {list(RASTER_DPIS)}")
+    pdf_hash = hash_pdf_memoizado(caminho_pdf)
+    return _obter_do_cache_ou_renderizar(
+        pdf_hash,
+        f"p{pagina}/z{dpi}_{RASTER_TAMANHO_TILE}/{x}_{y}.webp",
+        lambda: _renderizar_tile(caminho_pdf, pdf_hash, pagina, dpi, x, y),
+    )
+
+
+def renderizar_recorte(caminho_pdf: str, pagina: int, rect: Tuple[float, float, float, float], dpi: int) -> bytes:
+    """
+    Renderiza em PNG apenas a região `rect` (x0, y0, x1, y1 em pontos PDF) da página,
+    na resolução pedida. Substitui a captura de tela feita no navegador.
+    """
+    if dpi < 36 or dpi > RASTER_DPI_RECORTE_MAX:
+        raise ValueError(f"DPI {dpi} fora do intervalo permitido (36..{RASTER_DPI_RECORTE_MAX})")
+    with emprestar_documento(caminho_pdf, hash_pdf_memoizado(caminho_pdf)) as doc:
+        page = _validar_pagina(doc, pagina)
+        clip = fitz.Rect(*rect) & page.rect
+        if clip.is_empty:
+            raise ValueError("Região vazia ou fora da página")
+        escala = dpi / 72.0
+        if clip.width * escala * clip.height * escala > RASTER_PIXELS_RECORTE_MAX:
+            raise ValueError("Região grande demais para a resolução pedida; reduza o DPI ou a área")
+        pix = page.get_pixmap(matrix=fitz.Matrix(escala, escala), clip=clip, alpha=False)
+        dados = pix.tobytes("png")
+        del pix, page
+    return dados
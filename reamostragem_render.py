@@ -0,0 +1,224 @@
+import os
+import re
+import math
+import hashlib
+import threading
+from html.parser import HTMLParser
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utilitarios import aplicar_politica_de_expiracao as politica_de_expiracao, flag_do_ambiente
+
+# Reamostragem das imagens para o PDF final: o tamanho impresso de cada <img> é calculado a
+# partir do layout A4 (CSS_RESUMO) e, quando a imagem tem bem mais pixels do que a resolução
+# alvo precisa, o WeasyPrint recebe uma cópia reduzida em vez do original. As cópias ficam
+# num cache usado só na renderização (as imagens da galeria não mudam):
+#   <RENDER_IMAGENS_CACHE_DIR>/<sha256 do original>_<largura>.<jpg|png>
+# O atributo image-resolution mantém o tamanho intrínseco original, então o layout é o mesmo.
+RENDER_REAMOSTRAGEM_ATIVA = flag_do_ambiente("RENDER_REAMOSTRAGEM_ATIVA", True)
+RENDER_IMAGENS_DPI = int(os.environ.get("RENDER_IMAGENS_DPI", "150"))
+RENDER_IMAGENS_CACHE_DIR = os.environ.get("RENDER_IMAGENS_CACHE_DIR", os.path.join("temp_uploads", "cache_render_imagens"))
+RENDER_IMAGENS_CACHE_MAX_MB = float(os.environ.get("RENDER_IMAGENS_CACHE_MAX_MB", "1024"))
+# Só reamostra se o original tiver pelo menos esta fração a mais de pixels na largura
+RENDER_IMAGENS_FOLGA = float(os.environ.get("RENDER_IMAGENS_FOLGA", "1.25"))
+RENDER_IMAGENS_QUALIDADE_JPEG = int(os.environ.get("RENDER_IMAGENS_QUALIDADE_JPEG", "88"))
+RENDER_IMAGENS_MEMO_MAX = int(os.environ.get("RENDER_IMAGENS_MEMO_MAX", "4096"))
+
+# Geometria de CSS_RESUMO: A4 (210 mm) menos a margem da página (@page 12 mm) e a do body (12 mm)
+_LARGURA_CONTEUDO_POL = (210 - 2 * 12 - 2 * 12) / 25.4
+# .image-container img { max-width: 70%; width: 100% }
+_FRACAO_IMAGE_CONTAINER = 0.7
+_PX_POR_POL = 96
+_UNIDADES_POL = {"px": 1 / 96, "pt": 1 / 72, "pc": 1 / 6, "in": 1.0, "cm": 1 / 2.54, "mm": 1 / 25.4}
+_PADRAO_MEDIDA = re.compile(r'^\s*([\d.]+)\s*(px|pt|pc|in|cm|mm|%)?\s*$')
+_PADRAO_DECLARACAO = re.compile(r'(?:^|;)\s*(width|height)\s*:\s*([^;]+)', re.IGNORECASE)
+_ELEMENTOS_VAZIOS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+# Hash, formato e dimensões dos originais já vistos (LRU), ver _dados_do_original
+_originais = OrderedDict()
+_lock_originais = threading.Lock()
+
+
+def _medida_em_pol(valor: Optional[str], referencia_pol: float) -> Optional[float]:
+    """Medida CSS (px, pt, mm, %...) em polegadas; porcentagem sobre referencia_pol."""
+    m = _PADRAO_MEDIDA.match(valor or "")
+    if not m:
+        return None
+    numero, unidade = float(m.group(1)), (m.group(2) or "px")
+    if unidade == "%":
+        return numero / 100 * referencia_pol
+    return numero * _UNIDADES_POL[unidade]
+
+
+class _ImagensDoHtml(HTMLParser):
+    """Localiza cada <img> (posição e texto exato da tag) e se está dentro de um .image-container."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.imagens = []
+        self._pilha = []  # (tag, é image-container)
+
+    def handle_starttag(self, tag, attrs):
+        atributos = dict(attrs)
+        if tag == "img":
+            dentro_container = any(container for _, container in self._pilha)
+            self.imagens.append((self.getpos(), self.get_starttag_text(), atributos, dentro_container))
+            return
+        if tag not in _ELEMENTOS_VAZIOS:
+            self._pilha.append((tag, "image-container" in (atributos.get("class") or "").split()))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self._pilha) - 1, -1, -1):
+            if self._pilha[i][0] == tag:
+                del self._pilha[i:]
+                break
+
+
+def _largura_impressa_pol(atributos: dict, dentro_container: bool, largura_px: int, altura_px: int) -> float:
+    estilos = {p.lower(): v.strip() for p, v in _PADRAO_DECLARACAO.findall(atributos.get("style") or "")}
+    largura = _medida_em_pol(estilos.get("width"), _LARGURA_CONTEUDO_POL)
+    if largura is None and dentro_container:
+        largura = _FRACAO_IMAGE_CONTAINER * _LARGURA_CONTEUDO_POL
+    if largura is None:
+        largura = _medida_em_pol(atributos.get("width"), _LARGURA_CONTEUDO_POL)
+    if largura is None:
+        altura = _medida_em_pol(estilos.get("height"), 0) or _medida_em_pol(atributos.get("height"), 0)
+        if altura:
+            largura = altura * largura_px / altura_px
+    # Sem medidas: tamanho intrínseco (96 px por polegada)
+    return largura if largura is not None else largura_px / _PX_POR_POL
+
+
+def _dados_do_original(caminho: str) -> Optional[Tuple[str, str, int, int]]:
+    """
+    (sha256, formato, largura, altura) do original, memoizado por caminho, tamanho e mtime:
+    a mesma imagem em renderizações seguidas não é relida nem re-hasheada. None se ilegível.
+    """
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    chave = (caminho, st.st_size, st.st_mtime_ns)
+    with _lock_originais:
+        if chave in _originais:
+            _originais.move_to_end(chave)
+            return _originais[chave]
+    try:
+        with Image.open(caminho) as img:
+            formato = 'JPEG' if img.format == 'JPEG' else 'PNG'
+            largura, altura = img.size
+        h = hashlib.sha256()
+        with open(caminho, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloco)
+    except Exception:
+        return None
+    dados = (h.hexdigest(), formato, largura, altura)
+    with _lock_originais:
+        _originais[chave] = dados
+        while len(_originais) > RENDER_IMAGENS_MEMO_MAX:
+            _originais.popitem(last=False)
+    return dados
+
+
+def _derivado(caminho: str, original: Tuple[str, str, int, int], largura_alvo: int) -> Optional[str]:
+    """Cópia reduzida para largura_alvo (do cache, ou gerada agora); None se não puder ser gerada."""
+    sha256, formato, largura, altura = original
+    destino = os.path.join(RENDER_IMAGENS_CACHE_DIR, f"{sha256}_{largura_alvo}.{'jpg' if formato == 'JPEG' else 'png'}")
+    try:
+        os.utime(destino)
+        return destino
+    except OSError:
+        pass  # ainda não gerada (ou removida pela expiração)
+    try:
+        with Image.open(caminho) as img:
+            altura_alvo = max(1, round(altura * largura_alvo / largura))
+            # JPEG: decodifica já reduzido (múltiplos de 1/8), sem expandir a imagem inteira
+            img.draft(img.mode, (largura_alvo, altura_alvo))
+            if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+                # Paleta e bitonal só aceitariam NEAREST no resize
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            reduzida = img.resize((largura_alvo, altura_alvo), Image.LANCZOS, reducing_gap=3.0)
+            os.makedirs(RENDER_IMAGENS_CACHE_DIR, exist_ok=True)
+            destino_tmp = f"{destino}.tmp-{os.getpid()}-{threading.get_ident()}"
+            if formato == 'JPEG':
+                reduzida.save(destino_tmp, format='JPEG', quality=RENDER_IMAGENS_QUALIDADE_JPEG, optimize=True)
+            else:
+                reduzida.save(destino_tmp, format='PNG')
+            os.replace(destino_tmp, destino)
+            return destino
+    except Exception as e:
+        print(f"   ⚠️ Falha ao reamostrar {os.path.basename(caminho)}: {e}")
+        return None
+
+
+def reamostrar_imagens_do_html(html: str, pasta_base: str) -> str:
+    """
+    Troca o src das imagens locais (relativas a pasta_base) com resolução acima de
+    RENDER_IMAGENS_DPI no tamanho impresso por cópias reduzidas do cache de renderização.
+    """
+    if not RENDER_REAMOSTRAGEM_ATIVA:
+        return html
+    analisador = _ImagensDoHtml()
+    try:
+        analisador.feed(html)
+        analisador.close()
+    except Exception as e:
+        print(f"Aviso: falha ao analisar imagens para reamostragem: {e}")
+        return html
+
+    # Deslocamento de cada linha, para converter (linha, coluna) do parser em índice no texto
+    inicios_linha = [0]
+    for linha in html.split('\n'):
+        inicios_linha.append(inicios_linha[-1] + len(linha) + 1)
+
+    substituicoes = []
+    reduzidas = 0
+    for (linha, coluna), texto_tag, atributos, dentro_container in analisador.imagens:
+        src = atributos.get("src") or ""
+        if not src or re.match(r'^[a-z][a-z0-9+.-]*:', src, re.IGNORECASE) or src.startswith('/'):
+            continue  # data:, http(s):, file: e caminhos absolutos ficam como estão
+        caminho = os.path.realpath(os.path.join(pasta_base, *src.split('?')[0].split('/')))
+        if not caminho.startswith(os.path.realpath(pasta_base) + os.sep):
+            continue
+        original = _dados_do_original(caminho)
+        if not original:
+            continue
+        largura_px, altura_px = original[2], original[3]
+        largura_alvo = math.ceil(_largura_impressa_pol(atributos, dentro_container, largura_px, altura_px) * RENDER_IMAGENS_DPI)
+        if largura_alvo <= 0 or largura_px < largura_alvo * RENDER_IMAGENS_FOLGA:
+            continue
+        derivado = _derivado(caminho, original, largura_alvo)
+        if not derivado:
+            continue
+        # image-resolution preserva o tamanho intrínseco do original (imagens sem largura no CSS)
+        resolucao = _PX_POR_POL * largura_alvo / largura_px
+        estilo = (atributos.get("style") or "").strip().rstrip(';')
+        estilo = f"{estilo}; image-resolution: {resolucao:.4f}dpi" if estilo else f"image-resolution: {resolucao:.4f}dpi"
+        uri = Path(derivado).resolve().as_uri()
+        novo = texto_tag.replace(f'src="{src}"', f'src="{uri}"', 1).replace(f"src='{src}'", f"src='{uri}'", 1)
+        if novo == texto_tag:
+            continue  # src com entidades ou sem aspas: mantém o original
+        if re.search(r'''(?<![\w-])style\s*=''', novo, re.IGNORECASE):
+            novo = re.sub(r'''(?<![\w-])style\s*=\s*(["'])(.*?)\1''', lambda m: f'style="{estilo}"', novo, count=1, flags=re.IGNORECASE)
+        else:
+            novo = novo[:4] + f' style="{estilo}"' + novo[4:]
+        inicio = inicios_linha[linha - 1] + coluna
+        if html[inicio:inicio + len(texto_tag)] == texto_tag:
+            substituicoes.append((inicio, len(texto_tag), novo))
+            reduzidas += 1
+
+    for inicio, tamanho, novo in reversed(substituicoes):
+        html = html[:inicio] + novo + html[inicio + tamanho:]
+    if reduzidas:
+        print(f"   🖼️ {reduzidas} imagens reamostradas para {RENDER_IMAGENS_DPI} DPI")
+        aplicar_politica_de_expiracao()
+    return html
+
+
+def aplicar_politica_de_expiracao() -> None:
+    """Acima de RENDER_IMAGENS_CACHE_MAX_MB, remove as cópias usadas há mais tempo (LRU)."""
+    politica_de_expiracao(RENDER_IMAGENS_CACHE_DIR, RENDER_IMAGENS_CACHE_MAX_MB * 1024 * 1024)
@@ -27,14 +27,19 @@ export function loadImageGallery() {
     imageItem.dataset.imageName = imageName;
 
     const info = getImagePageInfo(imageName);
-    const baseName = imageName.replace('.png', '');
+    const baseName = imageName.replace(/\.(png|jpe?g)$/i, '');
+    // Miniatura: cópia WebP reduzida quando existir; a original segue para cópia/arraste
+    const thumbName = (info && info.webp) ? info.webp : imageName;
+    // Dimensões e LQIP do imagens_info: layout final imediato, imagem real carregada sob demanda
+    const sizeAttrs = (info && info.largura && info.altura) ? ` width="${info.largura}" height="${info.altura}"` : '';
+    const lqipStyle = (info && info.lqip) ? ` style="background-image:url('${info.lqip}');background-size:cover;"` : '';
     const formattedName = baseName.replace(/^img_/i, 'imagem-');
     const displayName = (info && info.pagina != null)
       ? `${formattedName} — Página ${info.pagina}`
       : formattedName;
 
     imageItem.innerHTML = `
-      <img src="${baseUrl}${imageName}?v=${state.galleryCacheBust}" alt="${imageName}">
+      <img data-src="${baseUrl}${thumbName}?v=${state.galleryCacheBust}" alt="${imageName}" loading="lazy" decoding="async"${sizeAttrs}${lqipStyle}>
       <button class="copy-btn" title="Copiar imagem" onclick="copyGalleryImage('${imageName}')" onmousedown="event.stopPropagation()">
         <img src="../images/copy_image_gallery.svg" alt="Copiar" width="54" height="54" />
       </button>
@@ -59,6 +64,7 @@ export function loadImageGallery() {
 
     gallery.appendChild(imageItem);
   });
+  applyGallerySprite(gallery);
 
   updateImageCountInfo();
   // Atualiza contador no rótulo após recarregar a galeria
@@ -70,6 +76,34 @@ export function loadImageGallery() {
   }
 }
 
+const TRANSPARENT_PIXEL = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
+
+// Miniaturas da galeria a partir da folha única (sprite) + atlas: duas requisições no total.
+// Imagens fora do atlas (ou se a folha falhar) carregam individualmente pelo data-src.
+async function applyGallerySprite(gallery) {
+  const imgs = Array.from(gallery.querySelectorAll('.image-item > img[data-src]'));
+  if (!imgs.length) return;
+  let atlas = null;
+  try {
+    const res = await fetch('/api/pdf-images/sprite', { headers: { 'Accept': 'application/json' } });
+    if (res.ok) atlas = await res.json();
+  } catch (_) {}
+  imgs.forEach((img) => {
+    const item = img.closest('.image-item');
+    const pos = atlas && atlas.items && item ? atlas.items[item.dataset.imageName] : null;
+    if (pos) {
+      img.src = TRANSPARENT_PIXEL;
+      img.style.aspectRatio = `${pos.w} / ${pos.h}`;
+      img.style.backgroundImage = `url('${atlas.sprite_url}')`;
+      img.style.backgroundSize = `${atlas.width / pos.w * 100}% ${atlas.height / pos.h * 100}%`;
+      img.style.backgroundPosition = `${pos.x / ((atlas.width - pos.w) || 1) * 100}% ${pos.y / ((atlas.height - pos.h) || 1) * 100}%`;
+    } else {
+      img.src = img.dataset.src;
+    }
+    img.removeAttribute('data-src');
+  });
+}
+
 export function loadCaptureGallery() {
   const gallery = document.getElementById('imageGallery');
   if (!gallery) return;
@@ -1236,7 +1270,7 @@ export function clearAllImages() {
 
 export async function deleteGalleryImage(imageName) {
   const pretty = String(imageName)
-    .replace(/\.png$/i, '')
+    .replace(/\.(png|jpe?g)$/i, '')
     .replace(/^img_/i, 'imagem-');
   if (confirm(`Tem certeza que deseja excluir a ${pretty} da galeria?`)) {
     const index = state.estruturaEdicao.images.indexOf(imageName);
@@ -32,7 +32,7 @@ export function updateModalImage() {
   if (labelEl) {
     const info = getImagePageInfo(name);
     const prettyBase = String(name)
-      .replace(/\.png$/i, '')
+      .replace(/\.(png|jpe?g)$/i, '')
       .replace(/^img_/i, 'imagem-');
     const displayName = (info && info.pagina != null)
       ? `${prettyBase} — Página ${info.pagina}`
@@ -1,5 +1,16 @@
 import { state } from './state.js?v=8';
 
+async function waitForRenderJob(job, intervalMs = 1000) {
+  while (true) {
+    const res = await fetch(job.status_url, { cache: 'no-store' });
+    if (!res.ok) throw new Error('Trabalho de geração do PDF não encontrado');
+    const status = await res.json();
+    if (status.state === 'concluido') return status.result_url || job.result_url;
+    if (status.state === 'erro') throw new Error(status.error || 'Erro ao gerar PDF');
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
 export async function generateFinalPDF() {
   try {
     const resumoHtml = (state.joditEditor && state.joditEditor.editorDocument && state.joditEditor.editorDocument.body)
@@ -8,17 +19,24 @@ export async function generateFinalPDF() {
     const finalStructure = {
       resumo_text: resumoHtml,
       imagens_posicionadas: state.imagensPosicionadas,
-      upload_dir: state.estruturaEdicao ? state.estruturaEdicao.upload_dir : undefined
+      upload_dir: state.estruturaEdicao ? state.estruturaEdicao.upload_dir : undefined,
+      mode: 'job'
     };
 
+    // Modo trabalho: a geração roda em segundo plano e o PDF é baixado quando ficar pronto
     const response = await fetch('/api/generate-final-pdf', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(finalStructure)
     });
     if (!response.ok) throw new Error('Erro ao gerar PDF');
+    const job = await response.json();
+    // Acerto no cache de PDFs: o trabalho já vem concluído
+    const resultUrl = job.state === 'concluido' ? job.result_url : await waitForRenderJob(job);
 
-    const blob = await response.blob();
+    const pdfResponse = await fetch(resultUrl);
+    if (!pdfResponse.ok) throw new Error('Erro ao baixar PDF');
+    const blob = await pdfResponse.blob();
     const url = window.URL.createObjectURL(blob);
     try {
       const opened = window.open(url, '_blank');
@@ -1,11 +1,51 @@
 import os
+import sys
+import time
+import hashlib
+import datetime
 import mimetypes
-from typing import List, Optional, Tuple
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Callable, List, Optional, Tuple, TypeVar
 
 from google.cloud import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from fastapi import UploadFile, HTTPException
 from starlette.responses import StreamingResponse, Response
 
+from utilitarios import flag_do_ambiente
+
+
+# Armazenamento endereçado por conteúdo: o conteúdo de cada arquivo enviado fica uma única vez
+# em <CAS_PREFIX>/<sha256>, e o caminho lógico (uploads/..., temp_uploads/...) vira apenas uma
+# referência: um blob vazio com o hash e o tamanho nos metadados. Bytes iguais enviados por
+# usuários, projetos ou nomes diferentes são gravados uma vez só; se o hash já existe no CAS,
+# o envio do conteúdo é pulado. Blobs antigos (gravados antes do CAS) continuam sendo lidos.
+# Conteúdos que nenhuma referência aponta mais são removidos por coletar_cas_orfaos, a rodar
+# periodicamente fora das requisições (python storage.py coletar-cas, ex.: Cloud Scheduler).
+CAS_ATIVO = flag_do_ambiente("CAS_ATIVO", True)
+CAS_PREFIX = os.environ.get("CAS_PREFIX", "cas").rstrip('/')
+# Idade mínima de um conteúdo órfão para a coleta removê-lo (protege envios em andamento)
+CAS_GC_IDADE_MIN_H = float(os.environ.get("CAS_GC_IDADE_MIN_H", "24"))
+# Validade das confirmações "hash já está no CAS" guardadas em memória
+CAS_HASHES_TTL_S = float(os.environ.get("CAS_HASHES_TTL_S", "600"))
+# Validade das referências já resolvidas (outra instância pode regravar o mesmo caminho)
+CAS_REFERENCIAS_TTL_S = float(os.environ.get("CAS_REFERENCIAS_TTL_S", "300"))
+CAS_REFERENCIAS_MAX = int(os.environ.get("CAS_REFERENCIAS_MAX", "10000"))
+_META_HASH = "cas_sha256"
+_META_TAMANHO = "cas_tamanho"
+
+# Hashes já confirmados no CAS por este processo (evita consultar o bucket a cada envio)
+_hashes_no_cas = {}
+_lock_hashes_cas = threading.Lock()
+# Caminho lógico -> (hash no CAS, ou None para blob antigo; instante da resolução), para ler o
+# conteúdo sem buscar os metadados da referência a cada download. Preenchido pelos envios,
+# pelas listagens (que já trazem os metadados) e pela primeira leitura de cada caminho.
+_referencias = OrderedDict()
+_lock_referencias = threading.Lock()
+
+_T = TypeVar("_T")
+
 
 def _get_bucket() -> storage.Bucket:
     bucket_name = os.getenv("UPLOADS_BUCKET") or os.getenv("GCS_BUCKET") or "resumopro-storage-bucket"
@@ -21,6 +61,93 @@ def _guess_content_type(path: str) -> str:
     return ctype or "application/octet-stream"
 
 
+def _sha256_de_arquivo(f: BinaryIO) -> Tuple[str, int]:
+    h = hashlib.sha256()
+    tamanho = 0
+    f.seek(0)
+    for bloco in iter(lambda: f.read(1024 * 1024), b""):
+        h.update(bloco)
+        tamanho += len(bloco)
+    f.seek(0)
+    return h.hexdigest(), tamanho
+
+
+def _lembrar_referencia(path: str, sha: Optional[str]) -> None:
+    with _lock_referencias:
+        _referencias[path] = (sha, time.monotonic())
+        _referencias.move_to_end(path)
+        while len(_referencias) > CAS_REFERENCIAS_MAX:
+            _referencias.popitem(last=False)
+
+
+def _esquecer_referencia(path: str) -> bool:
+    with _lock_referencias:
+        return _referencias.pop(path, None) is not None
+
+
+def _gravar_no_cas(bucket: storage.Bucket, blob_path: str, f: BinaryIO, content_type: str) -> None:
+    """Grava o conteúdo de f no CAS (se ainda não estiver lá) e a referência em blob_path."""
+    sha, tamanho = _sha256_de_arquivo(f)
+    cas_blob = bucket.blob(f"{CAS_PREFIX}/{sha}")
+    with _lock_hashes_cas:
+        confirmado_em = _hashes_no_cas.get(sha)
+    ja_no_cas = confirmado_em is not None and time.monotonic() - confirmado_em <= CAS_HASHES_TTL_S
+    if not ja_no_cas:
+        ja_no_cas = cas_blob.exists()
+        if not ja_no_cas:
+            try:
+                # if_generation_match=0: só cria; em corrida, o conteúdo gravado pelo outro é idêntico
+                cas_blob.upload_from_file(f, content_type=content_type, if_generation_match=0)
+            except PreconditionFailed:
+                ja_no_cas = True
+        with _lock_hashes_cas:
+            _hashes_no_cas[sha] = time.monotonic()
+
+    if ja_no_cas:
+        # Mesmo conteúdo já referenciado neste caminho: nada a gravar
+        atual = bucket.get_blob(blob_path)
+        if atual is not None and (atual.metadata or {}).get(_META_HASH) == sha:
+            _lembrar_referencia(blob_path, sha)
+            return
+
+    ref = bucket.blob(blob_path)
+    ref.metadata = {_META_HASH: sha, _META_TAMANHO: str(tamanho)}
+    ref.upload_from_string(b"", content_type=content_type)
+    _lembrar_referencia(blob_path, sha)
+
+
+def _blob_de_conteudo(bucket: storage.Bucket, path: str) -> storage.Blob:
+    """
+    Blob com o conteúdo do caminho lógico: o do CAS, se for uma referência, ou o próprio.
+    Os metadados da referência só são buscados quando o caminho não está em _referencias.
+    """
+    with _lock_referencias:
+        item = _referencias.get(path)
+    if item is not None and time.monotonic() - item[1] <= CAS_REFERENCIAS_TTL_S:
+        sha = item[0]
+    else:
+        blob = bucket.get_blob(path)
+        if blob is None:
+            _esquecer_referencia(path)
+            raise FileNotFoundError(path)
+        sha = (blob.metadata or {}).get(_META_HASH)
+        _lembrar_referencia(path, sha)
+        if not sha:
+            return blob
+    return bucket.blob(f"{CAS_PREFIX}/{sha}") if sha else bucket.blob(path)
+
+
+def _com_conteudo(bucket: storage.Bucket, path: str, operacao: Callable[[storage.Blob], _T]) -> _T:
+    """Executa operacao (download) sobre o blob com o conteúdo de path."""
+    try:
+        return operacao(_blob_de_conteudo(bucket, path))
+    except NotFound:
+        # Referência em memória desatualizada (caminho regravado ou excluído por outra instância)
+        if not _esquecer_referencia(path):
+            raise
+        return operacao(_blob_de_conteudo(bucket, path))
+
+
 async def upload_uploadfile(prefix: str, file: UploadFile, dest_name: Optional[str] = None) -> str:
     bucket = _get_bucket()
     name = dest_name or (file.filename or f"upload_{id(file)}")
@@ -29,8 +156,12 @@ async def upload_uploadfile(prefix: str, file: UploadFile, dest_name: Optional[s
     blob = bucket.blob(blob_path)
     try:
         # UploadFile.file pode ser um SpooledTemporaryFile; usar upload_from_file
+        if CAS_ATIVO:
+            _gravar_no_cas(bucket, blob_path, file.file, _guess_content_type(safe_name))
+            return blob_path
         file.file.seek(0)
         blob.upload_from_file(file.file, content_type=_guess_content_type(safe_name))
+        _lembrar_referencia(blob_path, None)
         return blob_path
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar arquivo para Cloud Storage: {e}")
@@ -43,7 +174,12 @@ def upload_local_file(prefix: str, local_path: str, dest_name: Optional[str] = N
     blob_path = f"{prefix.rstrip('/')}/{safe_name}"
     blob = bucket.blob(blob_path)
     try:
+        if CAS_ATIVO:
+            with open(local_path, 'rb') as f:
+                _gravar_no_cas(bucket, blob_path, f, _guess_content_type(safe_name))
+            return blob_path
         blob.upload_from_filename(local_path, content_type=_guess_content_type(safe_name))
+        _lembrar_referencia(blob_path, None)
         return blob_path
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar arquivo local para Cloud Storage: {e}")
@@ -54,6 +190,7 @@ def copy_blob(src_path: str, dest_path: str) -> None:
     try:
         src_blob = bucket.blob(src_path)
         bucket.copy_blob(src_blob, bucket, new_name=dest_path)
+        _esquecer_referencia(dest_path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao copiar blob no Cloud Storage: {e}")
 
@@ -68,7 +205,12 @@ def list_prefix(prefix: str) -> List[Tuple[str, int]]:
             name = b.name
             if name.endswith('/'):
                 continue
-            out.append((name, int(b.size or 0)))
+            # Referências do CAS são blobs vazios; o tamanho real fica nos metadados
+            tamanho = (b.metadata or {}).get(_META_TAMANHO) or b.size or 0
+            out.append((name, int(tamanho)))
+            # A listagem já traz os metadados: leituras seguintes não precisam buscá-los
+            if not name.startswith(CAS_PREFIX + '/'):
+                _lembrar_referencia(name, (b.metadata or {}).get(_META_HASH))
         return out
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao listar prefixo no Cloud Storage: {e}")
@@ -78,6 +220,7 @@ def delete_blob(path: str) -> None:
     bucket = _get_bucket()
     try:
         blob = bucket.blob(path)
+        _esquecer_referencia(path)
         blob.delete()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao excluir blob no Cloud Storage: {e}")
@@ -88,6 +231,7 @@ def delete_prefix(prefix: str) -> int:
     try:
         count = 0
         for name, _ in list_prefix(prefix):
+            _esquecer_referencia(name)
             bucket.blob(name).delete()
             count += 1
         return count
@@ -95,14 +239,76 @@ def delete_prefix(prefix: str) -> int:
         raise HTTPException(status_code=500, detail=f"Erro ao excluir prefixo no Cloud Storage: {e}")
 
 
+def blob_exists(path: str) -> bool:
+    bucket = _get_bucket()
+    try:
+        return bucket.blob(path).exists()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao verificar blob no Cloud Storage: {e}")
+
+
+def download_blob_to_file(path: str, local_path: str) -> None:
+    bucket = _get_bucket()
+    try:
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        _com_conteudo(bucket, path, lambda blob: blob.download_to_filename(local_path))
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Erro ao baixar blob do Cloud Storage: {e}")
+
+
 def stream_blob(path: str) -> Response:
     bucket = _get_bucket()
     try:
-        blob = bucket.blob(path)
         # Baixar como stream de bytes
         ctype = _guess_content_type(path)
         # Para arquivos pequenos, download_as_bytes é suficiente
-        data = blob.download_as_bytes()
+        data = _com_conteudo(bucket, path, lambda blob: blob.download_as_bytes())
         return Response(content=data, media_type=ctype)
     except Exception as e:
-        raise HTTPException(status_code=404, detail=f"Arquivo não encontrado no Cloud Storage: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=404, detail=f"Arquivo não encontrado no Cloud Storage: {e}")
+
+
+def coletar_cas_orfaos(idade_minima_h: float = CAS_GC_IDADE_MIN_H, simular: bool = False) -> int:
+    """
+    Remove do CAS os conteúdos que nenhum blob de referência aponta mais (após exclusões ou
+    regravações) e que foram criados há mais de idade_minima_h. Percorre o bucket inteiro:
+    rodar periodicamente, fora do caminho das requisições. Retorna quantos foram (ou seriam,
+    com simular=True) removidos.
+    """
+    bucket = _get_bucket()
+    prefixo_cas = CAS_PREFIX + '/'
+    referenciados = set()
+    for b in bucket.list_blobs():
+        if b.name.startswith(prefixo_cas):
+            continue
+        sha = (b.metadata or {}).get(_META_HASH)
+        if sha:
+            referenciados.add(sha)
+
+    limite = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=idade_minima_h)
+    removidos = 0
+    for b in bucket.list_blobs(prefix=prefixo_cas):
+        sha = b.name[len(prefixo_cas):]
+        if sha in referenciados or (b.time_created and b.time_created > limite):
+            continue
+        if not simular:
+            try:
+                # Só a geração listada: um reenvio do mesmo conteúdo nesse meio-tempo é preservado
+                b.delete(if_generation_match=b.generation)
+            except (NotFound, PreconditionFailed):
+                continue
+            with _lock_hashes_cas:
+                _hashes_no_cas.pop(sha, None)
+        removidos += 1
+    print(f"[CAS] {removidos} conteúdos órfãos {'encontrados' if simular else 'removidos'} "
+          f"({len(referenciados)} referenciados)")
+    return removidos
+
+
+if __name__ == "__main__":
+    # python storage.py coletar-cas [--simular]
+    if len(sys.argv) > 1 and sys.argv[1] == "coletar-cas":
+        coletar_cas_orfaos(simular="--simular" in sys.argv[2:])
+    else:
+        print("Uso: python storage.py coletar-cas [--simular]")
+        sys.exit(2)
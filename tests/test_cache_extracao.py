@@ -0,0 +1,89 @@
+import json
+import os
+import time
+
+import pytest
+
+import cache_extracao
+
+
+@pytest.fixture
+def cache_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_extracao, "CACHE_EXTRACAO_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_extracao, "CACHE_EXTRACAO_ATIVO", True)
+    monkeypatch.setattr(cache_extracao, "CACHE_EXTRACAO_GCS", False)
+    return tmp_path
+
+
+def _extracao(pasta, nomes):
+    pasta.mkdir(parents=True, exist_ok=True)
+    info = {}
+    for nome in nomes:
+        (pasta / nome).write_bytes(nome.encode() * 10)
+        info[nome] = {"caminho": str(pasta / nome), "pagina": 1}
+    (pasta / "img_1.webp").write_bytes(b"webp")
+    info[nomes[0]]["webp"] = "img_1.webp"
+    (pasta / "imagens_info.json").write_text(json.dumps(info), encoding="utf-8")
+    return info
+
+
+def _tamanho(pasta):
+    return sum(os.path.getsize(os.path.join(raiz, nome)) for raiz, _, nomes in os.walk(pasta) for nome in nomes)
+
+
+def test_salvar_e_restaurar(cache_local):
+    origem = cache_local / "origem"
+    _extracao(origem, ["img_1.jpg", "img_2.png"])
+    texto = cache_local / "texto.txt"
+    texto.write_text("texto do pdf", encoding="utf-8")
+    cache_extracao.salvar_extracao("a" * 64, str(origem), str(texto), "v1")
+
+    destino = cache_local / "destino"
+    texto_saida = cache_local / "texto_saida.txt"
+    assert cache_extracao.restaurar_extracao("a" * 64, str(destino), str(texto_saida), "v1")
+
+    assert sorted(os.listdir(destino)) == ["imagens_info.json", "img_1.jpg", "img_1.webp", "img_2.png"]
+    assert (destino / "img_2.png").read_bytes() == (origem / "img_2.png").read_bytes()
+    info = json.loads((destino / "imagens_info.json").read_text(encoding="utf-8"))
+    assert info["img_1.jpg"]["caminho"] == str(destino / "img_1.jpg")
+    assert info["img_1.jpg"]["webp"] == "img_1.webp"
+    assert texto_saida.read_text(encoding="utf-8") == "texto do pdf"
+
+
+def test_restaurar_sem_entrada(cache_local):
+    assert not cache_extracao.restaurar_extracao("b" * 64, str(cache_local / "destino"), None, "v1")
+
+
+def test_restaurar_com_outra_versao_descarta_a_entrada(cache_local):
+    origem = cache_local / "origem"
+    _extracao(origem, ["img_1.jpg"])
+    cache_extracao.salvar_extracao("c" * 64, str(origem), None, "v1")
+
+    assert not cache_extracao.restaurar_extracao("c" * 64, str(cache_local / "destino"), None, "v2")
+    assert not os.path.exists(os.path.join(cache_extracao.CACHE_EXTRACAO_DIR, "c" * 64))
+
+
+def test_restaurar_entrada_expirada(cache_local):
+    origem = cache_local / "origem"
+    _extracao(origem, ["img_1.jpg"])
+    cache_extracao.salvar_extracao("d" * 64, str(origem), None, "v1")
+
+    pasta = os.path.join(cache_extracao.CACHE_EXTRACAO_DIR, "d" * 64)
+    meta = cache_extracao._ler_meta(pasta)
+    meta["criado_em"] = time.time() - 3600 * (cache_extracao.CACHE_EXTRACAO_TTL_HORAS + 1)
+    cache_extracao._gravar_meta(pasta, meta)
+    assert not cache_extracao.restaurar_extracao("d" * 64, str(cache_local / "destino"), None, "v1")
+
+
+def test_expiracao_por_tamanho_remove_a_menos_usada(cache_local, monkeypatch):
+    for i, pdf_hash in enumerate(("e" * 64, "f" * 64)):
+        origem = cache_local / f"origem_{i}"
+        _extracao(origem, ["img_1.jpg"])
+        cache_extracao.salvar_extracao(pdf_hash, str(origem), None, "v1")
+        pasta = os.path.join(cache_extracao.CACHE_EXTRACAO_DIR, pdf_hash)
+        os.utime(pasta, (1000 + i, 1000 + i))
+
+    # Cabe só uma entrada
+    monkeypatch.setattr(cache_extracao, "CACHE_EXTRACAO_MAX_MB", _tamanho(pasta) * 1.5 / (1024 * 1024))
+    cache_extracao.aplicar_politica_de_expiracao()
+    assert os.listdir(cache_extracao.CACHE_EXTRACAO_DIR) == ["f" * 64]
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+import cache_renderizacao
+from cache_renderizacao import chave_renderizacao, normalizar_html
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    (tmp_path / "imagens_extraidas").mkdir()
+    (tmp_path / "imagens_extraidas" / "img_1.png").write_bytes(b"imagem 1")
+    (tmp_path / "capturas_de_tela").mkdir()
+    (tmp_path / "capturas_de_tela" / "cap.png").write_bytes(b"captura")
+    return tmp_path
+
+
+_HTML = '<p>Resumo</p><img src="/temp_uploads/imagens_extraidas/img_1.png?v=3"><img src="capturas_de_tela/cap.png">'
+
+
+def test_normalizar_html():
+    assert normalizar_html(' \r\n<img src="/temp_uploads/imagens_extraidas/a.jpg?v=9">\r\n') == '<img src="imagens_extraidas/a.jpg">'
+
+
+def test_chave_estavel(upload_dir):
+    chave = chave_renderizacao(_HTML, str(upload_dir), "v1")
+    assert chave == chave_renderizacao(_HTML, str(upload_dir), "v1")
+    # Quebras de linha, espaços nas pontas e querystrings não mudam o PDF
+    variante = "  " + _HTML.replace("?v=3", "?v=4").replace("<p>", "\r\n<p>", 1) + "\n"
+    assert chave_renderizacao(variante, str(upload_dir), "v1") == chave
+
+
+def test_chave_muda_com_html_estilos_e_conteudo_das_imagens(upload_dir):
+    chave = chave_renderizacao(_HTML, str(upload_dir), "v1")
+    assert chave_renderizacao(_HTML.replace("Resumo", "Outro"), str(upload_dir), "v1") != chave
+    assert chave_renderizacao(_HTML, str(upload_dir), "v2") != chave
+
+    captura = upload_dir / "capturas_de_tela" / "cap.png"
+    captura.write_bytes(b"captura regravada")
+    st = os.stat(captura)
+    os.utime(captura, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert chave_renderizacao(_HTML, str(upload_dir), "v1") != chave
+
+
+def test_src_externos_e_fora_da_pasta_entram_so_pelo_texto(upload_dir, monkeypatch):
+    lidos = []
+    original = cache_renderizacao._hash_arquivo
+    monkeypatch.setattr(cache_renderizacao, "_hash_arquivo", lambda caminho: lidos.append(caminho) or original(caminho))
+    html = ('<img src="https://exemplo.com/a.png"><img src="data:image/png;base64,AAAA">'
+            '<img src="../fora.png"><img src="/outro/caminho.png">')
+    chave_renderizacao(html, str(upload_dir), "v1")
+    assert lidos == []
+
+
+def test_hash_memoizado(upload_dir, monkeypatch):
+    monkeypatch.setattr(cache_renderizacao, "_hashes_imagens", cache_renderizacao.OrderedDict())
+    caminho = str(upload_dir / "imagens_extraidas" / "img_1.png")
+    primeiro = cache_renderizacao._hash_arquivo(caminho)
+    assert cache_renderizacao._hash_arquivo(str(upload_dir / "nao_existe.png")) == "ausente"
+
+    def _sem_leitura(*args, **kwargs):
+        raise AssertionError("o hash deveria vir da memória")
+    monkeypatch.setattr("builtins.open", _sem_leitura)
+    assert cache_renderizacao._hash_arquivo(caminho) == primeiro
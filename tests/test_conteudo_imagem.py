@@ -0,0 +1,96 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import conteudo_imagem
+from conteudo_imagem import analisar_imagem, recortar_imagem
+
+
+def _codificar(img, formato='PNG', **opcoes):
+    saida = io.BytesIO()
+    img.save(saida, format=formato, **opcoes)
+    return saida.getvalue()
+
+
+def _conteudo(largura, altura, semente=0):
+    """Textura com variação suficiente para não ser tomada como uniforme."""
+    ruido = np.random.default_rng(semente).integers(0, 256, (altura, largura, 3), dtype=np.uint8)
+    return Image.fromarray(ruido, 'RGB')
+
+
+def _com_bordas(largura, altura, caixa, fundo=(255, 255, 255)):
+    img = Image.new('RGB', (largura, altura), fundo)
+    esquerda, topo, direita, base = caixa
+    img.paste(_conteudo(direita - esquerda, base - topo), (esquerda, topo))
+    return img
+
+
+def test_descarta_imagem_uniforme():
+    analise = analisar_imagem(_codificar(Image.new('RGB', (300, 200), (40, 90, 200))))
+    assert analise.motivo_descarte.startswith("Uniforme")
+    assert analise.dhash is not None
+
+
+def test_descarta_imagem_quase_em_branco():
+    img = Image.new('L', (400, 400), 255)
+    img.putpixel((200, 200), 0)
+    analise = analisar_imagem(_codificar(img))
+    assert analise.motivo_descarte is not None
+
+
+def test_mantem_imagem_com_conteudo_sem_recorte():
+    analise = analisar_imagem(_codificar(_conteudo(300, 200)))
+    assert analise.motivo_descarte is None
+    assert analise.recorte is None
+    assert (analise.largura, analise.altura) == (300, 200)
+    assert analise.lqip.startswith("data:image/webp;base64,")
+
+
+def test_recorta_bordas_uniformes_do_png():
+    caixa = (100, 60, 300, 200)
+    dados = _codificar(_com_bordas(400, 300, caixa))
+    analise = analisar_imagem(dados)
+    assert analise.motivo_descarte is None
+    esquerda, topo, direita, base = analise.recorte
+    # Margem de um pixel da cópia reduzida em volta do conteúdo
+    assert caixa[0] - 4 <= esquerda <= caixa[0] and caixa[1] - 4 <= topo <= caixa[1]
+    assert caixa[2] <= direita <= caixa[2] + 4 and caixa[3] <= base <= caixa[3] + 4
+    assert (analise.largura, analise.altura) == (direita - esquerda, base - topo)
+
+    with Image.open(io.BytesIO(recortar_imagem(dados, analise.recorte))) as recortada:
+        assert recortada.format == 'PNG'
+        assert recortada.size == (analise.largura, analise.altura)
+
+
+def test_bordas_pequenas_nao_sao_recortadas():
+    analise = analisar_imagem(_codificar(_com_bordas(400, 300, (4, 4, 396, 296))))
+    assert analise.recorte is None
+
+
+def test_jpeg_so_recorta_com_bordas_grandes_e_alinhado_aos_blocos():
+    # Bordas de ~25% da área: recortariam um PNG, mas não um JPEG
+    assert analisar_imagem(_codificar(_com_bordas(400, 300, (25, 20, 375, 280)), 'PNG')).recorte is not None
+    assert analisar_imagem(_codificar(_com_bordas(400, 300, (25, 20, 375, 280)), 'JPEG', quality=95)).recorte is None
+
+    dados = _codificar(_com_bordas(640, 480, (200, 150, 440, 330)), 'JPEG', quality=95)
+    analise = analisar_imagem(dados)
+    assert analise.recorte is not None
+    esquerda, topo, _, _ = analise.recorte
+    assert esquerda % 16 == 0 and topo % 16 == 0
+
+    with Image.open(io.BytesIO(dados)) as original, Image.open(io.BytesIO(recortar_imagem(dados, analise.recorte))) as recortada:
+        assert recortada.format == 'JPEG'
+        assert recortada.size == (analise.largura, analise.altura)
+        # Mesmas tabelas de quantização do original
+        assert recortada.quantization == original.quantization
+
+
+def test_dados_invalidos():
+    assert analisar_imagem(b"nao e imagem") == conteudo_imagem.AnaliseImagem(None)
+    assert recortar_imagem(b"nao e imagem", (0, 0, 1, 1)) == b"nao e imagem"
+
+
+def test_analise_uniforme_desligada(monkeypatch):
+    monkeypatch.setattr(conteudo_imagem, "CONTEUDO_UNIFORME_ATIVO", False)
+    assert analisar_imagem(_codificar(Image.new('RGB', (300, 200), 'white'))).motivo_descarte is None
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+from PIL import Image
+
+from deduplicacao_perceptual import IndicePerceptual, dhash_de_imagem, distancia_hamming, formatar_dhash
+
+
+def _vizinho(dhash, bits):
+    for bit in bits:
+        dhash ^= 1 << bit
+    return dhash
+
+
+def test_distancia_hamming():
+    assert distancia_hamming(0b1011, 0b0001) == 2
+    assert distancia_hamming(2 ** 64 - 1, 0) == 64
+
+
+def test_indice_vazio():
+    indice = IndicePerceptual(distancia_maxima=4)
+    assert len(indice) == 0
+    assert indice.mais_proximo(123) is None
+
+
+def test_mais_proximo_dentro_do_raio():
+    indice = IndicePerceptual(distancia_maxima=4)
+    base = 0x0123456789ABCDEF
+    indice.adicionar(base, "base")
+    indice.adicionar(_vizinho(base, (1, 2)), "a_2_bits")
+    indice.adicionar(~base & (2 ** 64 - 1), "oposto")
+    assert len(indice) == 3
+
+    assert indice.mais_proximo(base) == ("base", 0)
+    assert indice.mais_proximo(_vizinho(base, (1, 2, 3))) == ("a_2_bits", 1)
+    assert indice.mais_proximo(_vizinho(base, (10, 20, 30, 40))) == ("base", 4)
+    assert indice.mais_proximo(_vizinho(base, (10, 20, 30, 40, 50))) is None
+
+
+def test_bk_tree_igual_a_busca_linear():
+    aleatorio = random.Random(42)
+    hashes = [aleatorio.getrandbits(64) for _ in range(300)]
+    # Quase-duplicatas para haver acertos dentro do raio
+    hashes += [_vizinho(h, aleatorio.sample(range(64), aleatorio.randint(0, 6))) for h in hashes[:100]]
+    indice = IndicePerceptual(distancia_maxima=5)
+    for i, h in enumerate(hashes):
+        indice.adicionar(h, i)
+
+    for _ in range(200):
+        alvo = _vizinho(aleatorio.choice(hashes), aleatorio.sample(range(64), aleatorio.randint(0, 8)))
+        distancias = [distancia_hamming(alvo, h) for h in hashes]
+        menor = min(distancias)
+        resultado = indice.mais_proximo(alvo)
+        if menor > 5:
+            assert resultado is None
+        else:
+            assert resultado is not None and resultado[1] == menor
+            assert distancias[resultado[0]] == menor
+
+
+def test_dhash_resiste_a_reescala_e_formata_em_hex():
+    gradiente = np.tile(np.linspace(0, 255, 300, dtype=np.uint8), (200, 1))
+    ruido = np.random.default_rng(0).integers(0, 60, (200, 300), dtype=np.uint8)
+    img = Image.fromarray(gradiente // 2 + ruido, 'L')
+    original = dhash_de_imagem(img)
+    reduzida = dhash_de_imagem(img.resize((150, 100), Image.BILINEAR))
+    assert distancia_hamming(original, reduzida) <= 6
+    assert len(formatar_dhash(original)) == 16
+    assert formatar_dhash(None) is None
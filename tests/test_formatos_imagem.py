@@ -0,0 +1,63 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from formatos_imagem import (
+    LIMITES_DIMENSAO_PADRAO,
+    LimitesDimensao,
+    dimensoes_de_base64,
+    dimensoes_do_cabecalho,
+    eh_imagem_extraida,
+    limites_da_extracao,
+    motivo_descarte_por_dimensoes,
+)
+
+_LIMITES = LimitesDimensao(lado_min=24, area_min=64 * 64, proporcao_max=15)
+
+
+def _png(largura, altura):
+    saida = io.BytesIO()
+    Image.new('RGB', (largura, altura), 'white').save(saida, format='PNG')
+    return saida.getvalue()
+
+
+@pytest.mark.parametrize("largura, altura, trecho", [
+    (16, 400, "lado menor"),
+    (50, 50, "área menor"),
+    (2000, 100, "proporção maior"),
+])
+def test_descarta_icones_e_fios(largura, altura, trecho):
+    assert trecho in motivo_descarte_por_dimensoes(largura, altura, _LIMITES)
+
+
+@pytest.mark.parametrize("largura, altura", [(64, 64), (24, 360), (1500, 100), (800, 600)])
+def test_mantem_imagens_relevantes(largura, altura):
+    assert motivo_descarte_por_dimensoes(largura, altura, _LIMITES) is None
+
+
+def test_limites_da_extracao():
+    assert limites_da_extracao() == LIMITES_DIMENSAO_PADRAO
+    limites = limites_da_extracao(lado_min=10, proporcao_max=40)
+    assert limites == LIMITES_DIMENSAO_PADRAO._replace(lado_min=10, proporcao_max=40)
+    assert motivo_descarte_por_dimensoes(12, 400, limites) is None
+
+
+@pytest.mark.parametrize("argumentos", [{"lado_min": -1}, {"area_min": -5}, {"proporcao_max": 0.5}])
+def test_limites_invalidos(argumentos):
+    with pytest.raises(ValueError):
+        limites_da_extracao(**argumentos)
+
+
+def test_dimensoes_sem_decodificar():
+    assert dimensoes_do_cabecalho(_png(120, 80)) == (120, 80)
+    assert dimensoes_do_cabecalho(b"nao e imagem") is None
+    assert dimensoes_de_base64(base64.b64encode(_png(33, 44)).decode('ascii')) == (33, 44)
+
+
+def test_eh_imagem_extraida():
+    assert eh_imagem_extraida("img_1.JPG")
+    assert eh_imagem_extraida("img_2.png")
+    assert not eh_imagem_extraida("img_1.webp")
+    assert not eh_imagem_extraida("imagens_info.json")
@@ -0,0 +1,79 @@
+import io
+import os
+
+import fitz
+import pytest
+from PIL import Image
+
+import raster_paginas
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    caminho = tmp_path / "doc.pdf"
+    doc = fitz.open()
+    for numero in range(2):
+        pagina = doc.new_page(width=595, height=842)
+        pagina.insert_text((72, 72), f"Página {numero + 1}")
+        pagina.draw_rect(fitz.Rect(100, 100, 300, 200), color=(1, 0, 0), fill=(1, 0, 0))
+    doc.save(str(caminho))
+    doc.close()
+    return str(caminho)
+
+
+@pytest.fixture
+def cache_local(tmp_path, monkeypatch):
+    monkeypatch.setattr(raster_paginas, "RASTER_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(raster_paginas, "RASTER_CACHE_GCS", False)
+    return tmp_path / "cache"
+
+
+def test_informacoes_do_pdf(pdf):
+    info = raster_paginas.informacoes_do_pdf(pdf)
+    assert info["total_paginas"] == 2
+    assert info["paginas"][0]["largura"] == 595
+    assert info["paginas"][0]["tiles"]["144"] == list(raster_paginas.grade_de_tiles(595, 842, 144))
+
+
+def test_miniatura_renderizada_e_depois_lida_do_cache(pdf, cache_local, monkeypatch):
+    dados = raster_paginas.obter_miniatura(pdf, 1)
+    with Image.open(io.BytesIO(dados)) as img:
+        assert img.format == "WEBP"
+        assert img.width == raster_paginas.RASTER_LARGURA_MINIATURA
+
+    pdf_hash = raster_paginas.hash_pdf_memoizado(pdf)
+    caminho = cache_local / pdf_hash / "p1" / f"thumb_{raster_paginas.RASTER_LARGURA_MINIATURA}.webp"
+    assert caminho.read_bytes() == dados
+
+    def _nao_renderizar(*args, **kwargs):
+        raise AssertionError("deveria vir do cache")
+    monkeypatch.setattr(raster_paginas, "_renderizar_miniatura", _nao_renderizar)
+    assert raster_paginas.obter_miniatura(pdf, 1) == dados
+
+
+def test_tile(pdf, cache_local):
+    dpi = raster_paginas.RASTER_DPIS[0]
+    dados = raster_paginas.obter_tile(pdf, 1, dpi, 0, 0)
+    with Image.open(io.BytesIO(dados)) as img:
+        assert img.size == (raster_paginas.RASTER_TAMANHO_TILE, raster_paginas.RASTER_TAMANHO_TILE)
+    colunas, _ = raster_paginas.grade_de_tiles(595, 842, dpi)
+    with pytest.raises(ValueError):
+        raster_paginas.obter_tile(pdf, 1, dpi, colunas, 0)
+    with pytest.raises(ValueError):
+        raster_paginas.obter_tile(pdf, 1, 1, 0, 0)
+
+
+def test_pagina_fora_do_intervalo(pdf, cache_local):
+    with pytest.raises(ValueError):
+        raster_paginas.obter_miniatura(pdf, 3)
+    assert not os.path.isdir(cache_local) or not any(files for _, _, files in os.walk(cache_local))
+
+
+def test_renderizar_recorte(pdf):
+    dados = raster_paginas.renderizar_recorte(pdf, 1, (100, 100, 300, 200), 144)
+    with Image.open(io.BytesIO(dados)) as img:
+        assert img.format == "PNG"
+        assert img.size == (400, 200)
+        assert img.convert("RGB").getpixel((200, 100)) == (255, 0, 0)
+    with pytest.raises(ValueError):
+        raster_paginas.renderizar_recorte(pdf, 1, (700, 900, 800, 1000), 144)
@@ -0,0 +1,129 @@
+import datetime
+
+import pytest
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+import storage
+
+_ANTIGO = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class _Blob:
+    """Blob em memória com a parte da API do google-cloud-storage usada por storage.py."""
+
+    def __init__(self, bucket, name):
+        self.bucket, self.name, self.metadata = bucket, name, None
+        self.generation = self.time_created = None
+
+    def _carregar(self):
+        dados, self.metadata, self.generation, self.time_created = self.bucket.objetos[self.name]
+        self.size = len(dados)
+        return self
+
+    def exists(self):
+        return self.name in self.bucket.objetos
+
+    def upload_from_file(self, f, content_type=None, if_generation_match=None):
+        if if_generation_match == 0 and self.exists():
+            raise PreconditionFailed("já existe")
+        self.bucket.gravar(self.name, f.read(), self.metadata)
+
+    def upload_from_string(self, dados, content_type=None):
+        self.bucket.gravar(self.name, dados, self.metadata)
+
+    def download_as_bytes(self):
+        if not self.exists():
+            raise NotFound(self.name)
+        return self.bucket.objetos[self.name][0]
+
+    def delete(self, if_generation_match=None):
+        if not self.exists():
+            raise NotFound(self.name)
+        if if_generation_match is not None and self.bucket.objetos[self.name][2] != if_generation_match:
+            raise PreconditionFailed(self.name)
+        del self.bucket.objetos[self.name]
+
+
+class _Bucket:
+    def __init__(self):
+        self.objetos = {}  # nome -> (dados, metadados, geração, criação)
+        self._geracao = 0
+
+    def gravar(self, nome, dados, metadata, criado_em=_ANTIGO):
+        self._geracao += 1
+        self.objetos[nome] = (dados, dict(metadata or {}), self._geracao, criado_em)
+
+    def blob(self, nome):
+        return _Blob(self, nome)
+
+    def get_blob(self, nome):
+        return _Blob(self, nome)._carregar() if nome in self.objetos else None
+
+    def list_blobs(self, prefix=""):
+        return [_Blob(self, n)._carregar() for n in list(self.objetos) if n.startswith(prefix)]
+
+
+@pytest.fixture
+def bucket(monkeypatch, tmp_path):
+    falso = _Bucket()
+    monkeypatch.setattr(storage, "_get_bucket", lambda: falso)
+    monkeypatch.setattr(storage, "CAS_ATIVO", True)
+    monkeypatch.setattr(storage, "_hashes_no_cas", {})
+    monkeypatch.setattr(storage, "_referencias", storage.OrderedDict())
+    return falso
+
+
+def _enviar(tmp_path, nome_local, conteudo, prefixo, nome):
+    caminho = tmp_path / nome_local
+    caminho.write_bytes(conteudo)
+    return storage.upload_local_file(prefixo, str(caminho), dest_name=nome)
+
+
+def _no_cas(bucket):
+    return sorted(n for n in bucket.objetos if n.startswith(storage.CAS_PREFIX + '/'))
+
+
+def test_conteudo_igual_gravado_uma_vez(bucket, tmp_path):
+    _enviar(tmp_path, "a", b"mesmo conteudo", "uploads/1", "a.png")
+    _enviar(tmp_path, "b", b"mesmo conteudo", "uploads/2", "b.png")
+    assert len(_no_cas(bucket)) == 1
+    assert bucket.objetos["uploads/1/a.png"][0] == b""
+
+
+def test_coleta_mantem_conteudos_referenciados(bucket, tmp_path):
+    _enviar(tmp_path, "a", b"conteudo a", "uploads/1", "a.png")
+    _enviar(tmp_path, "b", b"conteudo a", "uploads/1", "b.png")
+    storage.delete_blob("uploads/1/a.png")
+    # Ainda há uma referência (b.png) para o mesmo conteúdo
+    assert storage.coletar_cas_orfaos(idade_minima_h=0) == 0
+    assert len(_no_cas(bucket)) == 1
+
+
+def test_coleta_remove_orfaos(bucket, tmp_path):
+    _enviar(tmp_path, "a", b"conteudo a", "uploads/1", "a.png")
+    _enviar(tmp_path, "b", b"conteudo b", "uploads/1", "b.png")
+    storage.delete_blob("uploads/1/a.png")
+    # Regravar b.png com outro conteúdo deixa o antigo órfão também
+    _enviar(tmp_path, "c", b"conteudo c", "uploads/1", "b.png")
+    assert len(_no_cas(bucket)) == 3
+
+    assert storage.coletar_cas_orfaos(idade_minima_h=0, simular=True) == 2
+    assert len(_no_cas(bucket)) == 3
+    assert storage.coletar_cas_orfaos(idade_minima_h=0) == 2
+    sha_c = bucket.objetos["uploads/1/b.png"][1][storage._META_HASH]
+    assert _no_cas(bucket) == [f"{storage.CAS_PREFIX}/{sha_c}"]
+
+
+def test_coleta_respeita_idade_minima(bucket):
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    bucket.gravar(f"{storage.CAS_PREFIX}/recente", b"x", None, criado_em=agora)
+    bucket.gravar(f"{storage.CAS_PREFIX}/antigo", b"y", None)
+    assert storage.coletar_cas_orfaos(idade_minima_h=1) == 1
+    assert _no_cas(bucket) == [f"{storage.CAS_PREFIX}/recente"]
+
+
+def test_blob_antigo_sem_referencia_nao_protege_nem_quebra_a_coleta(bucket):
+    bucket.gravar("uploads/1/antigo.png", b"bytes gravados antes do CAS", None)
+    bucket.gravar(f"{storage.CAS_PREFIX}/orfao", b"z", None)
+    assert storage.coletar_cas_orfaos(idade_minima_h=0) == 1
+    assert "uploads/1/antigo.png" in bucket.objetos
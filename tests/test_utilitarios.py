@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from utilitarios import aplicar_politica_de_expiracao, flag_do_ambiente
+
+
+def _arquivo(caminho, tamanho, mtime):
+    caminho.write_bytes(b"x" * tamanho)
+    os.utime(caminho, (mtime, mtime))
+
+
+@pytest.mark.parametrize("valor, padrao, esperado", [
+    (None, True, True),
+    (None, False, False),
+    ("0", True, False),
+    (" No ", True, False),
+    ("qualquer", True, True),
+    ("yes", False, True),
+    ("TRUE", False, True),
+    ("qualquer", False, False),
+])
+def test_flag_do_ambiente(monkeypatch, valor, padrao, esperado):
+    if valor is None:
+        monkeypatch.delenv("FLAG_DE_TESTE", raising=False)
+    else:
+        monkeypatch.setenv("FLAG_DE_TESTE", valor)
+    assert flag_do_ambiente("FLAG_DE_TESTE", padrao) is esperado
+
+
+def test_remove_as_usadas_ha_mais_tempo_ate_caber(tmp_path):
+    for i, nome in enumerate("abc"):
+        _arquivo(tmp_path / nome, 100, 1000 + i)
+    assert aplicar_politica_de_expiracao(str(tmp_path), 150) == ["a", "b"]
+    assert os.listdir(tmp_path) == ["c"]
+
+
+def test_agrupa_arquivos_da_mesma_entrada(tmp_path):
+    for i, chave in enumerate("ab"):
+        _arquivo(tmp_path / f"{chave}.bin", 100, 1000 + i)
+        _arquivo(tmp_path / f"{chave}.json", 10, 1000 + i)
+    removidas = aplicar_politica_de_expiracao(
+        str(tmp_path), 150, chave_da_entrada=lambda nome: os.path.splitext(nome)[0])
+    assert removidas == ["a"]
+    assert sorted(os.listdir(tmp_path)) == ["b.bin", "b.json"]
+
+
+def test_manter_e_temporarios(tmp_path):
+    _arquivo(tmp_path / "a", 100, 1000)
+    _arquivo(tmp_path / "b", 100, 1001)
+    _arquivo(tmp_path / "c.tmp-1", 1000, 900)
+    assert aplicar_politica_de_expiracao(str(tmp_path), 0, manter="a") == ["b"]
+    assert sorted(os.listdir(tmp_path)) == ["a", "c.tmp-1"]
+
+
+def test_idade_max_remove_mesmo_abaixo_do_limite(tmp_path):
+    _arquivo(tmp_path / "antigo", 10, 1000)
+    (tmp_path / "recente").write_bytes(b"x")
+    assert aplicar_politica_de_expiracao(str(tmp_path), 10 ** 9, idade_max=3600) == ["antigo"]
+    assert os.listdir(tmp_path) == ["recente"]
+
+
+def test_recursivo(tmp_path):
+    (tmp_path / "p1").mkdir()
+    _arquivo(tmp_path / "p1" / "t.webp", 100, 1000)
+    _arquivo(tmp_path / "p1" / "u.webp", 100, 1001)
+    assert aplicar_politica_de_expiracao(str(tmp_path), 100, recursivo=True) == [os.path.join("p1", "t.webp")]
+    assert os.listdir(tmp_path / "p1") == ["u.webp"]
+
+
+def test_diretorio_inexistente(tmp_path):
+    assert aplicar_politica_de_expiracao(str(tmp_path / "nada"), 0) == []
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+from typing import Optional
+
+from websocket_manager import ConnectionManager
+
+# Trabalhos assíncronos de geração do PDF final: o pedido devolve um id na hora, a montagem e
+# a conversão rodam em segundo plano (progresso pelo ConnectionManager) e o PDF pronto fica
+# guardado por RENDER_TRABALHOS_RETENCAO_S para ser baixado quantas vezes for preciso:
+#   <RENDER_TRABALHOS_DIR>/<id>/trabalho.json  (estado, progresso, erro)
+#   <RENDER_TRABALHOS_DIR>/<id>/resumo.txt     (HTML do editor)
+#   <RENDER_TRABALHOS_DIR>/<id>/Resumo_Final_Com_Prints.pdf
+RENDER_TRABALHOS_DIR = os.environ.get("RENDER_TRABALHOS_DIR", os.path.join("temp_uploads", "trabalhos_render"))
+RENDER_TRABALHOS_RETENCAO_S = float(os.environ.get("RENDER_TRABALHOS_RETENCAO_S", "3600"))
+
+ARQUIVO_PDF_TRABALHO = "Resumo_Final_Com_Prints.pdf"
+_ARQUIVO_ESTADO = "trabalho.json"
+
+_trabalhos = {}
+_lock_trabalhos = threading.Lock()
+
+
+def _pasta_trabalho(trabalho_id: str) -> str:
+    return os.path.join(RENDER_TRABALHOS_DIR, trabalho_id)
+
+
+def caminho_pdf_trabalho(trabalho_id: str) -> str:
+    return os.path.join(_pasta_trabalho(trabalho_id), ARQUIVO_PDF_TRABALHO)
+
+
+def _salvar_estado(trabalho: dict) -> None:
+    caminho = os.path.join(_pasta_trabalho(trabalho["id"]), _ARQUIVO_ESTADO)
+    try:
+        with open(caminho + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(trabalho, f, ensure_ascii=False)
+        os.replace(caminho + ".tmp", caminho)
+    except Exception as e:
+        print(f"[RENDER_JOB] Falha ao gravar estado do trabalho {trabalho['id']}: {e}")
+
+
+def _atualizar(trabalho: dict, **campos) -> None:
+    with _lock_trabalhos:
+        trabalho.update(campos, atualizado_em=time.time())
+        copia = dict(trabalho)
+    _salvar_estado(copia)
+
+
+def remover_expirados() -> int:
+    """Apaga os trabalhos concluídos (ou com erro) há mais de RENDER_TRABALHOS_RETENCAO_S."""
+    if not os.path.isdir(RENDER_TRABALHOS_DIR):
+        return 0
+    limite = time.time() - RENDER_TRABALHOS_RETENCAO_S
+    removidos = 0
+    for trabalho_id in os.listdir(RENDER_TRABALHOS_DIR):
+        trabalho = obter_trabalho(trabalho_id, verificar_expiracao=False)
+        if not trabalho or trabalho["estado"] not in ("concluido", "erro"):
+            continue
+        if (trabalho.get("concluido_em") or 0) < limite:
+            with _lock_trabalhos:
+                _trabalhos.pop(trabalho_id, None)
+            shutil.rmtree(_pasta_trabalho(trabalho_id), ignore_errors=True)
+            removidos += 1
+    if removidos:
+        print(f"[RENDER_JOB] {removidos} trabalhos expirados removidos")
+    return removidos
+
+
+def criar_trabalho(resumo_html: str, pdf_pronto: Optional[str] = None, chave_cache: Optional[str] = None) -> dict:
+    """
+    Registra um trabalho na fila. Com pdf_pronto (acerto no cache de PDFs) o trabalho já nasce
+    concluído, com o PDF vinculado à sua pasta; chave_cache é onde guardar o PDF renderizado.
+    """
+    trabalho_id = uuid.uuid4().hex
+    os.makedirs(_pasta_trabalho(trabalho_id), exist_ok=True)
+    agora = time.time()
+    trabalho = {"id": trabalho_id, "estado": "na_fila", "progresso": 0, "mensagem": "Na fila",
+                "erro": None, "criado_em": agora, "atualizado_em": agora, "concluido_em": None,
+                "chave_cache": chave_cache}
+    if pdf_pronto:
+        try:
+            os.link(pdf_pronto, caminho_pdf_trabalho(trabalho_id))
+        except OSError:
+            shutil.copyfile(pdf_pronto, caminho_pdf_trabalho(trabalho_id))
+        trabalho.update(estado="concluido", progresso=100, mensagem="PDF pronto (cache).", concluido_em=agora)
+    else:
+        with open(os.path.join(_pasta_trabalho(trabalho_id), "resumo.txt"), 'w', encoding='utf-8') as f:
+            f.write(resumo_html)
+    with _lock_trabalhos:
+        _trabalhos[trabalho_id] = trabalho
+    _salvar_estado(trabalho)
+    return dict(trabalho)
+
+
+def obter_trabalho(trabalho_id: str, verificar_expiracao: bool = True) -> Optional[dict]:
+    """Estado do trabalho (da memória ou do trabalho.json, após um reinício); None se não existir ou expirou."""
+    if not trabalho_id.isalnum():
+        return None
+    with _lock_trabalhos:
+        trabalho = _trabalhos.get(trabalho_id)
+        trabalho = dict(trabalho) if trabalho else None
+    if trabalho is None:
+        try:
+            with open(os.path.join(_pasta_trabalho(trabalho_id), _ARQUIVO_ESTADO), 'r', encoding='utf-8') as f:
+                trabalho = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if trabalho.get("estado") not in ("concluido", "erro"):
+            # Trabalho de outro processo (ou de antes de um reinício) que não terminou
+            trabalho.update(estado="erro", progresso=-1, mensagem="Geração interrompida.",
+                            erro="Interrompido", concluido_em=trabalho.get("atualizado_em"))
+    if verificar_expiracao and trabalho.get("concluido_em") and trabalho["concluido_em"] < time.time() - RENDER_TRABALHOS_RETENCAO_S:
+        return None
+    return trabalho
+
+
+async def executar_trabalho(trabalho_id: str, upload_dir: str, manager: ConnectionManager) -> None:
+    """Monta o HTML e converte o PDF do trabalho, publicando o progresso no ConnectionManager."""
+    from gerador_pdf_final import executar_fase_final
+    from pool_renderizacao import renderizar_pdf
+
+    with _lock_trabalhos:
+        trabalho = _trabalhos[trabalho_id]
+    loop = asyncio.get_running_loop()
+
+    async def _progresso(progresso: int, mensagem: str, **campos) -> None:
+        _atualizar(trabalho, progresso=progresso, mensagem=mensagem, **campos)
+        try:
+            await manager.send_message(json.dumps({"job_id": trabalho_id, "type": "render_pdf", "state": trabalho["estado"],
+                                                   "progress": progresso, "status": mensagem}, ensure_ascii=False))
+        except Exception as e:
+            print(f"[RENDER_JOB] Falha ao enviar progresso do trabalho {trabalho_id}: {e}")
+
+    def _converter(caminho_html: str, caminho_pdf: str) -> bool:
+        # Chamado na thread da fase final, entre a montagem do HTML e a conversão
+        asyncio.run_coroutine_threadsafe(_progresso(30, "Convertendo para PDF..."), loop).result()
+        return renderizar_pdf(caminho_html, caminho_pdf)
+
+    # O HTML precisa ficar na pasta que contém imagens_extraidas (caminhos relativos das imagens)
+    caminho_html = os.path.join(upload_dir, f"relatorio_{trabalho_id}.html")
+    await _progresso(10, "Montando o HTML do resumo...", estado="renderizando")
+    try:
+        sucesso = await asyncio.to_thread(
+            executar_fase_final,
+            os.path.join(_pasta_trabalho(trabalho_id), "resumo.txt"),
+            caminho_pdf_trabalho(trabalho_id),
+            "imagens_extraidas",
+            _converter,
+            caminho_html,
+        )
+        if sucesso and os.path.exists(caminho_pdf_trabalho(trabalho_id)):
+            if trabalho.get("chave_cache"):
+                from cache_renderizacao import salvar_pdf_em_cache
+                await asyncio.to_thread(salvar_pdf_em_cache, trabalho["chave_cache"], caminho_pdf_trabalho(trabalho_id))
+            await _progresso(100, "PDF pronto.", estado="concluido", concluido_em=time.time())
+        else:
+            await _progresso(-1, "Erro ao gerar PDF final.", estado="erro", erro="Falha na montagem ou conversão", concluido_em=time.time())
+    except TimeoutError as e:
+        await _progresso(-1, "Tempo esgotado ao gerar o PDF final.", estado="erro", erro=str(e), concluido_em=time.time())
+    except Exception as e:
+        print(f"[RENDER_JOB] Erro no trabalho {trabalho_id}: {e}")
+        await _progresso(-1, "Erro ao gerar PDF final.", estado="erro", erro=str(e), concluido_em=time.time())
+    finally:
+        try:
+            os.remove(caminho_html)
+        except OSError:
+            pass
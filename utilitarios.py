@@ -0,0 +1,110 @@
+import os
+import time
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Utilitários compartilhados pelos caches locais (raster, extração, renderização, folhas de
+# miniaturas, imagens externas e reamostradas) e pela leitura das flags de ambiente.
+
+_locks_por_diretorio: Dict[str, threading.Lock] = {}
+_lock_locks = threading.Lock()
+
+
+def flag_do_ambiente(nome: str, padrao: bool) -> bool:
+    """
+    Flag booleana do ambiente. Ligada por padrão, só "0", "false" e "no" a desligam;
+    desligada por padrão, só "1", "true" e "yes" a ligam.
+    """
+    valor = os.environ.get(nome, "1" if padrao else "0").strip().lower()
+    if padrao:
+        return valor not in ("0", "false", "no")
+    return valor in ("1", "true", "yes")
+
+
+def _chave_padrao(nome: str) -> Optional[str]:
+    # Arquivos temporários (gravação atômica em andamento) não são entradas
+    return None if '.tmp-' in nome else nome
+
+
+def _tamanho(caminho: str) -> int:
+    if not os.path.isdir(caminho):
+        return os.path.getsize(caminho)
+    total = 0
+    for raiz, _, arquivos in os.walk(caminho):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+def _remover(caminho: str) -> None:
+    if os.path.isdir(caminho):
+        shutil.rmtree(caminho, ignore_errors=True)
+        return
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+def aplicar_politica_de_expiracao(
+    diretorio: str,
+    limite_bytes: float,
+    idade_max: Optional[float] = None,
+    manter: Optional[str] = None,
+    chave_da_entrada: Callable[[str], Optional[str]] = _chave_padrao,
+    recursivo: bool = False,
+) -> List[str]:
+    """
+    Expiração de um cache local por último acesso (mtime). Cada nome em `diretorio` (arquivo ou
+    pasta) pertence à entrada chave_da_entrada(nome), ou a nenhuma se None; os arquivos da mesma
+    entrada (ex.: <chave>.bin e <chave>.json) são removidos juntos, os .json primeiro (sem os
+    metadados a entrada já não é usada). Com recursivo=True, cada arquivo da árvore é uma entrada
+    (chave = caminho relativo). Remove as entradas sem acesso há mais de idade_max segundos e,
+    acima de limite_bytes, as usadas há mais tempo (LRU), nunca a chave `manter`.
+    Retorna as chaves removidas.
+    """
+    if not os.path.isdir(diretorio):
+        return []
+    with _lock_locks:
+        lock = _locks_por_diretorio.setdefault(os.path.realpath(diretorio), threading.Lock())
+    with lock:
+        nomes = []
+        if recursivo:
+            for raiz, _, arquivos in os.walk(diretorio):
+                nomes.extend(os.path.relpath(os.path.join(raiz, nome), diretorio) for nome in arquivos)
+        else:
+            nomes = os.listdir(diretorio)
+
+        grupos: Dict[str, List[str]] = {}
+        for nome in nomes:
+            chave = chave_da_entrada(nome)
+            if chave is None or chave == manter:
+                continue
+            grupos.setdefault(chave, []).append(os.path.join(diretorio, nome))
+
+        entradas = []
+        for chave, caminhos in grupos.items():
+            try:
+                ultimo_acesso = max(os.path.getmtime(c) for c in caminhos)
+                tamanho = sum(_tamanho(c) for c in caminhos)
+            except OSError:
+                continue
+            caminhos.sort(key=lambda c: not c.endswith('.json'))
+            entradas.append((ultimo_acesso, chave, caminhos, tamanho))
+
+        removidas = []
+        vencimento = time.time() - idade_max if idade_max is not None else None
+        total = sum(tamanho for _, _, _, tamanho in entradas)
+        for ultimo_acesso, chave, caminhos, tamanho in sorted(entradas):
+            vencida = vencimento is not None and ultimo_acesso < vencimento
+            if not vencida and total <= limite_bytes:
+                break
+            for caminho in caminhos:
+                _remover(caminho)
+            total -= tamanho
+            removidas.append(chave)
+    return removidas